@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,13 +50,23 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'catalog.replicas.ReplicaStickinessMiddleware',
 ]
 
-ROOT_URLCONF = 'bib.urls'
+# bib.asgi sets CATALOG_ASYNC_VIEWS, so that the ASGI deployment serves the
+# catalog browsing views with the async ORM (see catalog.async_views)
+CATALOG_ASYNC_VIEWS = os.environ.get('CATALOG_ASYNC_VIEWS') == '1'
+
+# Per-view latency, query and template metrics, served at catalog/metrics/
+# to staff users (see catalog.metrics)
+CATALOG_METRICS_ENABLED = True
+
+ROOT_URLCONF = 'bib.urls_async' if CATALOG_ASYNC_VIEWS else 'bib.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing template rendering for catalog.metrics
+        'BACKEND': 'catalog.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -75,13 +86,110 @@ WSGI_APPLICATION = 'bib.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# SQLite connection profiles, chosen with CATALOG_SQLITE_PROFILE; the extra
+# OPTIONS are described in catalog.backends.sqlite3. 'production' lets
+# readers work while a copy is being borrowed (WAL), makes writers queue for
+# the write lock (BEGIN IMMEDIATE and a busy timeout) instead of failing with
+# "database is locked", and keeps connections open across requests.
+# Compare them with manage.py bench_sqlite.
+#
+# Persistent connections only apply to the WSGI deployment: under ASGI,
+# Django 5.0 runs each request's sync code in a new thread-sensitive
+# executor, so connections would pile up instead of being reused, and
+# CONN_MAX_AGE is forced to 0.
+
+SQLITE_PROFILES = {
+    'default': {
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {},
+    },
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'wal',
+                # Durable at every checkpoint, and never corrupt, with WAL
+                'synchronous': 'normal',
+                'busy_timeout': 5000,
+                'mmap_size': 128 * 1024 * 1024,
+                # Negative: in KiB
+                'cache_size': -20000,
+                'temp_store': 'memory',
+            },
+        },
+    },
+}
+
+SQLITE_PROFILE = SQLITE_PROFILES[os.environ.get('CATALOG_SQLITE_PROFILE', 'default')]
+if CATALOG_ASYNC_VIEWS:
+    SQLITE_PROFILE = {**SQLITE_PROFILE, 'CONN_MAX_AGE': 0}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'catalog.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **SQLITE_PROFILE,
     }
 }
 
+# Read replicas of the catalog browsing views (see catalog.replicas). Set
+# CATALOG_REPLICA_DB to the path of a copy of the database, kept up to date
+# with manage.py sync_replica, to try them locally (not when running the
+# tests, which only allow queries to 'default').
+if os.environ.get('CATALOG_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'catalog.backends.sqlite3',
+        'NAME': os.environ['CATALOG_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+        **SQLITE_PROFILE,
+    }
+
+CATALOG_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['catalog.replicas.ReplicaRouter']
+
+# Seconds a client that wrote keeps reading from the primary
+CATALOG_PRIMARY_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The catalog counters (catalog.counters) are kept here. Use a shared backend,
+# such as Redis or Memcached, when running more than one worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Used by the {% cache %} tags of pages read from a replica, which must
+    # neither serve nor store fragments (see catalog.fragments)
+    'uncached': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.0/topics/http/sessions/
+# Chosen with CATALOG_SESSION_ENGINE: 'db', 'cache', 'cached_db',
+# 'signed_cookies' or 'coalescing' (catalog.sessions, cached_db writing each
+# session to the database at most every CATALOG_SESSION_WRITE_INTERVAL
+# seconds). Anonymous visitors get no session, whatever the engine.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'coalescing': 'catalog.sessions',
+}
+
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('CATALOG_SESSION_ENGINE', 'db')]
+
+CATALOG_SESSION_WRITE_INTERVAL = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -129,6 +237,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Redirect to home URL after login (Default redirects to /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
 
+# Pagination of the catalog list views: 'offset', 'cursor' or 'cursor-nocount'
+# (see catalog.pagination)
+CATALOG_PAGINATION_MODE = 'offset'
+
+# Seconds a large filtered total shown by the paginated views is cached
+# (see catalog.pagination.EstimatedCountPaginator)
+CATALOG_COUNT_CACHE_TIMEOUT = 300
+
+# Days a patron has to pick up a copy set aside for their hold
+CATALOG_HOLD_PICKUP_DAYS = 3
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # Settings Selenium
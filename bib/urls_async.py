@@ -0,0 +1,14 @@
+"""
+URL configuration of the ASGI deployment (see bib.asgi).
+
+Same as bib.urls, except that the catalog browsing views are served by
+their async versions in catalog.async_views.
+"""
+from django.urls import include, path
+
+from bib.urls import urlpatterns as sync_urlpatterns
+from catalog.urls import async_urlpatterns
+
+urlpatterns = [
+    path('catalog/', include(async_urlpatterns)),
+] + sync_urlpatterns
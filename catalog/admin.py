@@ -1,21 +1,71 @@
+import datetime
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Author, Genre, Book, BookInstance, Language, User
+from .models import Author, Genre, Book, BookInstance, Hold, Language, OverdueNotice, User
+from .pagination import EstimatedCountPaginator
 
 admin.site.register(User, UserAdmin)
 
+
+class CatalogAdmin(admin.ModelAdmin):
+    """
+    Changelists for large tables: no exact COUNT(*) of the whole table, and
+    foreign keys picked by id instead of a select listing every row.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class DueBackFilter(admin.SimpleListFilter):
+    # Loans only, so that the (status, due_back) index is used
+    title = 'prazo de devolução'
+    parameter_name = 'due'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('overdue', 'Atrasados'),
+            ('week', 'Vencem em 7 dias'),
+            ('later', 'Vencem depois'),
+        )
+
+    def queryset(self, request, queryset):
+        today = datetime.date.today()
+        if self.value() == 'overdue':
+            return queryset.filter(status='o', due_back__lt=today)
+        if self.value() == 'week':
+            return queryset.filter(status='o', due_back__gte=today, due_back__lte=today + datetime.timedelta(days=7))
+        if self.value() == 'later':
+            return queryset.filter(status='o', due_back__gt=today + datetime.timedelta(days=7))
+        return queryset
+
+
 @admin.register(Author)
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(CatalogAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
+    # author_name_idx
+    ordering = ('last_name', 'first_name', 'id')
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(CatalogAdmin):
     list_display = ('title', 'author', 'display_genre')
+    list_select_related = ('author',)
+    raw_id_fields = ('author',)
+    # book_title_idx
+    ordering = ('title', 'id')
+
+    def get_queryset(self, request):
+        # display_genre() reads the prefetched genres
+        return super().get_queryset(request).prefetch_related('genre')
 
 @admin.register(BookInstance)
-class BookInstanceAdmin(admin.ModelAdmin):
+class BookInstanceAdmin(CatalogAdmin):
     list_display = ('book', 'status', 'borrower', 'due_back', 'id')
-    list_filter = ('status', 'due_back')
+    list_filter = ('status', DueBackFilter)
+    list_select_related = ('book', 'borrower')
+    raw_id_fields = ('book', 'borrower')
+    # bookinstance_due_idx
+    ordering = ('due_back', 'id')
 
     fieldsets = (
         (None, {
@@ -26,5 +76,19 @@ class BookInstanceAdmin(admin.ModelAdmin):
         }),
     )
 
+@admin.register(Hold)
+class HoldAdmin(CatalogAdmin):
+    list_display = ('book', 'patron', 'status', 'created_at', 'pickup_by')
+    list_filter = ('status',)
+    list_select_related = ('book', 'patron')
+    raw_id_fields = ('book', 'patron', 'bookinstance')
+
+@admin.register(OverdueNotice)
+class OverdueNoticeAdmin(CatalogAdmin):
+    list_display = ('bookinstance', 'borrower', 'due_back', 'sent_at')
+    list_filter = ('sent_at',)
+    list_select_related = ('bookinstance__book', 'borrower')
+    raw_id_fields = ('bookinstance', 'borrower')
+
 admin.site.register(Genre)
 admin.site.register(Language)
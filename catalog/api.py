@@ -0,0 +1,221 @@
+"""
+Read-only JSON API (v1) over books, authors, copies, genres and languages.
+
+Rows are read with ``values()`` and serialized from those dicts, without
+building model instances, in a fixed number of queries per request: one for
+the rows, plus one per many-to-many field requested (a book's genres).
+
+* ``?fields=id,title`` - sparse fieldsets; unknown fields are a 400.
+* ``?limit=`` and ``?cursor=`` - keyset pagination (catalog.pagination),
+  without a total count; ``next``/``previous`` are ready-made links.
+
+Every response carries a strong ``ETag``, the hash of its body, so clients
+can revalidate with ``If-None-Match`` and get a 304. Single objects also
+carry ``Last-Modified`` (their ``updated_at``). Lists do not: a row leaving
+the page does not move the newest ``updated_at`` of the page.
+"""
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, urlencode
+from django.views.decorators.http import require_safe
+
+from catalog import replicas
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.pagination import CursorPaginator, InvalidCursor
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class BadRequest(Exception):
+    pass
+
+
+class Resource:
+    """
+    How a model is exposed: its fields (names accepted by values()), its
+    many-to-many fields, as (through model, source column, target column),
+    the list ordering, which must end with a unique field, and the filters
+    accepted as query parameters.
+    """
+    def __init__(self, model, fields, ordering, many=None, filters=None):
+        self.model = model
+        self.fields = fields
+        self.many = many or {}
+        self.ordering = ordering
+        self.filters = filters or {}
+        self.all_fields = (*fields, *self.many)
+        self.timestamped = 'updated_at' in fields
+
+    def requested_fields(self, request):
+        value = request.GET.get('fields')
+        if not value:
+            return self.all_fields
+
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in self.all_fields]
+        if unknown:
+            raise BadRequest(f'Campos desconhecidos: {", ".join(unknown)}')
+        return fields
+
+    def queryset(self, fields, *extra):
+        columns = [name for name in fields if name not in self.many]
+        return self.model._default_manager.order_by().values(*dict.fromkeys([*columns, 'pk', *extra]))
+
+    def filter(self, queryset, request):
+        for parameter, lookup in self.filters.items():
+            value = request.GET.get(parameter)
+            if value is None:
+                continue
+            try:
+                queryset = lookup(queryset, value)
+            except (ValueError, ValidationError):
+                raise BadRequest(f'Valor inválido para {parameter}: {value}')
+        return queryset
+
+    def serialize(self, rows, fields):
+        related = {}
+        for name, (through, source, target) in self.many.items():
+            if name not in fields:
+                continue
+            values = related[name] = {row['pk']: [] for row in rows}
+            pairs = (
+                through.objects.filter(**{f'{source}__in': values})
+                .order_by(source, target).values_list(source, target)
+            )
+            for pk, value in pairs:
+                values[pk].append(value)
+
+        return [
+            {name: related[name][row['pk']] if name in related else row[name] for name in fields}
+            for row in rows
+        ]
+
+
+def _available(queryset, value):
+    return queryset.filter(available_copies__gt=0) if value == '1' else queryset
+
+
+RESOURCES = {
+    'books': Resource(
+        Book,
+        fields=('id', 'title', 'isbn', 'summary', 'author', 'total_copies', 'available_copies', 'updated_at'),
+        many={'genres': (Book.genre.through, 'book_id', 'genre_id')},
+        ordering=['title', 'id'],
+        filters={
+            'author': lambda queryset, value: queryset.filter(author=value),
+            'genre': lambda queryset, value: queryset.filter(genre=value),
+            'available': _available,
+        },
+    ),
+    'authors': Resource(
+        Author,
+        fields=('id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death', 'updated_at'),
+        ordering=['last_name', 'first_name', 'id'],
+    ),
+    # The borrower is left out on purpose
+    'copies': Resource(
+        BookInstance,
+        fields=('id', 'book', 'imprint', 'status', 'due_back', 'language', 'updated_at'),
+        ordering=['book', 'due_back', 'id'],
+        filters={
+            'book': lambda queryset, value: queryset.filter(book=value),
+            'status': lambda queryset, value: queryset.filter(status=value),
+        },
+    ),
+    'genres': Resource(Genre, fields=('id', 'name'), ordering=['name']),
+    'languages': Resource(Language, fields=('id', 'name'), ordering=['name']),
+}
+
+
+def json_response(request, data, last_modified=None):
+    """A JSON response with a strong ETag, or a 304 if the client has it."""
+    body = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    etag = f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response.headers['ETag'] = etag
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    # Cached copies must be revalidated, which is cheap thanks to the ETag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def error_response(message, status=400):
+    return JsonResponse({'detail': message}, status=status)
+
+
+def _limit(request):
+    value = request.GET.get('limit')
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f'limit deve estar entre 1 e {MAX_LIMIT}')
+    return limit
+
+
+def _page_link(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{urlencode(sorted(params.items()))}'
+
+
+@require_safe
+@replicas.read_from_replica
+def resource_list(request, resource):
+    resource = RESOURCES[resource]
+    try:
+        fields = resource.requested_fields(request)
+        queryset = resource.filter(resource.queryset(fields, *resource.ordering), request)
+        paginator = CursorPaginator(queryset, _limit(request), resource.ordering, count_total=False)
+        page = paginator.page(request.GET.get('cursor'))
+    except (BadRequest, InvalidCursor) as e:
+        return error_response(str(e))
+
+    return json_response(request, {
+        'results': resource.serialize(page.object_list, fields),
+        'next': _page_link(request, page.next_cursor),
+        'previous': _page_link(request, page.previous_cursor),
+    })
+
+
+@require_safe
+@replicas.read_from_replica
+def resource_detail(request, resource, pk):
+    resource = RESOURCES[resource]
+    try:
+        fields = resource.requested_fields(request)
+    except BadRequest as e:
+        return error_response(str(e))
+
+    extra = ['updated_at'] if resource.timestamped else []
+    rows = list(resource.queryset(fields, *extra).filter(pk=pk)[:1])
+    if not rows:
+        return error_response('Não encontrado.', status=404)
+
+    row = rows[0]
+    return json_response(
+        request, resource.serialize(rows, fields)[0],
+        last_modified=row['updated_at'] if resource.timestamped else None,
+    )
+
+
+@require_safe
+def api_root(request):
+    return JsonResponse({name: request.build_absolute_uri(reverse(f'api-{name}')) for name in RESOURCES})
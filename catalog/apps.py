@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
+
+    def ready(self):
+        from catalog import circulation, metrics, signals  # noqa: F401
+        from catalog.search import install_search_index
+
+        post_migrate.connect(install_search_index, sender=self)
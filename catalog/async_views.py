@@ -0,0 +1,127 @@
+"""
+Async versions of the catalog browsing views, served by the ASGI deployment
+(see bib.asgi and bib.urls_async).
+
+Every query runs through the async ORM before rendering, so templates only
+see materialized rows, except for the contents of cached fragments (see
+catalog.fragments): those are queried while rendering, on a cache miss only.
+They render the same templates, with the same permission rules, as the views
+in catalog.views.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.shortcuts import aget_object_or_404, render
+
+from catalog import conditional, counters, export, fragments, replicas
+from catalog.models import Author
+from catalog.pagination import apaginate
+from catalog.views import (
+    AuthorDetailView, AuthorListView, BookDetailView, BookListView, author_books_page,
+    author_detail_validators, author_list_validators, book_copies, book_detail_validators,
+    book_fragment_objects, book_list_validators, export_options, export_response, get_visits, hold_context,
+    lazy_copy_groups, set_visits, with_book_counts,
+)
+
+arender = sync_to_async(render)
+
+
+@replicas.read_from_replica
+async def index(request):
+    num_visits = get_visits(request)
+    context = {
+        **await counters.aget_counts(),
+        'num_visits': num_visits,
+    }
+    response = await arender(request, 'index.html', context)
+    set_visits(response, num_visits + 1)
+    return response
+
+
+async def _list_context(request, queryset, view, name):
+    paginator, page, is_paginated = await apaginate(
+        queryset, request, view.paginate_by, view.get_ordering())
+    return {
+        name: page.object_list,
+        'object_list': page.object_list,
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': is_paginated,
+    }
+
+
+@replicas.read_from_replica
+@conditional.conditional_page(book_list_validators)
+async def book_list(request):
+    view = BookListView(request=request, kwargs={})
+    context = await _list_context(request, view.get_queryset(), view, 'book_list')
+    context.update(view.get_options_context())
+    return await arender(request, 'catalog/book_list.html', context)
+
+
+@replicas.read_from_replica
+@conditional.conditional_page(book_detail_validators)
+async def book_detail(request, pk):
+    book = await aget_object_or_404(BookDetailView().get_queryset(), pk=pk)
+
+    copies = book_copies(book)
+    paginator = Paginator(copies, BookDetailView.copies_paginate_by)
+    paginator.count = await copies.acount()
+    page = paginator.get_page(request.GET.get('page'))
+
+    user = await request.auser()
+    context = {
+        'object': book,
+        'book': book,
+        'copies': page.object_list,
+        'copy_groups': lazy_copy_groups(copies),
+        'has_copies': paginator.count > 0,
+        'user_can_borrow': user.is_authenticated and user.can_borrow_book,
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        **await fragments.afragment_context(*book_fragment_objects(book)),
+        **await sync_to_async(hold_context)(book, user),
+    }
+    return await arender(request, 'catalog/book_detail.html', context)
+
+
+@replicas.read_from_replica
+@conditional.conditional_page(author_list_validators)
+async def author_list(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    context = await _list_context(request, with_book_counts(Author.objects.all()), AuthorListView(), 'author_list')
+    return await arender(request, 'catalog/author_list.html', context)
+
+
+@replicas.read_from_replica
+@conditional.conditional_page(author_detail_validators)
+async def author_detail(request, pk):
+    author = await aget_object_or_404(AuthorDetailView().get_queryset(), pk=pk)
+    page = author_books_page(author, request.GET.get('page'))
+    context = {
+        'object': author,
+        'author': author,
+        'books': page.object_list,
+        'page_obj': page,
+        'paginator': page.paginator,
+        'is_paginated': page.has_other_pages(),
+        **await fragments.afragment_context(('author', author.pk)),
+    }
+    return await arender(request, 'catalog/author_detail.html', context)
+
+
+async def export_catalog(request, kind):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if not await sync_to_async(user.has_perm)('catalog.can_mark_returned'):
+        raise PermissionDenied
+
+    file_format, filters = export_options(request, kind)
+    # An async iterator, which the ASGI handler streams instead of buffering
+    return export_response(export.aexport_lines(kind, file_format, filters), kind, file_format)
@@ -0,0 +1,49 @@
+"""
+SQLite backend taking connection settings Django's own backend lacks.
+
+Two extra ``OPTIONS`` (see SQLITE_PROFILES in the settings):
+
+* ``pragmas`` - a dict of PRAGMAs run on every new connection, e.g.
+  ``{'journal_mode': 'wal', 'busy_timeout': 5000}``.
+* ``transaction_mode`` - ``'DEFERRED'`` (SQLite's default), ``'IMMEDIATE'``
+  or ``'EXCLUSIVE'``, how ``transaction.atomic()`` begins transactions. With
+  ``IMMEDIATE`` a transaction takes the write lock when it begins, waiting
+  up to ``busy_timeout`` for it, instead of failing with "database is
+  locked" when it first writes after reading.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+EXTRA_OPTIONS = ('pragmas', 'transaction_mode')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def pragmas(self):
+        return self.settings_dict['OPTIONS'].get('pragmas', {})
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}, not {mode!r}.")
+        return mode and mode.upper()
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for option in EXTRA_OPTIONS:
+            params.pop(option, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.transaction_mode
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -0,0 +1,124 @@
+"""Timing helpers shared by the ``bench_*`` management commands."""
+import asyncio
+import itertools
+import math
+import random
+import threading
+import time
+
+from django.db import connection
+from django.test import AsyncClient, Client
+
+SYLLABLES = 'ba be bi bo ca ce da de di do fa fe ga go la le li lo ma me mi mo na ne no pa pe ra re ri ro sa se so ta te ti to va ve'.split()
+
+# A few thousand pseudo-words, so that terms are about as selective as in real text
+WORDS = sorted({''.join(random.Random(i).choices(SYLLABLES, k=3)) for i in range(20000)})
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Latency summary, in milliseconds, of a list of durations in seconds."""
+    return {
+        'count': len(samples),
+        'mean': 1000 * sum(samples) / len(samples) if samples else 0.0,
+        'p50': 1000 * percentile(samples, 50),
+        'p95': 1000 * percentile(samples, 95),
+        'p99': 1000 * percentile(samples, 99),
+    }
+
+
+def measure(func, repeat):
+    """Calls ``func`` ``repeat`` times and returns each call's duration in seconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def format_summary(label, summary):
+    return (
+        f"{label}: n={summary['count']} mean={summary['mean']:.2f}ms "
+        f"p50={summary['p50']:.2f}ms p95={summary['p95']:.2f}ms p99={summary['p99']:.2f}ms"
+    )
+
+
+def run_sync_load(urls, requests, concurrency, user=None):
+    """
+    Sends ``requests`` GETs, cycling through ``urls``, from ``concurrency``
+    threads through the WSGI handler. Returns (latencies, elapsed seconds).
+    """
+    targets = itertools.cycle(urls)
+    lock = threading.Lock()
+    samples = []
+    remaining = [requests]
+
+    def worker():
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        try:
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                    url = next(targets)
+                start = time.perf_counter()
+                client.get(url)
+                duration = time.perf_counter() - start
+                with lock:
+                    samples.append(duration)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def run_async_load(urls, requests, concurrency, user=None):
+    """Same as run_sync_load, with ``concurrency`` tasks through the ASGI handler."""
+    targets = itertools.cycle(urls)
+
+    async def main():
+        samples = []
+        remaining = [requests]
+
+        async def worker():
+            client = AsyncClient()
+            if user is not None:
+                await client.aforce_login(user)
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                start = time.perf_counter()
+                await client.get(next(targets))
+                samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return samples, time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def format_load(label, samples, elapsed):
+    summary = summarize(samples)
+    return (
+        f"{label}: {summary['count']} requisições em {elapsed:.2f}s "
+        f"({summary['count'] / elapsed:.1f} req/s), p50={summary['p50']:.1f}ms "
+        f"p99={summary['p99']:.1f}ms"
+    )
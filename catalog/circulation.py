@@ -0,0 +1,323 @@
+"""
+Borrow, return and renew operations on a BookInstance, and the hold queue.
+
+Each operation is a single conditional ``UPDATE`` that only succeeds if the
+copy is still in the state it was read in, and that only writes the columns
+it changes. Losing a race against another request raises CirculationConflict
+instead of silently overwriting the other request's change.
+
+When every copy of a book is out, patrons can place a hold. A returned copy
+goes to the first waiting hold of its book, in the same transaction: it is
+set aside (status ``'r'``) until the hold's pickup date, and only the holder
+can borrow it.
+
+batch() applies one of these operations to a whole cart of copies at the
+circulation desk, checking them with a few queries over the whole set and
+writing them with bulk_update().
+"""
+import datetime
+import uuid
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from catalog.models import Book, BookInstance, Hold, User
+from catalog.signals import copies_changed, copy_state
+
+
+class CirculationConflict(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def _current_state(instance, allowed_statuses, message):
+    state = instance._loaded_state or copy_state(instance)
+    if state.status not in allowed_statuses:
+        raise CirculationConflict(message)
+    return state
+
+
+def _transition(instance, allowed_statuses, message, **changes):
+    old = _current_state(instance, allowed_statuses, message)
+    # update() skips auto_now fields
+    changes['updated_at'] = timezone.now()
+
+    with transaction.atomic():
+        updated = BookInstance.objects.filter(
+            pk=instance.pk,
+            status=old.status,
+            borrower=old.borrower_id,
+            due_back=old.due_back,
+        ).update(**changes)
+
+        if not updated:
+            raise CirculationConflict(message)
+
+        for name, value in changes.items():
+            setattr(instance, name, value)
+        new = copy_state(instance)
+        instance._loaded_state = new
+
+        copies_changed.send(sender=BookInstance, changes=[(old, new)], instances=[instance])
+
+    return instance
+
+
+def pickup_deadline():
+    return datetime.date.today() + datetime.timedelta(days=getattr(settings, 'CATALOG_HOLD_PICKUP_DAYS', 3))
+
+
+def _claim_next_hold(instance):
+    """Sets the copy aside for the first waiting hold of its book, if any."""
+    while True:
+        # Served by hold_queue_idx, however long the queue is
+        hold = Hold.objects.filter(book_id=instance.book_id, status='w').order_by('created_at', 'id').first()
+        if hold is None:
+            return None
+
+        pickup_by = pickup_deadline()
+        claimed = Hold.objects.filter(pk=hold.pk, status='w').update(
+            status='r', bookinstance=instance, pickup_by=pickup_by,
+        )
+        if claimed:
+            hold.status, hold.bookinstance, hold.pickup_by = 'r', instance, pickup_by
+            return hold
+
+
+def borrow(instance, user, due_back):
+    message = _('Esta cópia está indisponível')
+    state = _current_state(instance, ('a', 'r'), message)
+
+    with transaction.atomic():
+        if state.status == 'r' and not Hold.objects.filter(
+            bookinstance=instance, patron=user, status='r',
+        ).exists():
+            raise CirculationConflict(_('Esta cópia está reservada para outro usuário'))
+
+        _transition(
+            instance, ('a', 'r'), message,
+            status='o', borrower=user, due_back=due_back,
+        )
+        # The borrower no longer needs a hold on this book
+        Hold.objects.filter(book_id=state.book_id, patron=user).delete()
+
+    return instance
+
+
+def return_copy(instance):
+    message = _('Esta cópia não pode ser devolvida. Ela não está emprestada.')
+    _current_state(instance, ('o',), message)
+
+    with transaction.atomic():
+        hold = _claim_next_hold(instance)
+        return _transition(
+            instance, ('o',), message,
+            status='r' if hold else 'a', borrower=None, due_back=None,
+        )
+
+
+def renew(instance, due_back):
+    return _transition(
+        instance, ('o',), _('Esta cópia não está emprestada.'),
+        due_back=due_back,
+    )
+
+
+def place_hold(book, user):
+    if BookInstance.objects.filter(book=book, status='a').exists():
+        raise CirculationConflict(_('Há cópias disponíveis deste livro.'))
+
+    try:
+        with transaction.atomic():
+            return Hold.objects.create(book=book, patron=user)
+    except IntegrityError:
+        raise CirculationConflict(_('Você já tem uma reserva deste livro.'))
+
+
+def release_hold(hold):
+    """
+    Cancels a hold. A copy set aside for it goes to the next hold in the
+    queue, or back to the shelf (see ready_hold_deleted).
+    """
+    deleted, _rows = Hold.objects.filter(pk=hold.pk, status=hold.status).delete()
+    if not deleted:
+        raise CirculationConflict(_('Esta reserva já foi encerrada.'))
+
+
+@receiver(post_delete, sender=Hold)
+def ready_hold_deleted(sender, instance, **kwargs):
+    """
+    However a ready hold ends (cancelled, expired, its patron borrowing
+    another copy of the book or being deleted), the copy set aside for it
+    must not stay reserved with no hold: it goes to the next hold in the
+    queue, or back to the shelf.
+    """
+    if instance.status != 'r' or not instance.bookinstance_id:
+        return
+    # Unless the holder just borrowed it
+    copy = BookInstance.objects.filter(pk=instance.bookinstance_id, status='r').first()
+    if copy is not None and _claim_next_hold(copy) is None:
+        _transition(copy, ('r',), _('Esta cópia não está reservada.'), status='a')
+
+
+def queue_position(hold):
+    """1-based position of a waiting hold in its book's queue."""
+    return Hold.objects.filter(book_id=hold.book_id, status='w').filter(
+        Q(created_at__lt=hold.created_at) | Q(created_at=hold.created_at, id__lt=hold.id)
+    ).count() + 1
+
+
+BATCH_ACTIONS = (
+    ('borrow', _('Emprestar')),
+    ('return', _('Devolver')),
+    ('renew', _('Renovar')),
+)
+
+MAX_BATCH_SIZE = 200
+
+# status is the copy's new status, or None if it was left alone because of error
+BatchResult = namedtuple('BatchResult', ['id', 'status', 'error'])
+
+
+def _check_borrow(copies, borrower):
+    reserved = [copy.pk for copy in copies if copy.status == 'r']
+    held = set(Hold.objects.filter(
+        bookinstance__in=reserved, patron=borrower, status='r',
+    ).values_list('bookinstance_id', flat=True)) if reserved else set()
+
+    errors = {}
+    loans_left = borrower.loans_left
+    for copy in copies:
+        if copy.status == 'r' and copy.pk not in held:
+            errors[copy.pk] = _('Esta cópia está reservada para outro usuário')
+        elif copy.status not in ('a', 'r'):
+            errors[copy.pk] = _('Esta cópia está indisponível')
+        elif not loans_left:
+            errors[copy.pk] = _('Você não pode pegar livros emprestados se tiver algum livro '
+                                'atrasado ou se já tiver pego 3 livros')
+        else:
+            loans_left -= 1
+    return errors
+
+
+def _check_loaned(message):
+    def check(copies, borrower):
+        return {copy.pk: message for copy in copies if copy.status != 'o'}
+    return check
+
+
+BATCH_CHECKS = {
+    'borrow': _check_borrow,
+    'return': _check_loaned(_('Esta cópia não pode ser devolvida. Ela não está emprestada.')),
+    'renew': _check_loaned(_('Esta cópia não está emprestada.')),
+}
+
+
+def _claim_next_holds(copies):
+    """
+    Sets copies aside for the first waiting holds of their books, in order.
+    Returns the holds claimed, by copy pk.
+    """
+    returned = Counter(copy.book_id for copy in copies)
+    # One index lookup per book, however long its queue
+    queued = Book.objects.filter(
+        Exists(Hold.objects.filter(book=OuterRef('pk'), status='w')), pk__in=returned,
+    ).values_list('pk', flat=True)
+
+    queues = {}
+    for book_id in queued:
+        # Only the heads of the queue, served by hold_queue_idx
+        queues[book_id] = list(
+            Hold.objects.select_for_update()
+            .filter(book_id=book_id, status='w')
+            .order_by('created_at', 'id')[:returned[book_id]]
+        )
+
+    claimed = {}
+    pickup_by = pickup_deadline()
+    for copy in copies:
+        if queues.get(copy.book_id):
+            hold = queues[copy.book_id].pop(0)
+            hold.status, hold.bookinstance, hold.pickup_by = 'r', copy, pickup_by
+            claimed[copy.pk] = hold
+
+    Hold.objects.bulk_update(claimed.values(), ['status', 'bookinstance', 'pickup_by'])
+    return claimed
+
+
+def batch(action, copy_ids, borrower=None, due_back=None):
+    """
+    Borrows (to borrower), returns or renews (until due_back) many copies at
+    once. The copies are all checked together, then those that can be are
+    written in one transaction; the others are left alone. Returns a
+    BatchResult per requested id, in order.
+    """
+    check = BATCH_CHECKS[action]
+    if (action == 'borrow' and borrower is None) or (action != 'return' and due_back is None):
+        raise ValueError(f'Missing borrower or due_back for {action!r}.')
+
+    pks = []
+    for copy_id in copy_ids:
+        try:
+            pks.append(copy_id if isinstance(copy_id, uuid.UUID) else uuid.UUID(str(copy_id)))
+        except ValueError:
+            pks.append(None)
+
+    with transaction.atomic():
+        copies = BookInstance.objects.select_for_update().in_bulk({pk for pk in pks if pk is not None})
+        if borrower is not None:
+            # Current loan counters
+            borrower = User.objects.select_for_update().get(pk=borrower.pk)
+
+        # In request order, so that the loan limit keeps the first copies
+        requested = list({pk: copies[pk] for pk in pks if pk in copies}.values())
+        errors = check(requested, borrower)
+        accepted = [copy for copy in requested if copy.pk not in errors]
+
+        holds = _claim_next_holds(accepted) if action == 'return' else {}
+        now = timezone.now()
+        changes = []
+        for copy in accepted:
+            old = copy._loaded_state
+            if action == 'borrow':
+                copy.status, copy.borrower, copy.due_back = 'o', borrower, due_back
+            elif action == 'return':
+                copy.status = 'r' if copy.pk in holds else 'a'
+                copy.borrower, copy.due_back = None, None
+            else:
+                copy.due_back = due_back
+            # bulk_update() skips auto_now fields
+            copy.updated_at = now
+            copy._loaded_state = copy_state(copy)
+            changes.append((old, copy._loaded_state))
+
+        BookInstance.objects.bulk_update(accepted, ['status', 'borrower', 'due_back', 'updated_at'])
+        if action == 'borrow' and accepted:
+            # The borrower no longer needs holds on these books; copies set
+            # aside for them are passed on by ready_hold_deleted
+            Hold.objects.filter(book_id__in={copy.book_id for copy in accepted}, patron=borrower).delete()
+        if changes:
+            copies_changed.send(sender=BookInstance, changes=changes, instances=accepted)
+
+    results = []
+    seen = set()
+    for copy_id, pk in zip(copy_ids, pks):
+        if pk is None:
+            error = _('ID de cópia inválido')
+        elif pk in seen:
+            error = _('Cópia repetida')
+        elif pk not in copies:
+            error = _('Cópia não encontrada')
+        else:
+            error = errors.get(pk)
+        seen.add(pk)
+        status = None if error else copies[pk].status
+        results.append(BatchResult(str(copy_id), status, error))
+    return results
@@ -0,0 +1,103 @@
+"""
+Conditional GET for the HTML pages.
+
+Before a view runs, its ETag is computed from a few validators read in a
+single query on the ``updated_at`` indexes (see the ``*_validators``
+functions in catalog.views), plus what else the page depends on: the
+fragment version stamps and who is looking at it. A request whose
+``If-None-Match`` matches gets a 304 without running the view's queries or
+touching the template engine.
+
+Pages only get an ETag, not Last-Modified, since they also change with the
+user viewing them.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import Count, Subquery
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+
+def latest(queryset, field='updated_at'):
+    """Subquery for the newest value of field in the queryset."""
+    return Subquery(queryset.order_by(f'-{field}').values(field)[:1])
+
+
+def count(queryset, column):
+    """Subquery counting the rows of a queryset correlated on column."""
+    return Subquery(queryset.order_by().values(column).annotate(count=Count('pk')).values('count'))
+
+
+def viewer(request):
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    # The base template shows the username and a logout form, whose CSRF
+    # token is only valid with the current CSRF secret (created here if the
+    # client has none yet, the same one the page is rendered with); the pages
+    # show links depending on permissions and the loan limits.
+    get_token(request)
+    return (
+        user.pk, user.get_username(), user.is_staff, user.active_loans, user.overdue_loans,
+        sorted(user.get_all_permissions()), request.META['CSRF_COOKIE'],
+    )
+
+
+def page_etag(request, validators):
+    if validators is None:
+        return None
+    data = repr((validators, viewer(request))).encode()
+    return f'"{hashlib.md5(data, usedforsecurity=False).hexdigest()}"'
+
+
+def _not_modified(request, etag):
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=etag)
+
+
+def _finish(request, response, etag):
+    if etag is not None and response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        # Always revalidated; pages for a logged in user stay out of shared caches
+        if request.user.is_authenticated:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_page(validators_func):
+    """
+    Like Django's etag() decorator, for sync and async views:
+    validators_func(request, *args, **kwargs) returns the page's validators,
+    or None to skip conditional handling (e.g. for a missing object). For
+    async views it runs in a thread, since it queries the database.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                etag = None
+                if request.method in ('GET', 'HEAD'):
+                    etag = await sync_to_async(
+                        lambda: page_etag(request, validators_func(request, *args, **kwargs)))()
+                response = _not_modified(request, etag)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(request, response, etag)
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                etag = None
+                if request.method in ('GET', 'HEAD'):
+                    etag = page_etag(request, validators_func(request, *args, **kwargs))
+                response = _not_modified(request, etag)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _finish(request, response, etag)
+        return inner
+
+    return decorator
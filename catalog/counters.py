@@ -0,0 +1,100 @@
+"""
+Cached totals shown on the catalog home page.
+
+The counters live in the default cache and are adjusted incrementally by the
+handlers in ``catalog.signals`` once the surrounding transaction commits. A
+cold (or partially evicted) cache is rebuilt with a full recount on the next
+read, and ``manage.py reconcile_counters`` fixes any drift. The recount
+always reads the primary: a lagging replica would be cached for good.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from catalog.models import Author, Book, BookInstance
+
+KEY_PREFIX = 'catalog:counters:'
+
+
+def _primary(model):
+    return model.objects.using(DEFAULT_DB_ALIAS)
+
+
+COUNTERS = {
+    'num_books': lambda: _primary(Book).count(),
+    'num_instances': lambda: _primary(BookInstance).count(),
+    'num_instances_available': lambda: _primary(BookInstance).filter(status__exact='a').count(),
+    'num_authors': lambda: _primary(Author).count(),
+}
+
+# Counters holding the number of rows of a whole table
+TABLE_COUNTERS = {
+    Book: 'num_books',
+    BookInstance: 'num_instances',
+    Author: 'num_authors',
+}
+
+
+def _key(name):
+    return KEY_PREFIX + name
+
+
+def recount():
+    """Counts every total from the database and stores it in the cache."""
+    counts = {name: count() for name, count in COUNTERS.items()}
+    cache.set_many({_key(name): value for name, value in counts.items()}, timeout=None)
+    return counts
+
+
+def get_counts():
+    """Returns the cached totals, recounting them all if any is missing."""
+    cached = cache.get_many([_key(name) for name in COUNTERS])
+
+    if len(cached) < len(COUNTERS):
+        return recount()
+
+    return {name: cached[_key(name)] for name in COUNTERS}
+
+
+def table_count(model):
+    """The cached number of rows of the model's table, or None if it is not counted."""
+    name = TABLE_COUNTERS.get(model)
+    return None if name is None else get_counts()[name]
+
+
+async def aget_counts():
+    """Async version of get_counts()."""
+    cached = await cache.aget_many([_key(name) for name in COUNTERS])
+
+    if len(cached) < len(COUNTERS):
+        return await sync_to_async(recount)()
+
+    return {name: cached[_key(name)] for name in COUNTERS}
+
+
+def _apply(deltas):
+    for name, delta in deltas.items():
+        try:
+            cache.incr(_key(name), delta)
+        except ValueError:
+            # Not cached: the next read recounts everything.
+            pass
+
+
+def adjust(**deltas):
+    """Schedules the given deltas to be applied when the transaction commits."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if deltas:
+        transaction.on_commit(lambda: _apply(deltas))
+
+
+def reconcile():
+    """Recounts the totals and returns the ones whose cached value had drifted."""
+    cached = cache.get_many([_key(name) for name in COUNTERS])
+    counts = recount()
+
+    return {
+        name: (cached[_key(name)], value)
+        for name, value in counts.items()
+        if _key(name) in cached and cached[_key(name)] != value
+    }
@@ -1,11 +1,14 @@
 import datetime
+import re
 from typing import Any
 
+from django import forms
 from django.forms import ModelForm
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
-from catalog.models import BookInstance
+from catalog.circulation import BATCH_ACTIONS, MAX_BATCH_SIZE
+from catalog.models import BookInstance, Hold, User
 
 
 def clean_due_back_helper(due_back):
@@ -39,7 +42,11 @@ class BorrowBookModelForm(ModelForm):
     def clean_due_back(self):
         return clean_due_back_helper(self.cleaned_data['due_back'])
     def clean(self) -> dict[str, Any]:
-        if self.instance.status != 'a':
+        if self.instance.status == 'r':
+            # Set aside for a hold: only its holder may borrow it
+            if not Hold.objects.filter(bookinstance=self.instance, patron=self.user, status='r').exists():
+                raise ValidationError(_('Esta cópia está reservada para outro usuário'))
+        elif self.instance.status != 'a':
             raise ValidationError(_('Esta cópia está indisponível'))
 
         if not self.user.can_borrow_book:
@@ -70,3 +77,46 @@ class ReturnBookModelForm(ModelForm):
         model = BookInstance
         fields = ['due_back']
         labels = {'due_back': _('Prazo desejado')}
+
+
+class BatchCirculationForm(forms.Form):
+    action = forms.ChoiceField(label=_('Ação'), choices=BATCH_ACTIONS)
+    copies = forms.CharField(
+        label=_('Cópias'), widget=forms.Textarea(attrs={'rows': 10}),
+        help_text=_('Os IDs das cópias, um por linha.'))
+    borrower = forms.CharField(
+        label=_('Usuário'), required=False,
+        help_text=_('Nome de usuário de quem pega as cópias (só para empréstimos).'))
+    due_back = forms.DateField(
+        label=_('Prazo'), required=False,
+        help_text=_('Para empréstimos e renovações: entre hoje e daqui 4 semanas.'))
+
+    def clean_copies(self):
+        copy_ids = [copy_id for copy_id in re.split(r'[\s,;]+', self.cleaned_data['copies']) if copy_id]
+        if not copy_ids:
+            raise ValidationError(_('Informe ao menos uma cópia.'))
+        if len(copy_ids) > MAX_BATCH_SIZE:
+            raise ValidationError(_('Informe no máximo %(max)d cópias.') % {'max': MAX_BATCH_SIZE})
+        return copy_ids
+
+    def clean_borrower(self):
+        username = self.cleaned_data['borrower'].strip()
+        if not username:
+            return None
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise ValidationError(_('Usuário não encontrado.'))
+
+    def clean_due_back(self):
+        due_back = self.cleaned_data['due_back']
+        return due_back and clean_due_back_helper(due_back)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if action == 'borrow' and not cleaned_data.get('borrower') and 'borrower' not in self.errors:
+            self.add_error('borrower', _('Informe quem pega as cópias.'))
+        if action in ('borrow', 'renew') and not cleaned_data.get('due_back') and 'due_back' not in self.errors:
+            self.add_error('due_back', _('Informe o prazo.'))
+        return cleaned_data
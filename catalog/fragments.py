@@ -0,0 +1,102 @@
+"""
+Version stamps for the cached template fragments of the detail pages.
+
+Fragments are cached with ``{% cache %}`` and vary on a version string made
+of the stamps of every object they show, e.g. a book, its author and the
+genre and language names. The handlers in ``catalog.signals`` bump a stamp
+whenever the corresponding rows change, so stale fragments are never read
+again and simply expire.
+
+Pages read from a lagging replica would cache old rows under the current
+stamps, and serve them everywhere, so their fragments are not cached at
+all: fragment_context() points their tags at the ``uncached`` dummy cache.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+from catalog import replicas
+
+KEY_PREFIX = 'catalog:fragments:'
+
+# Fragments expire after a day; the version stamps never do.
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+FRAGMENT_CACHE = 'default'
+UNCACHED = 'uncached'
+
+
+def _key(kind, pk=None):
+    return f'{KEY_PREFIX}{kind}' if pk is None else f'{KEY_PREFIX}{kind}:{pk}'
+
+
+def _stamps(keys, cached):
+    stamps = []
+    for key in keys:
+        if key not in cached:
+            # A new (or evicted) stamp must never match an old fragment.
+            cached[key] = cache.get_or_set(key, time.time_ns(), timeout=None)
+        stamps.append(str(cached[key]))
+    return '.'.join(stamps)
+
+
+def version(*objects):
+    """
+    Returns the combined version of the given (kind, pk) or (kind,) objects,
+    e.g. version(('book', 1), ('author', 2), ('genres',)).
+    """
+    keys = [_key(*obj) for obj in objects]
+    return _stamps(keys, cache.get_many(keys))
+
+
+async def aversion(*objects):
+    """Async version of version()."""
+    keys = [_key(*obj) for obj in objects]
+    cached = await cache.aget_many(keys)
+    if len(cached) < len(keys):
+        return await sync_to_async(_stamps)(keys, cached)
+    return _stamps(keys, cached)
+
+
+def fragment_cache():
+    """The cache alias of the {% cache %} tags of the current request."""
+    return UNCACHED if replicas.current_replica() else FRAGMENT_CACHE
+
+
+def fragment_context(*objects):
+    """Template context of the {% cache %} tags of a page showing objects."""
+    return {
+        'fragment_version': version(*objects),
+        'fragment_timeout': FRAGMENT_TIMEOUT,
+        'fragment_cache': fragment_cache(),
+    }
+
+
+async def afragment_context(*objects):
+    """Async version of fragment_context()."""
+    return {
+        'fragment_version': await aversion(*objects),
+        'fragment_timeout': FRAGMENT_TIMEOUT,
+        'fragment_cache': fragment_cache(),
+    }
+
+
+def bump(kind, pk=None):
+    """
+    Invalidates the fragments showing the given object. The stamp is bumped
+    right away and again when the transaction commits, so that fragments
+    rendered from the old rows in between are not served either.
+    """
+    key = _key(kind, pk)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def bump_many(objects):
+    """bump() for several (kind, pk) or (kind,) objects at once."""
+    keys = [_key(*obj) for obj in objects]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
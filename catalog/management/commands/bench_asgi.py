@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import clear_url_caches, reverse
+
+from catalog.benchmarks import format_load, run_async_load, run_sync_load
+from catalog.models import Author, Book, User
+
+
+class Command(BaseCommand):
+    help = ('Compares requests per second and p99 latency of the catalog browsing views '
+            'served by the WSGI deployment (sync views) and the ASGI one (async views), '
+            'under concurrent load, against the configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--user', help='Username to log in as (the author list requires login).')
+
+    def urls(self):
+        urls = [reverse('index'), reverse('books'), reverse('authors')]
+        book = Book.objects.order_by('pk').first()
+        author = Author.objects.order_by('pk').first()
+        if book:
+            urls.append(reverse('book', args=[book.pk]))
+        if author:
+            urls.append(reverse('author', args=[author.pk]))
+        return urls
+
+    def handle(self, *args, **options):
+        user = User.objects.get(username=options['user']) if options['user'] else None
+        urls = self.urls()
+        load = (urls, options['requests'], options['concurrency'], user)
+
+        for label, urlconf, run in (
+            ('WSGI (views síncronas)', 'bib.urls', run_sync_load),
+            ('ASGI (views assíncronas)', 'bib.urls_async', run_async_load),
+        ):
+            with override_settings(ROOT_URLCONF=urlconf, ALLOWED_HOSTS=['testserver']):
+                clear_url_caches()
+                samples, elapsed = run(*load)
+            self.stdout.write(format_load(label, samples, elapsed))
+
+        clear_url_caches()
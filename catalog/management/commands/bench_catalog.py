@@ -0,0 +1,130 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, clear_url_caches, reverse
+
+from catalog import urls as catalog_urls
+from catalog.benchmarks import summarize
+from catalog.models import Author, Book, BookInstance, Genre, Hold, Language, User
+
+
+class Command(BaseCommand):
+    help = ('Requests every route of catalog/urls.py (GET, logged in as a superuser) and '
+            'reports p50/p95/p99 latency, throughput and queries per request. Results can '
+            'be saved as a JSON baseline and compared with a later run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per route.')
+        parser.add_argument('--user', help='Username to log in as (default: the first superuser).')
+        parser.add_argument('--routes', nargs='+', metavar='NAME', help='Only benchmark these URL names.')
+        parser.add_argument('--save', type=Path, metavar='PATH', help='Save the results as a baseline.')
+        parser.add_argument('--compare', type=Path, metavar='PATH', help='Compare with a saved baseline.')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Percent increase of p95 latency reported as a regression.')
+
+    def route_args(self):
+        book = Book.objects.order_by('pk').values_list('pk', flat=True).first()
+        author = Author.objects.order_by('pk').values_list('pk', flat=True).first()
+        copy = BookInstance.objects.order_by('pk').values_list('pk', flat=True).first()
+        hold = Hold.objects.order_by('pk').values_list('pk', flat=True).first()
+        genre = Genre.objects.order_by('pk').values_list('pk', flat=True).first()
+        language = Language.objects.order_by('pk').values_list('pk', flat=True).first()
+        return {
+            'book': book, 'author': author, 'bookinstance': copy,
+            'renew-book-librarian': copy, 'borrow-book': copy, 'return-book': copy,
+            'place-hold': book, 'cancel-hold': hold, 'export': 'books',
+            'api-book': book, 'api-author': author, 'api-copy': copy,
+            'api-genre': genre, 'api-language': language,
+        }
+
+    def routes(self, names=None):
+        args = self.route_args()
+        routes = {}
+        for pattern in catalog_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or (names and pattern.name not in names):
+                continue
+            if not pattern.pattern.converters:
+                routes[pattern.name] = reverse(pattern.name)
+                continue
+            # book-update -> book, bookinstance-delete -> bookinstance, ...
+            arg = args.get(pattern.name, args.get(pattern.name.split('-')[0]))
+            if arg is None:
+                self.stderr.write(f'{pattern.name}: ignorada (sem dados)')
+                continue
+            routes[pattern.name] = reverse(pattern.name, args=[arg])
+        return routes
+
+    def bench(self, client, url, repeat):
+        samples = []
+        queries = 0
+        statuses = set()
+        client.get(url)  # warm-up, not measured
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                samples.append(time.perf_counter() - start)
+            queries += len(captured)
+            statuses.add(response.status_code)
+
+        result = summarize(samples)
+        result['throughput'] = len(samples) / sum(samples)
+        result['queries'] = queries / repeat
+        result['status'] = sorted(statuses)
+        return result
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.get(username=options['user'])
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('pk').first()
+            if user is None:
+                raise CommandError('Nenhum superusuário encontrado; use --user.')
+
+        baseline = None
+        if options['compare']:
+            baseline = json.loads(options['compare'].read_text())['routes']
+
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            clear_url_caches()
+            for name, url in self.routes(options['routes']).items():
+                result = results[name] = self.bench(client, url, options['repeat'])
+                self.stdout.write(self.format_result(name, result, baseline, options['threshold']))
+        clear_url_caches()
+
+        if options['save']:
+            options['save'].write_text(json.dumps({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'books': Book.objects.count(),
+                'copies': BookInstance.objects.count(),
+                'routes': results,
+            }, indent=2))
+            self.stdout.write(self.style.SUCCESS(f'Resultados salvos em {options["save"]}'))
+
+    def format_result(self, name, result, baseline, threshold):
+        line = (
+            f"{name:<22} p50={result['p50']:7.2f}ms p95={result['p95']:7.2f}ms "
+            f"p99={result['p99']:7.2f}ms {result['throughput']:7.1f} req/s "
+            f"{result['queries']:5.1f} consultas/req status={','.join(map(str, result['status']))}"
+        )
+        previous = baseline.get(name) if baseline else None
+        if not previous:
+            return line
+
+        change = 100 * (result['p95'] - previous['p95']) / previous['p95'] if previous['p95'] else 0.0
+        line += f" | p95 {change:+.0f}%"
+        if result['queries'] != previous['queries']:
+            line += f", consultas {previous['queries']:.1f} -> {result['queries']:.1f}"
+        if change > threshold or result['queries'] > previous['queries']:
+            return self.style.ERROR(line + ' REGRESSÃO')
+        return line
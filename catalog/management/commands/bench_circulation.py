@@ -0,0 +1,107 @@
+import datetime
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from catalog import circulation
+from catalog.models import Book, BookInstance, User
+
+
+class Command(BaseCommand):
+    help = ('Has many simultaneous borrowers race for the same copies and reports '
+            'throughput and whether any copy was handed to more than one borrower. '
+            'Uses (and afterwards removes) temporary rows in the configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=200)
+        parser.add_argument('--borrowers', type=int, default=16)
+        parser.add_argument('--naive', action='store_true',
+                            help='Use the old read, check and save() flow instead of conditional updates.')
+
+    def borrow(self, pk, user, due_back, naive):
+        copy = BookInstance.objects.get(pk=pk)
+
+        if naive:
+            if copy.status != 'a':
+                return False
+            copy.status = 'o'
+            copy.borrower = user
+            copy.due_back = due_back
+            copy.save()
+            return True
+
+        try:
+            circulation.borrow(copy, user, due_back)
+        except circulation.CirculationConflict:
+            return False
+        return True
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+
+        book = Book.objects.create(title=f'Benchmark {tag}', summary='', isbn=tag)
+        copy_ids = [
+            BookInstance.objects.create(book=book, imprint='Benchmark').pk
+            for _ in range(options['copies'])
+        ]
+        users = [User.objects.create(username=f'bench-{tag}-{i}') for i in range(options['borrowers'])]
+
+        claims = Counter()
+        stats = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(users))
+
+        def worker(user):
+            ids = copy_ids[:]
+            random.shuffle(ids)
+            local_claims = []
+            local_stats = Counter()
+            try:
+                barrier.wait()
+                for pk in ids:
+                    try:
+                        if self.borrow(pk, user, due_back, options['naive']):
+                            local_claims.append(pk)
+                            local_stats['successes'] += 1
+                        else:
+                            local_stats['conflicts'] += 1
+                    except OperationalError:
+                        local_stats['errors'] += 1
+            finally:
+                connection.close()
+
+            with lock:
+                claims.update(local_claims)
+                stats.update(local_stats)
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        attempts = sum(stats.values())
+        double_borrowed = sum(1 for count in claims.values() if count > 1)
+
+        self.stdout.write(f"Modo: {'save() ingênuo' if options['naive'] else 'UPDATE condicional'}")
+        self.stdout.write(f"{len(users)} usuários, {len(copy_ids)} cópias, {attempts} tentativas em {elapsed:.2f}s "
+                          f"({attempts / elapsed:.0f} tentativas/s)")
+        self.stdout.write(f"Sucessos: {stats['successes']}, conflitos: {stats['conflicts']}, "
+                          f"erros de banco: {stats['errors']}")
+
+        if double_borrowed:
+            self.stdout.write(self.style.ERROR(f'{double_borrowed} cópia(s) emprestada(s) a mais de um usuário!'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Nenhuma cópia emprestada a mais de um usuário.'))
+
+        BookInstance.objects.filter(book=book).delete()
+        book.delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
@@ -0,0 +1,62 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog import search
+from catalog.benchmarks import WORDS, format_summary, measure, summarize
+from catalog.models import Author, Book
+
+
+class Command(BaseCommand):
+    help = ('Compares full-text search latency (FTS5) with icontains lookups. '
+            'With --seed, first adds synthetic books to the configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Number of synthetic books to create before measuring, e.g. 1000000.')
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def seed(self, number, batch_size):
+        author = Author.objects.create(first_name='Autor', last_name='Sintético')
+        start = Book.objects.count()
+
+        for offset in range(0, number, batch_size):
+            size = min(batch_size, number - offset)
+            with transaction.atomic():
+                Book.objects.bulk_create(
+                    Book(
+                        title=' '.join(random.choices(WORDS, k=3)).capitalize(),
+                        summary=' '.join(random.choices(WORDS, k=40)),
+                        isbn=f'b{start + offset + i:012d}',
+                        author=author,
+                    )
+                    for i in range(size)
+                )
+            self.stdout.write(f'{offset + size}/{number} livros criados')
+
+    def handle(self, *args, **options):
+        if not search.is_available() and not search.install():
+            raise CommandError('Este banco de dados não suporta FTS5.')
+
+        if options['seed']:
+            self.seed(options['seed'], options['batch_size'])
+
+        self.stdout.write(f'{Book.objects.count()} livros no catálogo')
+        terms = [random.choice(WORDS) for _ in range(options['queries'])]
+        terms_iter = iter(terms * 2)
+
+        def fts_query():
+            results = search.SearchResults(next(terms_iter))
+            results.count()
+            results[0:10]
+
+        def icontains_query():
+            term = next(terms_iter)
+            books = Book.objects.filter(title__icontains=term) | Book.objects.filter(summary__icontains=term)
+            books.count()
+            list(books.order_by('title', 'id')[:10])
+
+        self.stdout.write(format_summary('FTS5', summarize(measure(fts_query, len(terms)))))
+        self.stdout.write(format_summary('icontains', summarize(measure(icontains_query, len(terms)))))
@@ -0,0 +1,81 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from catalog.benchmarks import summarize
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def count_writes(queries):
+    return sum(query['sql'].lstrip().split(None, 1)[0].upper() in WRITE_STATEMENTS for query in queries)
+
+
+class Command(BaseCommand):
+    help = ('Counts the database writes and latency caused by sessions, for each session '
+            'engine (see SESSION_ENGINES in the settings): anonymous visits to the index '
+            'page, and requests that change the session every time, as the visit counter '
+            'used to.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engines', nargs='+', choices=sorted(settings.SESSION_ENGINES),
+                            default=sorted(settings.SESSION_ENGINES))
+        parser.add_argument('--visitors', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=10, help='Requests per visitor.')
+
+    def bench_index(self, visitors, requests):
+        samples = []
+        writes = 0
+        url = reverse('index')
+        for _ in range(visitors):
+            client = Client()
+            for _ in range(requests):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    client.get(url)
+                    samples.append(time.perf_counter() - start)
+                writes += count_writes(captured)
+        return samples, writes
+
+    def bench_session_writes(self, engine, visitors, requests):
+        samples = []
+        writes = 0
+        for _ in range(visitors):
+            session_key = None
+            for _ in range(requests):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    session = engine.SessionStore(session_key)
+                    session['num_visits'] = session.get('num_visits', 0) + 1
+                    session.save()
+                    samples.append(time.perf_counter() - start)
+                writes += count_writes(captured)
+                session_key = session.session_key
+            session.delete()
+        return samples, writes
+
+    def handle(self, *args, **options):
+        visitors, requests = options['visitors'], options['requests']
+        if visitors < 1 or requests < 1:
+            raise CommandError('--visitors e --requests devem ser positivos.')
+        total = visitors * requests
+
+        for name in options['engines']:
+            path = settings.SESSION_ENGINES[name]
+            with override_settings(SESSION_ENGINE=path, ALLOWED_HOSTS=['testserver']):
+                index_samples, index_writes = self.bench_index(visitors, requests)
+                session_samples, session_writes = self.bench_session_writes(import_module(path), visitors, requests)
+
+            index = summarize(index_samples)
+            session = summarize(session_samples)
+            self.stdout.write(
+                f"{name:<15} índice: {index_writes / total:.2f} escritas/req p50={index['p50']:.2f}ms "
+                f"p95={index['p95']:.2f}ms | sessão alterada: {session_writes / total:.2f} escritas/req "
+                f"p50={session['p50']:.2f}ms p95={session['p95']:.2f}ms"
+            )
@@ -0,0 +1,145 @@
+import datetime
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from catalog import replicas
+from catalog.backends.sqlite3.base import DatabaseWrapper
+from catalog.benchmarks import summarize
+from catalog.models import Book, BookInstance
+
+BOOK_PAGE = (
+    'SELECT b.id, b.title, a.last_name FROM catalog_book b '
+    'LEFT JOIN catalog_author a ON a.id = b.author_id '
+    'ORDER BY b.title, b.id LIMIT 10 OFFSET %s'
+)
+BOOK_COPIES = 'SELECT id, status, due_back FROM catalog_bookinstance WHERE book_id = %s ORDER BY due_back, id'
+
+COPY_STATE = 'SELECT book_id, status FROM catalog_bookinstance WHERE id = %s'
+UPDATE_COPY = 'UPDATE catalog_bookinstance SET status = %s, due_back = %s, updated_at = %s WHERE id = %s'
+UPDATE_BOOK = 'UPDATE catalog_book SET available_copies = available_copies + %s, updated_at = %s WHERE id = %s'
+
+
+class Command(BaseCommand):
+    help = ('Runs a mixed read/write load on a copy of the database once per SQLite connection '
+            'profile (SQLITE_PROFILES in the settings): reader threads browse the catalog while '
+            'writer threads borrow and return copies, each operation in its own connection '
+            'unless the profile keeps them open. Reports throughput, latency and lock errors.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=sorted(settings.SQLITE_PROFILES),
+                            default=sorted(settings.SQLITE_PROFILES))
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0)
+
+    def open(self, profile, path):
+        settings_dict = {**connection.settings_dict, **profile, 'NAME': path}
+        return DatabaseWrapper(settings_dict, alias='bench_sqlite')
+
+    def read(self, db, num_books, book_ids):
+        with db.cursor() as cursor:
+            cursor.execute(BOOK_PAGE, [random.randrange(max(1, num_books - 10))])
+            cursor.fetchall()
+            cursor.execute(BOOK_COPIES, [random.choice(book_ids)])
+            cursor.fetchall()
+
+    def write(self, db, copy_ids):
+        # Read, then write, as the circulation views do
+        now = db.ops.adapt_datetimefield_value(timezone.now())
+        db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            with db.cursor() as cursor:
+                copy_id = random.choice(copy_ids)
+                cursor.execute(COPY_STATE, [copy_id])
+                book_id, status = cursor.fetchone()
+                if status == 'a':
+                    due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+                    cursor.execute(UPDATE_COPY, ['o', due_back, now, copy_id])
+                    cursor.execute(UPDATE_BOOK, [-1, now, book_id])
+                else:
+                    cursor.execute(UPDATE_COPY, ['a', None, now, copy_id])
+                    cursor.execute(UPDATE_BOOK, [1 if status == 'o' else 0, now, book_id])
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.set_autocommit(True)
+
+    def run(self, profile, path, options, book_ids, copy_ids):
+        persistent = profile.get('CONN_MAX_AGE', 0) != 0
+        results = {'reads': [], 'writes': [], 'errors': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['readers'] + options['writers'])
+
+        def worker(operation, key):
+            db = self.open(profile, path)
+            samples = []
+            errors = 0
+            barrier.wait()
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        operation(db)
+                    except OperationalError:
+                        errors += 1
+                    else:
+                        samples.append(time.perf_counter() - start)
+                    if not persistent:
+                        # A new connection per request
+                        db.close()
+            finally:
+                db.close()
+            with lock:
+                results[key].extend(samples)
+                results['errors'] += errors
+
+        threads = [
+            threading.Thread(target=worker, args=(lambda db: self.read(db, len(book_ids), book_ids), 'reads'))
+            for _ in range(options['readers'])
+        ] + [
+            threading.Thread(target=worker, args=(lambda db: self.write(db, copy_ids), 'writes'))
+            for _ in range(options['writers'])
+        ]
+        deadline = time.perf_counter() + options['seconds']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Este benchmark só funciona com SQLite.')
+        if options['readers'] < 0 or options['writers'] < 0 or options['readers'] + options['writers'] == 0:
+            raise CommandError('--readers e --writers não podem ser negativos, nem ambos zero.')
+
+        book_ids = list(Book.objects.values_list('pk', flat=True))
+        copy_ids = [pk.hex for pk in BookInstance.objects.values_list('pk', flat=True)]
+        if not book_ids or not copy_ids:
+            raise CommandError('Catálogo vazio: rode manage.py seed_catalog antes.')
+
+        for name in options['profiles']:
+            profile = settings.SQLITE_PROFILES[name]
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                replicas.copy_database(path)
+                results = self.run(profile, path, options, book_ids, copy_ids)
+
+            seconds = options['seconds']
+            reads = summarize(results['reads'])
+            writes = summarize(results['writes'])
+            self.stdout.write(
+                f"{name:<12} leituras: {reads['count'] / seconds:.0f}/s p95={reads['p95']:.2f}ms | "
+                f"escritas: {writes['count'] / seconds:.0f}/s p95={writes['p95']:.2f}ms | "
+                f"erros de bloqueio: {results['errors']}"
+            )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from catalog import export
+from catalog.models import BookInstance
+
+
+class Command(BaseCommand):
+    help = 'Streams books, authors, copies or current loans as CSV or JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(export.EXPORTS))
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to (default: standard output).')
+        parser.add_argument('--status', choices=[status for status, _ in BookInstance.LOAN_STATUS])
+        parser.add_argument('--overdue', action='store_true')
+        parser.add_argument('--genre')
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('status', 'overdue', 'genre')}
+        lines = export.export_lines(options['kind'], options['format'], filters)
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,190 @@
+import csv
+import itertools
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog import counters, fragments, search
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+def read_rows(path):
+    """Streams the rows of a CSV (with header) or JSONL file as dicts."""
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.suffix in ('.jsonl', '.ndjson'):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(file)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def split_names(value):
+    if isinstance(value, (list, tuple)):
+        names = value
+    else:
+        names = (value or '').split(';')
+    return [name.strip() for name in names if name and name.strip()]
+
+
+class Command(BaseCommand):
+    help = ('Imports books and copies from a CSV or JSONL file, in batches. '
+            'Columns: isbn, title, summary, author_first_name, author_last_name, '
+            'genres (separated by ";" in CSV files), language, imprint and copies. '
+            'Books are upserted by ISBN; copies are only created for new books, '
+            'so interrupted imports can be resumed with --resume.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=Path)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the rows already imported by a previous run of this file.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path.exists():
+            raise CommandError(f'Arquivo não encontrado: {path}')
+
+        checkpoint = path.with_name(path.name + '.progress')
+        skip = 0
+        if options['resume'] and checkpoint.exists():
+            skip = int(checkpoint.read_text())
+            self.stdout.write(f'Retomando a partir da linha {skip + 1}')
+
+        self.authors = {
+            (first_name, last_name): pk
+            for pk, first_name, last_name in Author.objects.values_list('pk', 'first_name', 'last_name')
+        }
+        self.genres = {name.lower(): pk for pk, name in Genre.objects.values_list('pk', 'name')}
+        self.languages = {name.lower(): pk for pk, name in Language.objects.values_list('pk', 'name')}
+
+        done = skip
+        created = updated = copies = 0
+        start = time.perf_counter()
+
+        rows = itertools.islice(read_rows(path), skip, None)
+        with search.deferred_indexing():
+            for batch in batched(rows, options['batch_size']):
+                with transaction.atomic():
+                    result = self.import_batch(batch)
+
+                done += len(batch)
+                created += result[0]
+                updated += result[1]
+                copies += result[2]
+                checkpoint.write_text(str(done))
+
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'{done} linhas processadas ({(done - skip) / elapsed:.0f} linhas/s)')
+
+            self.stdout.write('Reconstruindo o índice de busca...')
+
+        checkpoint.unlink(missing_ok=True)
+        counters.recount()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{created} livro(s) criado(s), {updated} atualizado(s), {copies} cópia(s) criada(s).'))
+
+    def resolve_authors(self, rows):
+        missing = {
+            key for key in ((row.get('author_first_name', '').strip(), row.get('author_last_name', '').strip())
+                            for row in rows)
+            if any(key) and key not in self.authors
+        }
+        for author in Author.objects.bulk_create(Author(first_name=f, last_name=l) for f, l in missing):
+            self.authors[(author.first_name, author.last_name)] = author.pk
+
+    def resolve_names(self, model, lookup, names):
+        # The first spelling seen wins when names only differ in case
+        missing = {}
+        for name in names:
+            if name.lower() not in lookup:
+                missing.setdefault(name.lower(), name)
+        if not missing:
+            return
+
+        model.objects.bulk_create((model(name=name) for name in missing.values()), ignore_conflicts=True)
+        for pk, name in model.objects.filter(name__in=missing.values()).values_list('pk', 'name'):
+            lookup[name.lower()] = pk
+
+        # Names that already existed with a different case
+        for key, name in missing.items():
+            if key not in lookup:
+                lookup[key] = model.objects.get(name__iexact=name).pk
+
+    def import_batch(self, batch):
+        rows = {}
+        for row in batch:
+            isbn = str(row.get('isbn') or '').strip()
+            if not isbn:
+                raise CommandError(f'Linha sem ISBN: {row}')
+            rows[isbn] = row  # the last row wins for repeated ISBNs
+
+        self.resolve_authors(rows.values())
+        self.resolve_names(Genre, self.genres, [
+            name for row in rows.values() for name in split_names(row.get('genres'))])
+        self.resolve_names(Language, self.languages, [
+            row['language'].strip() for row in rows.values() if (row.get('language') or '').strip()])
+
+        old_authors = dict(Book.objects.filter(isbn__in=rows).values_list('isbn', 'author_id'))
+        existing = set(old_authors)
+        # Copies are only created for new books, all of them available
+        new_copies = {isbn: int(row.get('copies') or 0) for isbn, row in rows.items() if isbn not in existing}
+
+        Book.objects.bulk_create(
+            [
+                Book(
+                    isbn=isbn,
+                    title=row.get('title', ''),
+                    summary=row.get('summary', ''),
+                    author_id=self.authors.get(
+                        (row.get('author_first_name', '').strip(), row.get('author_last_name', '').strip())),
+                    total_copies=new_copies.get(isbn, 0),
+                    available_copies=new_copies.get(isbn, 0),
+                )
+                for isbn, row in rows.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['isbn'],
+            update_fields=['title', 'summary', 'author', 'updated_at'],
+        )
+        book_ids = dict(Book.objects.filter(isbn__in=rows).values_list('isbn', 'pk'))
+
+        # The upsert skips the signals that invalidate the cached fragments
+        author_ids = {self.authors.get((row.get('author_first_name', '').strip(),
+                                        row.get('author_last_name', '').strip())) for row in rows.values()}
+        author_ids.update(old_authors.values())
+        author_ids.discard(None)
+        fragments.bump_many([('book', book_ids[isbn]) for isbn in existing] +
+                            [('author', author_id) for author_id in author_ids])
+
+        Book.genre.through.objects.bulk_create(
+            [
+                Book.genre.through(book_id=book_ids[isbn], genre_id=self.genres[name.lower()])
+                for isbn, row in rows.items()
+                for name in split_names(row.get('genres'))
+            ],
+            ignore_conflicts=True,
+        )
+
+        copies = BookInstance.objects.bulk_create(
+            BookInstance(
+                book_id=book_ids[isbn],
+                imprint=rows[isbn].get('imprint') or '',
+                language_id=self.languages.get((rows[isbn].get('language') or '').strip().lower()),
+                status='a',
+            )
+            for isbn, number in new_copies.items()
+            for _ in range(number)
+        )
+
+        return len(rows) - len(existing), len(existing), len(copies)
@@ -0,0 +1,107 @@
+import itertools
+from datetime import date
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.template.loader import render_to_string
+
+from catalog.models import BookInstance, OverdueNotice
+from catalog.pagination import CursorPaginator
+
+SUBJECT = 'Livros com devolução atrasada'
+
+
+class Command(BaseCommand):
+    help = ('Sends one reminder email per borrower listing their overdue loans, over a '
+            'single connection of the configured EMAIL_BACKEND. Overdue loans are walked in '
+            'keyset chunks by due date, then loaded per batch of borrowers. Every reminder is '
+            'recorded, so reruns only notify loans that became overdue since.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Overdue loans read per query when looking for borrowers.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Borrowers notified (and recorded) per transaction.')
+        parser.add_argument('--date', type=date.fromisoformat, default=None,
+                            help='Treat loans due before this date (YYYY-MM-DD) as overdue; default: today.')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def overdue_loans(self, today):
+        """Overdue loans that were not notified yet."""
+        notified = OverdueNotice.objects.filter(bookinstance=OuterRef('pk'), due_back=OuterRef('due_back'))
+        return (
+            BookInstance.objects.filter(status='o', borrower__isnull=False, due_back__lt=today)
+            .exclude(Exists(notified))
+        )
+
+    def overdue_borrowers(self, loans, chunk_size):
+        """
+        Ids of the borrowers with overdue loans, found by walking the loans in
+        keyset chunks of bookinstance_status_due_idx (status, due_back, id).
+        """
+        borrowers = set()
+        paginator = CursorPaginator(loans.only('id', 'due_back', 'borrower_id'), chunk_size, ['due_back', 'id'],
+                                    count_total=False)
+        page = paginator.page()
+        while True:
+            borrowers.update(loan.borrower_id for loan in page)
+            if not page.has_next():
+                return sorted(borrowers)
+            page = paginator.page(page.next_cursor)
+
+    def handle(self, *args, **options):
+        today = options['date'] or date.today()
+        loans = self.overdue_loans(today)
+        borrowers = self.overdue_borrowers(loans, options['chunk_size'])
+
+        connection = get_connection()
+        connection.open()
+        self.sent = self.notified = self.skipped = 0
+        try:
+            for offset in range(0, len(borrowers), options['batch_size']):
+                batch_loans = (
+                    loans.filter(borrower__in=borrowers[offset:offset + options['batch_size']])
+                    .select_related('book', 'borrower')
+                    .order_by('borrower', 'due_back', 'id')
+                )
+                batch = []
+                for _, group in itertools.groupby(batch_loans, key=lambda loan: loan.borrower_id):
+                    group = list(group)
+                    borrower = group[0].borrower
+                    if borrower.email:
+                        batch.append((self.message(borrower, group, connection), group))
+                    else:
+                        self.skipped += 1
+                self.send(connection, batch, options['dry_run'])
+        finally:
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.sent} lembrete(s) enviado(s), cobrindo {self.notified} empréstimo(s) atrasado(s); '
+            f'{self.skipped} usuário(s) sem e-mail.'
+        ))
+
+    def message(self, borrower, loans, connection):
+        body = render_to_string('catalog/email/overdue_notice.txt', {'borrower': borrower, 'loans': loans})
+        return EmailMessage(SUBJECT, body, to=[borrower.email], connection=connection)
+
+    def send(self, connection, batch, dry_run):
+        if not batch:
+            return
+        messages = [message for message, _ in batch]
+        notices = [
+            OverdueNotice(bookinstance=loan, borrower_id=loan.borrower_id, due_back=loan.due_back)
+            for _, loans in batch for loan in loans
+        ]
+
+        if not dry_run:
+            # The notices are rolled back if sending fails, so that the
+            # loans are picked up again by the next run.
+            with transaction.atomic():
+                OverdueNotice.objects.bulk_create(notices, ignore_conflicts=True)
+                connection.send_messages(messages)
+
+        self.sent += len(messages)
+        self.notified += len(notices)
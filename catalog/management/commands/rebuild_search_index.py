@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the catalog (SQLite FTS5).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if not search.install(options['database']):
+            raise CommandError('Este banco de dados não suporta FTS5.')
+
+        indexed = search.rebuild(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'{indexed} livro(s) indexado(s).'))
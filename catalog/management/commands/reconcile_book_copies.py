@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from catalog.models import Book, BookInstance
+
+
+class Command(BaseCommand):
+    help = ('Recounts the total and available copies stored on every book and fixes '
+            'the ones that drifted, e.g. after copies were written in bulk.')
+
+    def handle(self, *args, **options):
+        copies = (
+            BookInstance.objects.filter(book=OuterRef('pk'))
+            .order_by()
+            .values('book')
+            .annotate(total=Count('pk'), available=Count('pk', filter=Q(status='a')))
+        )
+        total = Coalesce(Subquery(copies.values('total')), Value(0), output_field=IntegerField())
+        available = Coalesce(Subquery(copies.values('available')), Value(0), output_field=IntegerField())
+
+        drifted = Book.objects.filter(~Q(total_copies=total) | ~Q(available_copies=available))
+        updated = drifted.update(
+            total_copies=total, available_copies=available, updated_at=timezone.now())
+
+        self.stdout.write(self.style.SUCCESS(f'Cópias de {updated} livro(s) corrigidas.'))
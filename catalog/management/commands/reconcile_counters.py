@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from catalog import counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts the cached catalog totals shown on the home page and fixes any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Also refreshes the database statistics used to estimate the totals of large lists.')
+
+    def handle(self, *args, **options):
+        drift = counters.reconcile()
+
+        for name, (cached, actual) in drift.items():
+            self.stdout.write(f'{name}: {cached} -> {actual}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Contadores reconciliados ({len(drift)} corrigido(s)).'))
+
+        if options['analyze'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write(self.style.SUCCESS('Estatísticas atualizadas.'))
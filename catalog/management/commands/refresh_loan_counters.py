@@ -0,0 +1,32 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from catalog.models import BookInstance, User
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the active and overdue loan counters of every user. '
+            'Meant to run nightly, so that loans becoming overdue are counted.')
+
+    def handle(self, *args, **options):
+        today = date.today()
+
+        loans = (
+            BookInstance.objects.filter(borrower=OuterRef('pk'))
+            .order_by()
+            .values('borrower')
+            .annotate(
+                active=Count('pk'),
+                overdue=Count('pk', filter=Q(due_back__lt=today)),
+            )
+        )
+
+        updated = User.objects.update(
+            active_loans=Coalesce(Subquery(loans.values('active')), Value(0), output_field=IntegerField()),
+            overdue_loans=Coalesce(Subquery(loans.values('overdue')), Value(0), output_field=IntegerField()),
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'Contadores de {updated} usuário(s) atualizados.'))
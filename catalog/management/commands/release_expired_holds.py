@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import circulation
+from catalog.circulation import CirculationConflict
+from catalog.models import Hold
+from catalog.pagination import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = ('Releases the holds whose copy was not picked up in time: each copy goes to '
+            'the next hold in its queue, or back to the shelf. Meant to run daily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--date', type=date.fromisoformat, default=None,
+                            help='Release holds to be picked up before this date (YYYY-MM-DD); default: today.')
+
+    def handle(self, *args, **options):
+        today = options['date'] or date.today()
+        expired = Hold.objects.filter(status='r', pickup_by__lt=today)
+        # Walks hold_pickup_idx; released holds are deleted behind the cursor
+        paginator = CursorPaginator(expired, options['batch_size'], ['pickup_by', 'id'], count_total=False)
+
+        released = 0
+        page = paginator.page()
+        while True:
+            with transaction.atomic():
+                for hold in page:
+                    try:
+                        circulation.release_hold(hold)
+                    except CirculationConflict:
+                        continue  # Picked up or cancelled meanwhile
+                    released += 1
+
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_cursor)
+
+        self.stdout.write(self.style.SUCCESS(f'{released} reserva(s) expirada(s) liberada(s).'))
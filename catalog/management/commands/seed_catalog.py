@@ -0,0 +1,166 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import counters, search
+from catalog.benchmarks import WORDS
+from catalog.models import Author, Book, BookInstance, Genre, Language, User
+
+LANGUAGES = ['Português', 'Inglês', 'Espanhol', 'Francês', 'Alemão', 'Italiano']
+
+
+class Command(BaseCommand):
+    help = ('Fills the configured database with a synthetic catalog: authors, books '
+            'with genres, copies in every status and users with loans, some of them '
+            'overdue. Rows are bulk-inserted in batches, e.g. for library scale: '
+            '--authors 100000 --books 1000000 --copies 5 --users 50000.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--copies', type=int, default=5,
+                            help='Average number of copies per book.')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--genres', type=int, default=40)
+        parser.add_argument('--loan-rate', type=float, default=0.2,
+                            help='Fraction of the copies that are on loan.')
+        parser.add_argument('--overdue-rate', type=float, default=0.1,
+                            help='Fraction of the loans that are overdue.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def words(self, number):
+        return ' '.join(self.random.choices(WORDS, k=number))
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['random_seed'])
+        self.batch_size = options['batch_size']
+        start = time.perf_counter()
+
+        with search.deferred_indexing():
+            genre_ids = self.seed_genres(options['genres'])
+            language_ids = self.seed_languages()
+            author_ids = self.seed_authors(options['authors'])
+            user_ids = self.seed_users(options['users'])
+            self.seed_books(options, author_ids, genre_ids, language_ids, user_ids)
+
+        counters.recount()
+        call_command('refresh_loan_counters', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Catálogo gerado em {time.perf_counter() - start:.1f}s: '
+            f'{Author.objects.count()} autores, {Book.objects.count()} livros, '
+            f'{BookInstance.objects.count()} exemplares, {User.objects.count()} usuários.'
+        ))
+
+    def seed_genres(self, number):
+        existing = {name.lower() for name in Genre.objects.values_list('name', flat=True)}
+        names = []
+        while len(names) < number:
+            name = self.words(1).capitalize()
+            if name.lower() not in existing:
+                existing.add(name.lower())
+                names.append(name)
+        Genre.objects.bulk_create(Genre(name=name) for name in names)
+        return list(Genre.objects.values_list('pk', flat=True))
+
+    def seed_languages(self):
+        existing = {name.lower() for name in Language.objects.values_list('name', flat=True)}
+        Language.objects.bulk_create(Language(name=name) for name in LANGUAGES if name.lower() not in existing)
+        return list(Language.objects.values_list('pk', flat=True))
+
+    def seed_authors(self, number):
+        for offset in range(0, number, self.batch_size):
+            size = min(self.batch_size, number - offset)
+            authors = []
+            for _ in range(size):
+                born = date(self.random.randint(1800, 1990), self.random.randint(1, 12), self.random.randint(1, 28))
+                died = born + timedelta(days=365 * self.random.randint(30, 90)) if born.year < 1940 else None
+                authors.append(Author(
+                    first_name=self.words(1).capitalize(),
+                    last_name=self.words(1).capitalize(),
+                    date_of_birth=born,
+                    date_of_death=died,
+                ))
+            Author.objects.bulk_create(authors)
+            self.stdout.write(f'{offset + size}/{number} autores criados')
+        return list(Author.objects.values_list('pk', flat=True))
+
+    def seed_users(self, number):
+        start = User.objects.filter(username__startswith='leitor').count()
+        password = make_password(None)
+        for offset in range(0, number, self.batch_size):
+            size = min(self.batch_size, number - offset)
+            User.objects.bulk_create(
+                User(username=f'leitor{start + offset + i}', password=password)
+                for i in range(size)
+            )
+        self.stdout.write(f'{number} usuários criados')
+        return list(User.objects.values_list('pk', flat=True))
+
+    def seed_books(self, options, author_ids, genre_ids, language_ids, user_ids):
+        number = options['books']
+        last_isbn = (
+            Book.objects.filter(isbn__startswith='s')
+            .order_by('-isbn').values_list('isbn', flat=True).first()
+        )
+        start = int(last_isbn[1:]) + 1 if last_isbn else 0
+        book_genres = Book.genre.through
+        today = date.today()
+
+        for offset in range(0, number, self.batch_size):
+            size = min(self.batch_size, number - offset)
+            books = []
+            copies_per_book = []
+            for i in range(size):
+                copies = [
+                    self.copy(options, language_ids, user_ids, today)
+                    for _ in range(self.random.randint(1, 2 * options['copies'] - 1) if options['copies'] else 0)
+                ]
+                books.append(Book(
+                    title=self.words(self.random.randint(1, 4)).capitalize(),
+                    summary=self.words(40),
+                    isbn=f's{start + offset + i:012d}',
+                    author_id=self.random.choice(author_ids) if author_ids else None,
+                    total_copies=len(copies),
+                    available_copies=sum(copy.status == 'a' for copy in copies),
+                ))
+                copies_per_book.append(copies)
+
+            with transaction.atomic():
+                Book.objects.bulk_create(books)
+
+                genres = []
+                copies = []
+                for book, book_copies in zip(books, copies_per_book):
+                    for genre_id in self.random.sample(genre_ids, min(len(genre_ids), self.random.randint(1, 3))):
+                        genres.append(book_genres(book_id=book.pk, genre_id=genre_id))
+                    for copy in book_copies:
+                        copy.book_id = book.pk
+                        copies.append(copy)
+
+                book_genres.objects.bulk_create(genres, batch_size=self.batch_size)
+                BookInstance.objects.bulk_create(copies, batch_size=self.batch_size)
+            self.stdout.write(f'{offset + size}/{number} livros criados')
+
+    def copy(self, options, language_ids, user_ids, today):
+        copy = BookInstance(
+            imprint=f'{self.words(2).title()}, {self.random.randint(1950, 2024)}',
+            language_id=self.random.choice(language_ids),
+        )
+        roll = self.random.random()
+        if user_ids and roll < options['loan_rate']:
+            copy.status = 'o'
+            copy.borrower_id = self.random.choice(user_ids)
+            if self.random.random() < options['overdue_rate']:
+                copy.due_back = today - timedelta(days=self.random.randint(1, 60))
+            else:
+                copy.due_back = today + timedelta(days=self.random.randint(0, 28))
+        elif roll < options['loan_rate'] + 0.02:
+            copy.status = 'm'
+        return copy
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import replicas
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary SQLite database to the read replicas (CATALOG_READ_REPLICAS) '
+            'with the SQLite backup API: a stand-in for replication when running locally.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep copying every this many seconds, simulating replication lag.')
+
+    def sync(self, aliases):
+        for alias in aliases:
+            start = time.perf_counter()
+            try:
+                replicas.sync_replica(alias)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f'{alias}: {(time.perf_counter() - start) * 1000:.1f}ms')
+
+    def handle(self, *args, **options):
+        aliases = getattr(settings, 'CATALOG_READ_REPLICAS', [])
+        if not aliases:
+            raise CommandError('Nenhuma réplica configurada (CATALOG_READ_REPLICAS).')
+
+        interval = options['interval']
+        if interval is None:
+            self.sync(aliases)
+            self.stdout.write(self.style.SUCCESS(f'{len(aliases)} réplica(s) sincronizada(s).'))
+            return
+
+        while True:
+            self.sync(aliases)
+            time.sleep(interval)
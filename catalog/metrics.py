@@ -0,0 +1,240 @@
+"""
+Per-view request metrics, exposed in the Prometheus text format.
+
+MetricsMiddleware times every request and, through a database execute
+wrapper and a timed template backend, also counts ORM queries, DB time and
+template render time. The totals are aggregated by URL name in an
+in-process store (one per worker process; Prometheus scrapes and sums
+every worker) and served by the staff-only ``metrics`` view.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_current = ContextVar('catalog_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.counts = self.counts.copy()
+        histogram.sum = self.sum
+        return histogram
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class ViewMetrics:
+    __slots__ = ('latency', 'queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def copy(self):
+        metrics = ViewMetrics()
+        metrics.latency = self.latency.copy()
+        metrics.queries = self.queries.copy()
+        metrics.db_time = self.db_time
+        metrics.template_time = self.template_time
+        return metrics
+
+
+class MetricsStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, duration, stats):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics()
+            metrics.latency.observe(duration)
+            metrics.queries.observe(stats.queries)
+            metrics.db_time += stats.db_time
+            metrics.template_time += stats.template_time
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def snapshot(self):
+        """Copies of the metrics of every view, consistent with each other."""
+        with self._lock:
+            return {view: metrics.copy() for view, metrics in sorted(self._views.items())}
+
+
+store = MetricsStore()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting the queries of the current request."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The regular Django template backend, timing each template it renders."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match and match.view_name else '<unresolved>'
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'CATALOG_METRICS_ENABLED', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+            store.record(view_label(request), time.perf_counter() - start, stats)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            _current.reset(token)
+            store.record(view_label(request), time.perf_counter() - start, stats)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name, help_text, histograms):
+    yield f'# HELP {name} {help_text}'
+    yield f'# TYPE {name} histogram'
+    for view, histogram in histograms:
+        label = f'view="{_label(view)}"'
+        for bound, count in histogram.cumulative():
+            yield f'{name}_bucket{{{label},le="{bound}"}} {count}'
+        yield f'{name}_sum{{{label}}} {_number(histogram.sum)}'
+        yield f'{name}_count{{{label}}} {histogram.count}'
+
+
+def _counter_lines(name, help_text, values):
+    yield f'# HELP {name} {help_text}'
+    yield f'# TYPE {name} counter'
+    for view, value in values:
+        yield f'{name}{{view="{_label(view)}"}} {_number(value)}'
+
+
+def render_prometheus(metrics=None):
+    metrics = store.snapshot() if metrics is None else metrics
+    lines = []
+    lines += _histogram_lines(
+        'catalog_request_duration_seconds', 'Request latency by URL name.',
+        [(view, m.latency) for view, m in metrics.items()])
+    lines += _histogram_lines(
+        'catalog_request_queries', 'ORM queries per request by URL name.',
+        [(view, m.queries) for view, m in metrics.items()])
+    lines += _counter_lines(
+        'catalog_db_duration_seconds_total', 'Time spent running ORM queries by URL name.',
+        [(view, m.db_time) for view, m in metrics.items()])
+    lines += _counter_lines(
+        'catalog_template_render_seconds_total', 'Time spent rendering templates by URL name.',
+        [(view, m.template_time) for view, m in metrics.items()])
+    return '\n'.join(lines) + '\n'
@@ -4,21 +4,30 @@ from datetime import date
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import Index, Q, UniqueConstraint
 from django.db.models.functions import Lower
 from django.urls import reverse
 
 
 class User(AbstractUser):
+    # Kept up to date by catalog.signals whenever a copy changes borrower or
+    # due date, and refreshed nightly by ``manage.py refresh_loan_counters``.
+    active_loans = models.PositiveIntegerField('Empréstimos ativos', default=0, editable=False)
+    overdue_loans = models.PositiveIntegerField('Empréstimos atrasados', default=0, editable=False)
+
+    MAX_ACTIVE_LOANS = 3
+    MAX_OVERDUE_LOANS = 1
+
     @property
-    def can_borrow_book(self):
-        if self.bookinstance_set.count() >= 3:
-            return False
-        
-        if self.bookinstance_set.filter(due_back__lt=date.today()).count() > 1:
-            return False
+    def loans_left(self):
+        """How many more copies the user may borrow."""
+        if self.overdue_loans > self.MAX_OVERDUE_LOANS:
+            return 0
+        return max(self.MAX_ACTIVE_LOANS - self.active_loans, 0)
 
-        return True
+    @property
+    def can_borrow_book(self):
+        return self.loans_left > 0
 
 class Genre(models.Model):
     name = models.CharField(
@@ -53,6 +62,22 @@ class Book(models.Model):
                             help_text='<a href="https://www.isbn-international.org/content/what-isbn'
                                       '">Número ISBN</a>')
     genre = models.ManyToManyField('Genre', verbose_name='Gênero', help_text='Selecione os gêneros')
+    # Maintained by catalog.signals; fixed by manage.py reconcile_book_copies
+    total_copies = models.PositiveIntegerField('Cópias', default=0, editable=False)
+    available_copies = models.PositiveIntegerField('Cópias disponíveis', default=0, editable=False)
+    updated_at = models.DateTimeField('Atualizado em', auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # BookListView, ordered by title
+            Index(fields=['title', 'id'], name='book_title_idx'),
+            # BookListView, most available first
+            Index(fields=['-available_copies', 'title', 'id'], name='book_availability_idx'),
+            # BookListView, only books with available copies, by title
+            Index(fields=['title', 'id'], condition=Q(available_copies__gt=0), name='book_available_title_idx'),
+            # Books listed on AuthorDetailView, and the per-author book counts
+            Index(fields=['author', 'title', 'id'], name='book_author_title_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -73,6 +98,7 @@ class BookInstance(models.Model):
     language = models.ForeignKey(
         'Language', on_delete=models.RESTRICT, verbose_name='Idioma', null=True)
     borrower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField('Atualizado em', auto_now=True, db_index=True)
 
 
     LOAN_STATUS = (
@@ -93,6 +119,16 @@ class BookInstance(models.Model):
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Set book as returned"),)
+        indexes = [
+            # AllBorrowedBooksView and the available-copies count
+            Index(fields=['status', 'due_back', 'id'], name='bookinstance_status_due_idx'),
+            # LoanedBooksByUserListView and the per-user loan counters
+            Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinstance_borrower_idx'),
+            # Copies listed on BookDetailView
+            Index(fields=['book', 'due_back', 'id'], name='bookinstance_book_due_idx'),
+            # The admin changelist, in due date order
+            Index(fields=['due_back', 'id'], name='bookinstance_due_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id} ({self.book.title})'
@@ -109,9 +145,13 @@ class Author(models.Model):
     last_name = models.CharField('Último nome', max_length=100)
     date_of_birth = models.DateField('Data de nascimento', null=True, blank=True)
     date_of_death = models.DateField('Data de morte', null=True, blank=True)
+    updated_at = models.DateTimeField('Atualizado em', auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            Index(fields=['last_name', 'first_name', 'id'], name='author_name_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('author', args=[str(self.id)])
@@ -141,3 +181,58 @@ class Language(models.Model):
                 violation_error_message='Linguagem já existe'
             ),
         ]
+
+
+class Hold(models.Model):
+    """
+    A patron's place in a book's FIFO hold queue. While waiting, the hold has
+    no copy; once a returned copy is set aside for it (status 'r'), it is
+    ready until ``pickup_by``.
+    """
+    HOLD_STATUS = (
+        ('w', 'Na fila'),
+        ('r', 'Aguardando retirada'),
+    )
+
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, verbose_name='Livro')
+    patron = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Usuário')
+    status = models.CharField(max_length=1, choices=HOLD_STATUS, default='w')
+    created_at = models.DateTimeField('Criada em', auto_now_add=True)
+    bookinstance = models.OneToOneField(
+        'BookInstance', on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Cópia')
+    pickup_by = models.DateField('Retirar até', null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        constraints = [
+            UniqueConstraint(fields=['book', 'patron'], name='hold_unique_patron',
+                             violation_error_message='Você já tem uma reserva deste livro'),
+        ]
+        indexes = [
+            # Head of a book's queue: only waiting holds are indexed
+            Index(fields=['book', 'created_at', 'id'], condition=Q(status='w'), name='hold_queue_idx'),
+            # A patron's holds, listed by LoanedBooksByUserListView
+            Index(fields=['patron', 'created_at', 'id'], name='hold_patron_idx'),
+            # Ready holds past their pickup date (release_expired_holds)
+            Index(fields=['pickup_by', 'id'], condition=Q(status='r'), name='hold_pickup_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.book} ({self.patron})'
+
+
+class OverdueNotice(models.Model):
+    """An overdue reminder sent for a loan, recorded by process_overdue."""
+    bookinstance = models.ForeignKey('BookInstance', on_delete=models.CASCADE, verbose_name='Cópia')
+    borrower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Usuário')
+    # A renewed loan gets a new due date, and a new notice once it is overdue again
+    due_back = models.DateField('Prazo de devolução')
+    sent_at = models.DateTimeField('Enviado em', auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['bookinstance', 'due_back'], name='overdue_notice_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.bookinstance_id} ({self.due_back})'
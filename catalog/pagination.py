@@ -0,0 +1,393 @@
+"""
+Keyset (cursor) pagination for the catalog list views.
+
+Instead of ``OFFSET``, each page is fetched with a ``WHERE`` clause on the
+values of the view's ordering columns at the edge of the previous page, so
+deep pages cost the same as the first one. The position is handed to the
+client as an opaque, signed cursor token.
+
+The mode is chosen by ``settings.CATALOG_PAGINATION_MODE``:
+
+* ``'offset'`` - Django's regular paginator (``?page=``); a ``?cursor=``
+  parameter still switches to keyset pagination.
+* ``'cursor'`` - keyset pagination, with the total count.
+* ``'cursor-nocount'`` - keyset pagination without the ``COUNT(*)`` query.
+
+EstimatedCountPaginator is an offset paginator for large tables, whose
+total comes from the cached counters or the database statistics instead of
+``COUNT(*)``; the list views use it in offset mode.
+"""
+import hashlib
+from functools import cached_property
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.paginator import EmptyPage, InvalidPage, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import F, Q, QuerySet
+from django.http import Http404
+from django.utils.translation import gettext as _
+
+from catalog import counters
+
+CURSOR_SALT = 'catalog.pagination.cursor'
+
+OFFSET = 'offset'
+CURSOR = 'cursor'
+CURSOR_NOCOUNT = 'cursor-nocount'
+
+COUNT_CACHE_PREFIX = 'catalog:pagination:count:'
+
+# Seconds
+DEFAULT_COUNT_CACHE_TIMEOUT = 300
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    is_cursor = True
+    number = None
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self)} items>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    def __init__(self, object_list, per_page, ordering, count_total=True):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.count_total = count_total
+        self.fields = []
+        self.descending = []
+
+        for name in ordering:
+            descending = name.startswith('-')
+            field = object_list.model._meta.get_field(name.removeprefix('-'))
+            if descending and field.null:
+                raise ImproperlyConfigured('A paginação por cursor só aceita ordenação decrescente em campos não nulos.')
+            self.fields.append(field)
+            self.descending.append(descending)
+
+    @cached_property
+    def count(self):
+        """Total number of objects, or None when counting is disabled."""
+        if not self.count_total:
+            return None
+        return self.object_list.count()
+
+    @cached_property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, -(-self.count // self.per_page))
+
+    def encode_cursor(self, obj, direction):
+        values = []
+        for field in self.fields:
+            if isinstance(obj, dict):
+                # A row of a values() queryset
+                value = obj[field.name]
+                values.append(None if value is None else str(value))
+            else:
+                value = field.value_from_object(obj)
+                values.append(None if value is None else field.value_to_string(obj))
+
+        return signing.dumps([direction, values], salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, values = signing.loads(cursor, salt=CURSOR_SALT)
+            if direction not in ('n', 'p') or len(values) != len(self.fields):
+                raise ValueError
+            values = [
+                None if value is None else field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (signing.BadSignature, TypeError, ValueError, ValidationError) as e:
+            raise InvalidCursor(_('Cursor inválido')) from e
+
+        return direction, values
+
+    def _order_by(self, reverse=False):
+        expressions = []
+        for field, descending in zip(self.fields, self.descending):
+            if not field.null:
+                expressions.append(F(field.name).desc() if reverse != descending else F(field.name).asc())
+            elif reverse:
+                expressions.append(F(field.name).desc(nulls_last=True))
+            else:
+                expressions.append(F(field.name).asc(nulls_first=True))
+        return expressions
+
+    def _seek(self, values, reverse=False):
+        """Rows strictly after (or before, when reversed) the given key, nulls first."""
+        condition = Q(pk__in=[])
+        equal = Q()
+
+        for field, descending, value in zip(self.fields, self.descending, values):
+            name = field.name
+            # Descending fields are never null
+            if descending:
+                condition |= equal & Q(**{f"{name}__{'gt' if reverse else 'lt'}": value})
+            elif reverse:
+                if value is not None:
+                    step = Q(**{f'{name}__lt': value})
+                    if field.null:
+                        step |= Q(**{f'{name}__isnull': True})
+                    condition |= equal & step
+            elif value is None:
+                condition |= equal & Q(**{f'{name}__isnull': False})
+            else:
+                condition |= equal & Q(**{f'{name}__gt': value})
+
+            equal &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+
+        # A redundant range on the first column lets the database walk the
+        # index from the cursor instead of expanding the OR and sorting.
+        first, value = self.fields[0], values[0]
+        if value is not None and not (reverse and first.null):
+            lookup = 'lte' if reverse != self.descending[0] else 'gte'
+            condition &= Q(**{f'{first.name}__{lookup}': value})
+
+        return condition
+
+    def _page_query(self, cursor):
+        direction, values = self.decode_cursor(cursor) if cursor else ('n', None)
+        reverse = direction == 'p'
+
+        queryset = self.object_list.order_by(*self._order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, reverse))
+
+        return queryset[:self.per_page + 1], values is not None, reverse
+
+    def _make_page(self, rows, has_cursor, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = self.encode_cursor(rows[-1], 'n')
+            if (has_more and reverse) or (has_cursor and not reverse):
+                previous_cursor = self.encode_cursor(rows[0], 'p')
+
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        queryset, has_cursor, reverse = self._page_query(cursor)
+        return self._make_page(list(queryset), has_cursor, reverse)
+
+    async def apage(self, cursor=None):
+        queryset, has_cursor, reverse = self._page_query(cursor)
+        if self.count_total:
+            self.count = await self.object_list.acount()
+        return self._make_page([obj async for obj in queryset], has_cursor, reverse)
+
+
+def is_whole_table(queryset):
+    query = queryset.query
+    return not (query.where or query.distinct or query.combinator or query.is_sliced)
+
+
+def estimated_count(queryset):
+    """
+    Number of rows of a whole table, as recorded by ANALYZE in SQLite's
+    sqlite_stat1, without counting them. None for filtered querysets, other
+    databases or tables without statistics.
+    """
+    if not is_whole_table(queryset):
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'sqlite':
+        return None
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+    except DatabaseError:  # no sqlite_stat1 before the first ANALYZE
+        return None
+    # The first number of every row is the number of rows in the table
+    return int(row[0].split()[0]) if row else None
+
+
+def cached_count(queryset):
+    """queryset.count(), cached for CATALOG_COUNT_CACHE_TIMEOUT seconds."""
+    sql, params = queryset.query.sql_with_params()
+    key = COUNT_CACHE_PREFIX + hashlib.md5(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest()
+
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, getattr(settings, 'CATALOG_COUNT_CACHE_TIMEOUT', DEFAULT_COUNT_CACHE_TIMEOUT))
+    return total
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids COUNT(*) over large sets. The total of an unfiltered
+    queryset comes from catalog.counters or, for tables without a counter,
+    from the database statistics (see estimated_count) once they say the
+    table is large. Other querysets are counted exactly up to
+    exact_count_limit rows; larger totals are cached for
+    CATALOG_COUNT_CACHE_TIMEOUT seconds.
+
+    Such totals may be off, so each page fetches one extra row and corrects
+    the count once it reaches the end of the list.
+    """
+    exact_count_limit = 10000
+    count_is_exact = True
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+
+        self.count_is_exact = False
+        if is_whole_table(queryset):
+            total = counters.table_count(queryset.model)
+            if total is not None:
+                return total
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate >= self.exact_count_limit:
+                return estimate
+
+        total = queryset.order_by()[:self.exact_count_limit + 1].count()
+        if total <= self.exact_count_limit:
+            self.count_is_exact = True
+            return total
+        return cached_count(queryset)
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # A short estimate must not hide the last pages: page() finds out
+            if self.count_is_exact or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_is_exact:
+            return super().page(number)
+
+        bottom = (number - 1) * self.per_page
+        return self._estimated_page(list(self.object_list[bottom:bottom + self.per_page + 1]), number)
+
+    async def apage(self, number):
+        """Async version of page(), for querysets."""
+        # Sets count and count_is_exact
+        await sync_to_async(lambda: self.count)()
+        number = self.validate_number(number)
+
+        bottom = (number - 1) * self.per_page
+        if self.count_is_exact:
+            top = bottom + self.per_page
+            if top + self.orphans >= self.count:
+                top = self.count
+            rows = [obj async for obj in self.object_list[bottom:top]]
+            return self._get_page(rows, number, self)
+
+        rows = [obj async for obj in self.object_list[bottom:bottom + self.per_page + 1]]
+        return self._estimated_page(rows, number)
+
+    def _estimated_page(self, rows, number):
+        """The page of the first per_page rows, fetched with one extra row."""
+        bottom = (number - 1) * self.per_page
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        if len(rows) <= self.per_page or number >= self.num_pages:
+            # Either the real end of the list, or more rows than estimated
+            self.count = bottom + len(rows)
+            self.__dict__.pop('num_pages', None)
+        return self._get_page(rows[:self.per_page], number, self)
+
+
+async def apaginate(queryset, request, per_page, ordering, mode=None, page_kwarg='page', cursor_kwarg='cursor'):
+    """
+    Async counterpart of CursorPaginationMixin.paginate_queryset, for views
+    using the async ORM. Returns (paginator, page, is_paginated).
+    """
+    mode = mode or getattr(settings, 'CATALOG_PAGINATION_MODE', OFFSET)
+    cursor = request.GET.get(cursor_kwarg)
+
+    if mode == OFFSET and cursor is None:
+        paginator = EstimatedCountPaginator(queryset.order_by(*ordering), per_page)
+        try:
+            page = await paginator.apage(request.GET.get(page_kwarg) or 1)
+        except InvalidPage as e:
+            raise Http404(str(e))
+    else:
+        paginator = CursorPaginator(queryset, per_page, ordering, count_total=mode != CURSOR_NOCOUNT)
+        try:
+            page = await paginator.apage(cursor)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+
+    return paginator, page, page.has_other_pages()
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin that paginates with CursorPaginator, keyed on the view's
+    ordering, when the configured mode (or a ``?cursor=`` parameter) asks for it.
+    The ordering must end with a unique field, e.g. ``['due_back', 'id']``, and
+    only non-null fields can be in descending order.
+    """
+    pagination_mode = None
+    cursor_kwarg = 'cursor'
+
+    def get_pagination_mode(self):
+        if self.pagination_mode is not None:
+            return self.pagination_mode
+        return getattr(settings, 'CATALOG_PAGINATION_MODE', OFFSET)
+
+    def paginate_queryset(self, queryset, page_size):
+        mode = self.get_pagination_mode()
+        cursor = self.request.GET.get(self.cursor_kwarg)
+
+        if mode == OFFSET and cursor is None:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(
+            queryset, page_size, self.get_ordering(), count_total=mode != CURSOR_NOCOUNT)
+        try:
+            page = paginator.page(cursor)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+
+        return (paginator, page, page.object_list, page.has_other_pages())
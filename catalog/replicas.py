@@ -0,0 +1,134 @@
+"""
+Read replicas for the catalog browsing views.
+
+Views decorated with ``read_from_replica`` read the catalog tables (every
+model of the app except the user model) from one of the database aliases in
+``settings.CATALOG_READ_REPLICAS``; everything else, writes included, goes
+to ``default``. Sessions and users are always read from ``default``, so that
+a login is seen at once.
+
+Replicas lag behind the primary, so a client that has just written (any
+unsafe request: borrowing, returning or renewing a copy, editing the
+catalog...) gets a cookie from ReplicaStickinessMiddleware, and reads from
+the primary for ``CATALOG_PRIMARY_STICKY_SECONDS`` seconds.
+
+With SQLite, ``manage.py sync_replica`` stands in for replication, copying
+the primary to the replica files with the backup API.
+"""
+import random
+import sqlite3
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_COOKIE = 'catalog_primary'
+
+# Seconds
+DEFAULT_STICKY_SECONDS = 10
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_replica = ContextVar('catalog_replica', default=None)
+
+
+def choose_replica(request):
+    """The replica alias the request reads from, or None for the primary."""
+    replicas = getattr(settings, 'CATALOG_READ_REPLICAS', [])
+    if not replicas or request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES:
+        return None
+    return random.choice(replicas)
+
+
+def current_replica():
+    """The replica the current request reads from, or None for the primary."""
+    return _replica.get()
+
+
+def read_from_replica(view):
+    """Routes the catalog reads of a (sync or async) view to a replica."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            token = _replica.set(choose_replica(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica.reset(token)
+    else:
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            token = _replica.set(choose_replica(request))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _replica.reset(token)
+    return inner
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'catalog' or model._meta.label == settings.AUTH_USER_MODEL:
+            return None
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema by replication
+        return db not in getattr(settings, 'CATALOG_READ_REPLICAS', [])
+
+
+class ReplicaStickinessMiddleware:
+    """Sends clients that just wrote to the primary for a while."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.stick(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.stick(request, await self.get_response(request))
+
+    def stick(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1',
+                max_age=getattr(settings, 'CATALOG_PRIMARY_STICKY_SECONDS', DEFAULT_STICKY_SECONDS),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+def copy_database(path, source=DEFAULT_DB_ALIAS):
+    """Copies the source SQLite database to the file at path."""
+    connection = connections[source]
+    if connection.vendor != 'sqlite':
+        raise ValueError('Só é possível copiar bancos SQLite.')
+
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+
+
+def sync_replica(alias, source=DEFAULT_DB_ALIAS):
+    if connections[alias].vendor != 'sqlite':
+        raise ValueError('Só é possível sincronizar réplicas SQLite.')
+    copy_database(connections[alias].settings_dict['NAME'], source)
@@ -0,0 +1,252 @@
+"""
+Full-text search over the catalog, backed by an SQLite FTS5 virtual table.
+
+``catalog_book_fts`` holds one document per book (title, summary, author name
+and genre names), keyed by the book id. It is created after ``migrate`` and
+kept in sync by SQL triggers, so that bulk writes that skip model signals are
+indexed too. ``manage.py rebuild_search_index`` rebuilds it from scratch.
+
+On other databases, or SQLite builds without FTS5, search falls back to
+``icontains`` lookups.
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.models import Q
+
+from catalog.models import Author, Book, Genre
+
+FTS_TABLE = 'catalog_book_fts'
+
+# bm25 weights for title, summary, authors and genres
+RANK = f'bm25({FTS_TABLE}, 10.0, 1.0, 5.0, 2.0)'
+
+
+def _tables():
+    return {
+        'fts': FTS_TABLE,
+        'book': Book._meta.db_table,
+        'author': Author._meta.db_table,
+        'genre': Genre._meta.db_table,
+        'book_genre': Book.genre.through._meta.db_table,
+    }
+
+
+def _author_name(author_id):
+    return (
+        "(SELECT first_name || ' ' || last_name FROM {author} "
+        f"WHERE id = {author_id})"
+    )
+
+
+def _genre_names(book_id):
+    return (
+        "(SELECT group_concat(g.name, ' ') FROM {book_genre} bg "
+        f"JOIN {{genre}} g ON g.id = bg.genre_id WHERE bg.book_id = {book_id})"
+    )
+
+
+def _insert_document(book):
+    return (
+        "INSERT INTO {fts}(rowid, title, summary, authors, genres) "
+        f"VALUES ({book}.id, {book}.title, {book}.summary, "
+        f"{_author_name(f'{book}.author_id')}, {_genre_names(f'{book}.id')});"
+    )
+
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+    "title, summary, authors, genres, tokenize = 'unicode61 remove_diacritics 2')",
+
+    "CREATE TRIGGER IF NOT EXISTS {fts}_book_ai AFTER INSERT ON {book} BEGIN "
+    + _insert_document('new') + " END",
+
+    # Only on the indexed columns: the copy counters of a book change on
+    # every loan, and reindexing it each time would be wasted work
+    "CREATE TRIGGER IF NOT EXISTS {fts}_book_au AFTER UPDATE OF title, summary, author_id ON {book} BEGIN "
+    "DELETE FROM {fts} WHERE rowid = old.id; " + _insert_document('new') + " END",
+
+    "CREATE TRIGGER IF NOT EXISTS {fts}_book_ad AFTER DELETE ON {book} BEGIN "
+    "DELETE FROM {fts} WHERE rowid = old.id; END",
+
+    "CREATE TRIGGER IF NOT EXISTS {fts}_book_genre_ai AFTER INSERT ON {book_genre} BEGIN "
+    f"UPDATE {{fts}} SET genres = {_genre_names('new.book_id')} WHERE rowid = new.book_id; END",
+
+    "CREATE TRIGGER IF NOT EXISTS {fts}_book_genre_ad AFTER DELETE ON {book_genre} BEGIN "
+    f"UPDATE {{fts}} SET genres = {_genre_names('old.book_id')} WHERE rowid = old.book_id; END",
+
+    "CREATE TRIGGER IF NOT EXISTS {fts}_author_au AFTER UPDATE OF first_name, last_name ON {author} BEGIN "
+    "UPDATE {fts} SET authors = new.first_name || ' ' || new.last_name "
+    "WHERE rowid IN (SELECT id FROM {book} WHERE author_id = new.id); END",
+
+    "CREATE TRIGGER IF NOT EXISTS {fts}_genre_au AFTER UPDATE OF name ON {genre} BEGIN "
+    f"UPDATE {{fts}} SET genres = {_genre_names(f'{{fts}}.rowid')} "
+    "WHERE rowid IN (SELECT book_id FROM {book_genre} WHERE genre_id = new.id); END",
+]
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _drop_triggers(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name GLOB %s",
+            [FTS_TABLE + '_*'])
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'DROP TRIGGER {connection.ops.quote_name(name)}')
+
+
+def install(using=DEFAULT_DB_ALIAS):
+    """Creates the FTS5 table and its triggers, if the database supports them."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+            return False
+
+        # Triggers created by older versions of this module are replaced
+        _drop_triggers(connection)
+        tables = _tables()
+        for statement in SCHEMA:
+            cursor.execute(statement.format(**tables))
+
+    return True
+
+
+def install_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate handler."""
+    install(using)
+
+
+def rebuild(using=DEFAULT_DB_ALIAS):
+    """Reindexes every book and returns how many were indexed."""
+    if not install(using):
+        return 0
+
+    tables = _tables()
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM {fts}'.format(**tables))
+        cursor.execute((
+            'INSERT INTO {fts}(rowid, title, summary, authors, genres) '
+            f"SELECT b.id, b.title, b.summary, {_author_name('b.author_id')}, {_genre_names('b.id')} "
+            'FROM {book} b'
+        ).format(**tables))
+        cursor.execute("INSERT INTO {fts}({fts}) VALUES ('optimize')".format(**tables))
+        cursor.execute('SELECT count(*) FROM {fts}'.format(**tables))
+        return cursor.fetchone()[0]
+
+
+@contextmanager
+def deferred_indexing(using=DEFAULT_DB_ALIAS):
+    """
+    Drops the sync triggers for the duration of a bulk load and rebuilds the
+    index afterwards, which is much faster than indexing row by row.
+    """
+    if not is_available(using):
+        yield
+        return
+
+    _drop_triggers(connections[using])
+    try:
+        yield
+    finally:
+        rebuild(using)
+
+
+def match_expression(query):
+    """Turns user input into an FTS5 query: every word must match, as a prefix."""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class SearchResults:
+    """
+    Ranked search results, sliceable and countable so that they can be handed
+    to Django's Paginator. Only the requested page of books is loaded.
+    """
+    model = Book
+
+    def __init__(self, query, using=None, available_only=False):
+        self.query = query
+        self.expression = match_expression(query)
+        self.using = using or router.db_for_read(Book)
+        self.available_only = available_only
+        self._count = None
+
+    def _from(self):
+        if not self.available_only:
+            return f'{FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        return (
+            f'{FTS_TABLE} JOIN {Book._meta.db_table} ON {Book._meta.db_table}.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s AND {Book._meta.db_table}.available_copies > 0'
+        )
+
+    def count(self):
+        if self._count is None:
+            if not self.expression:
+                self._count = 0
+            else:
+                with connections[self.using].cursor() as cursor:
+                    cursor.execute(f'SELECT count(*) FROM {self._from()}', [self.expression])
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k:k + 1][0]
+
+        start = k.start or 0
+        if k.stop is None or not self.expression:
+            return []
+
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT {FTS_TABLE}.rowid FROM {self._from()} '
+                f'ORDER BY {RANK} LIMIT %s OFFSET %s',
+                [self.expression, k.stop - start, start])
+            ids = [row[0] for row in cursor.fetchall()]
+
+        books = Book.objects.using(self.using).select_related('author').in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
+
+
+def search_books(query, using=None, available_only=False):
+    """
+    Returns the books matching ``query``, best matches first; only those with
+    an available copy if ``available_only``. Reads the database the routers
+    send Book reads to, unless ``using`` is given.
+    """
+    using = using or router.db_for_read(Book)
+    if is_available(using):
+        return SearchResults(query, using, available_only)
+
+    condition = Q()
+    for word in re.findall(r'\w+', query):
+        condition &= (
+            Q(title__icontains=word) | Q(summary__icontains=word)
+            | Q(author__first_name__icontains=word) | Q(author__last_name__icontains=word)
+            | Q(genre__name__icontains=word)
+        )
+
+    if not condition:
+        return Book.objects.none()
+    if available_only:
+        condition &= Q(available_copies__gt=0)
+
+    return Book.objects.using(using).filter(condition).select_related('author').distinct().order_by('title', 'id')
@@ -0,0 +1,49 @@
+"""
+Cached, database-backed sessions that coalesce database writes.
+
+Like Django's ``cached_db`` engine, sessions are read from the cache and
+fall back to the database. But a session is only written to the database
+when it is created (which includes logging in, as the key is cycled) or
+when its database copy is older than ``CATALOG_SESSION_WRITE_INTERVAL``
+seconds; in between, changes only go to the cache. If the cache loses a
+session, up to that many seconds of changes to it are lost, never the login
+itself.
+
+Use it with a cache shared by every worker process, e.g.
+``CATALOG_SESSION_ENGINE=coalescing`` with Redis or Memcached.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+KEY_PREFIX = 'catalog.sessions'
+
+# Seconds
+DEFAULT_WRITE_INTERVAL = 60
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    @property
+    def saved_key(self):
+        return f'{self.cache_key}:saved'
+
+    def _write_due(self):
+        interval = getattr(settings, 'CATALOG_SESSION_WRITE_INTERVAL', DEFAULT_WRITE_INTERVAL)
+        saved = self._cache.get(self.saved_key)
+        return saved is None or time.time() - saved >= interval
+
+    def save(self, must_create=False):
+        if must_create or self.session_key is None or self._write_due():
+            super().save(must_create)
+            self._cache.set(self.saved_key, time.time(), self.get_expiry_age())
+        else:
+            self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        super().delete(session_key)
+        if key is not None:
+            self._cache.delete(f'{self.cache_key_prefix}{key}:saved')
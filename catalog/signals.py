@@ -0,0 +1,253 @@
+from collections import Counter, defaultdict, namedtuple
+from datetime import date
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from catalog import counters, fragments
+from catalog.models import Author, Book, BookInstance, Genre, Language, User
+
+CopyState = namedtuple('CopyState', ['book_id', 'status', 'borrower_id', 'due_back'])
+
+# Sent whenever a BookInstance is created, deleted or changes state, either
+# through the ORM (save/delete) or through code that writes rows in bulk.
+# ``changes`` is a list of (old, new) CopyState pairs; ``old`` is None for
+# created copies and ``new`` is None for deleted ones.
+copies_changed = Signal()
+
+TRACKED_FIELDS = ('book_id', 'status', 'borrower_id', 'due_back')
+
+
+def copy_state(instance):
+    # due_back may still hold whatever was assigned to it, e.g. a datetime.
+    due_back = BookInstance._meta.get_field('due_back').to_python(instance.due_back)
+    return CopyState(instance.book_id, instance.status, instance.borrower_id, due_back)
+
+
+@receiver(post_init, sender=BookInstance)
+def remember_copy_state(sender, instance, **kwargs):
+    # Copies loaded with deferred fields are not tracked, so that reading the
+    # snapshot never triggers extra queries.
+    if all(name in instance.__dict__ for name in TRACKED_FIELDS):
+        instance._loaded_state = copy_state(instance)
+    else:
+        instance._loaded_state = None
+
+
+@receiver(post_save, sender=BookInstance)
+def copy_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or (not created and instance._loaded_state is None):
+        return
+
+    old = None if created else instance._loaded_state
+    new = copy_state(instance)
+    instance._loaded_state = new
+
+    if old != new:
+        copies_changed.send(sender=BookInstance, changes=[(old, new)], instances=[instance])
+
+
+@receiver(post_delete, sender=BookInstance)
+def copy_deleted(sender, instance, **kwargs):
+    old = instance._loaded_state or copy_state(instance)
+    copies_changed.send(sender=BookInstance, changes=[(old, None)], instances=[instance])
+
+
+@receiver(copies_changed)
+def update_copy_counters(sender, changes, **kwargs):
+    total = available = 0
+    for old, new in changes:
+        total += (new is not None) - (old is not None)
+        available += (new is not None and new.status == 'a') - (old is not None and old.status == 'a')
+
+    counters.adjust(num_instances=total, num_instances_available=available)
+
+
+def overdue_loans_subquery(today=None):
+    """Number of overdue loans of the outer user, counted on bookinstance_borrower_idx."""
+    loans = (
+        BookInstance.objects.filter(borrower=OuterRef('pk'), due_back__lt=today or date.today())
+        .order_by()
+        .values('borrower')
+        .annotate(overdue=Count('pk'))
+        .values('overdue')
+    )
+    return Coalesce(Subquery(loans), Value(0), output_field=IntegerField())
+
+
+@receiver(copies_changed)
+def update_loan_counters(sender, changes, instances=(), **kwargs):
+    active = Counter()
+    for old, new in changes:
+        for state, sign in ((old, -1), (new, 1)):
+            if state is not None and state.borrower_id:
+                active[state.borrower_id] += sign
+    if not active:
+        return
+
+    # One UPDATE per distinct change, e.g. a single one for a batch of returns.
+    # The overdue loans are recounted rather than adjusted: loans that went
+    # overdue since the last refresh_loan_counters were never counted.
+    by_delta = defaultdict(list)
+    for user_id, delta in active.items():
+        by_delta[delta].append(user_id)
+
+    for active_delta, user_ids in by_delta.items():
+        User.objects.filter(pk__in=user_ids).update(
+            active_loans=Greatest(F('active_loans') + active_delta, 0),
+            overdue_loans=overdue_loans_subquery(),
+        )
+
+    # Keep borrowers already loaded in memory in sync with the database.
+    borrowers = {}
+    for instance in instances:
+        if BookInstance.borrower.is_cached(instance) and instance.borrower is not None:
+            borrowers.setdefault(instance.borrower.pk, []).append(instance.borrower)
+    if borrowers:
+        counts = User.objects.filter(pk__in=borrowers).values_list('pk', 'active_loans', 'overdue_loans')
+        for pk, active_loans, overdue_loans in counts:
+            for borrower in borrowers[pk]:
+                borrower.active_loans, borrower.overdue_loans = active_loans, overdue_loans
+
+
+@receiver(copies_changed)
+def update_book_copy_counts(sender, changes, instances=(), **kwargs):
+    total = Counter()
+    available = Counter()
+    for old, new in changes:
+        for state, sign in ((old, -1), (new, 1)):
+            if state is not None and state.book_id:
+                total[state.book_id] += sign
+                available[state.book_id] += sign * (state.status == 'a')
+
+    by_delta = defaultdict(list)
+    for book_id in total.keys() | available.keys():
+        if total[book_id] or available[book_id]:
+            by_delta[total[book_id], available[book_id]].append(book_id)
+
+    now = timezone.now()
+    for (total_delta, available_delta), book_ids in by_delta.items():
+        Book.objects.filter(pk__in=book_ids).update(
+            total_copies=Greatest(F('total_copies') + total_delta, 0),
+            available_copies=Greatest(F('available_copies') + available_delta, 0),
+            updated_at=now,
+        )
+
+    # Keep books already loaded in memory in sync with the database.
+    for instance in instances:
+        if BookInstance.book.is_cached(instance) and instance.book is not None:
+            book = instance.book
+            if book.pk in total:
+                book.updated_at = now
+            book.total_copies = max(book.total_copies + total.pop(book.pk, 0), 0)
+            book.available_copies = max(book.available_copies + available.pop(book.pk, 0), 0)
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def touch_book_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    # The genres are part of a book's API representation (catalog.api).
+    now = timezone.now()
+    if not reverse:
+        if action.startswith('post_'):
+            Book.objects.filter(pk=instance.pk).update(updated_at=now)
+            instance.updated_at = now
+    elif action == 'pre_clear':
+        Book.objects.filter(genre=instance).update(updated_at=now)
+    elif action.startswith('post_') and pk_set:
+        Book.objects.filter(pk__in=pk_set).update(updated_at=now)
+
+
+@receiver(pre_delete, sender=Genre)
+def touch_genre_books(sender, instance, **kwargs):
+    Book.objects.filter(genre=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.adjust(num_books=1)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    counters.adjust(num_books=-1)
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.adjust(num_authors=1)
+
+
+@receiver(post_delete, sender=Author)
+def author_deleted(sender, instance, **kwargs):
+    counters.adjust(num_authors=-1)
+
+
+# Cached fragments of the detail pages (see catalog.fragments)
+
+@receiver(copies_changed)
+def bump_copy_fragments(sender, changes, **kwargs):
+    book_ids = {state.book_id for change in changes for state in change if state is not None}
+    for book_id in book_ids:
+        fragments.bump('book', book_id)
+
+
+@receiver(post_save, sender=BookInstance)
+def copy_fragments_saved(sender, instance, raw=False, **kwargs):
+    # Edits to untracked fields, such as the imprint, do not send copies_changed.
+    if not raw and instance.book_id:
+        fragments.bump('book', instance.book_id)
+
+
+@receiver(post_init, sender=Book)
+def remember_book_author(sender, instance, **kwargs):
+    instance._loaded_author_id = instance.__dict__.get('author_id')
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_fragments_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fragments.bump('book', instance.pk)
+    for author_id in {instance._loaded_author_id, instance.author_id} - {None}:
+        fragments.bump('author', author_id)
+    instance._loaded_author_id = instance.author_id
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        fragments.bump('book', instance.pk)
+    elif pk_set:
+        for book_id in pk_set:
+            fragments.bump('book', book_id)
+    else:
+        fragments.bump('genres')
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def author_fragments_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fragments.bump('author', instance.pk)
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def genre_fragments_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fragments.bump('genres')
+
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def language_fragments_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fragments.bump('languages')
@@ -0,0 +1,66 @@
+import datetime
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import counters
+from catalog.models import Author, Book, BookInstance, Genre, User
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='12345')
+        cls.reader = User.objects.create_user(username='leitor', password='12345')
+        cls.genres = [Genre.objects.create(name=name) for name in ('Romance', 'Drama', 'Fantasia')]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def create_books(self, number):
+        today = datetime.date.today()
+        start = Book.objects.count()
+        for i in range(start, start + number):
+            author = Author.objects.create(first_name='Nome', last_name=f'Sobrenome {i}')
+            book = Book.objects.create(title=f'Livro {i}', author=author, summary='', isbn=f'{i:07d}')
+            book.genre.set(self.genres)
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=self.reader,
+                due_back=today + datetime.timedelta(days=i % 20 - 10))
+
+    def get_query_count(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_rows(self):
+        self.create_books(2)
+        counters.get_counts()
+        urls = [reverse(f'admin:catalog_{name}_changelist') for name in ('book', 'bookinstance', 'author')]
+        few = [self.get_query_count(url) for url in urls]
+
+        self.create_books(20)
+        self.assertEqual([self.get_query_count(url) for url in urls], few)
+
+    def test_genres_are_listed(self):
+        self.create_books(1)
+
+        response = self.client.get(reverse('admin:catalog_book_changelist'))
+
+        self.assertContains(response, 'Romance, Drama, Fantasia')
+
+    def test_due_back_filter(self):
+        self.create_books(20)
+        today = datetime.date.today()
+
+        response = self.client.get(reverse('admin:catalog_bookinstance_changelist'), {'due': 'overdue'})
+
+        copies = response.context['cl'].result_list
+        self.assertEqual(len(copies), 10)
+        self.assertTrue(all(copy.due_back < today for copy in copies))
+
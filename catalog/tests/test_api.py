@@ -0,0 +1,193 @@
+import datetime
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog import circulation
+from catalog.models import Author, Book, BookInstance, Genre, Language, User
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.fantasy = Genre.objects.create(name='Fantasia')
+        cls.drama = Genre.objects.create(name='Drama')
+        cls.language = Language.objects.create(name='Português')
+        cls.books = []
+        for number in range(5):
+            book = Book.objects.create(
+                title=f'Livro {number}', author=cls.author, summary='Resumo', isbn=f'{number:013d}')
+            book.genre.set([cls.fantasy, cls.drama] if number == 0 else [cls.drama])
+            cls.books.append(book)
+        cls.copy = BookInstance.objects.create(
+            book=cls.books[0], imprint='Garnier, 1899', language=cls.language, status='a')
+        cls.user = User.objects.create_user(username='leitor', password='senha-123')
+
+    def get(self, url, **params):
+        return self.client.get(url, params)
+
+    def test_book_list(self):
+        with self.assertNumQueries(2):
+            response = self.get(reverse('api-books'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual([book['title'] for book in data['results']], [f'Livro {n}' for n in range(5)])
+        first = data['results'][0]
+        self.assertEqual(first['genres'], sorted([self.fantasy.pk, self.drama.pk]))
+        self.assertEqual(first['author'], self.author.pk)
+        self.assertEqual(first['total_copies'], 1)
+        self.assertIsNone(data['next'])
+
+    def test_sparse_fieldsets(self):
+        with self.assertNumQueries(1):
+            response = self.get(reverse('api-books'), fields='id,title')
+
+        self.assertEqual(response.json()['results'][0], {'id': self.books[0].pk, 'title': 'Livro 0'})
+
+    def test_unknown_field(self):
+        response = self.get(reverse('api-books'), fields='title,borrower')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('borrower', response.json()['detail'])
+
+    def test_cursor_pagination(self):
+        response = self.get(reverse('api-books'), fields='title', limit=2)
+        data = response.json()
+        self.assertEqual([book['title'] for book in data['results']], ['Livro 0', 'Livro 1'])
+        self.assertIsNone(data['previous'])
+
+        titles = []
+        url = data['next']
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            titles += [book['title'] for book in data['results']]
+            url = data['next']
+        self.assertEqual(titles, ['Livro 2', 'Livro 3', 'Livro 4'])
+
+        data = self.client.get(data['previous']).json()
+        self.assertEqual([book['title'] for book in data['results']], ['Livro 2', 'Livro 3'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get(reverse('api-books'), cursor='nope').status_code, 400)
+        self.assertEqual(self.get(reverse('api-books'), limit='1000').status_code, 400)
+        self.assertEqual(self.get(reverse('api-books'), author='abc').status_code, 400)
+
+    def test_filters(self):
+        response = self.get(reverse('api-books'), genre=self.fantasy.pk, fields='id')
+        self.assertEqual(response.json()['results'], [{'id': self.books[0].pk}])
+
+        response = self.get(reverse('api-books'), available='1', fields='id')
+        self.assertEqual(response.json()['results'], [{'id': self.books[0].pk}])
+
+        response = self.get(reverse('api-copies'), book=self.books[1].pk)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_copies_leave_out_the_borrower(self):
+        circulation.borrow(self.copy, self.user, datetime.date.today() + datetime.timedelta(weeks=2))
+
+        response = self.get(reverse('api-copy', args=[self.copy.pk]))
+
+        data = response.json()
+        self.assertEqual(data['status'], 'o')
+        self.assertEqual(data['book'], self.books[0].pk)
+        self.assertNotIn('borrower', data)
+
+    def test_genre_and_language_lists(self):
+        with self.assertNumQueries(1):
+            response = self.get(reverse('api-genres'))
+        self.assertEqual([genre['name'] for genre in response.json()['results']], ['Drama', 'Fantasia'])
+
+        response = self.get(reverse('api-language', args=[self.language.pk]))
+        self.assertEqual(response.json(), {'id': self.language.pk, 'name': 'Português'})
+        self.assertNotIn('Last-Modified', response)
+
+    def test_detail(self):
+        with self.assertNumQueries(2):
+            response = self.get(reverse('api-book', args=[self.books[0].pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Livro 0')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_detail_not_found(self):
+        response = self.get(reverse('api-author', args=[self.author.pk + 100]))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Não encontrado.'})
+
+    def test_read_only(self):
+        response = self.client.post(reverse('api-books'))
+
+        self.assertEqual(response.status_code, 405)
+
+    def test_root(self):
+        response = self.get(reverse('api-root'))
+
+        self.assertTrue(response.json()['books'].endswith(reverse('api-books')))
+
+
+class ApiConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.book = Book.objects.create(title='Dom Casmurro', author=cls.author, summary='Resumo', isbn='0000000')
+
+    def test_etag_revalidation(self):
+        url = reverse('api-books')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        self.book.title = 'Quincas Borba'
+        self.book.save()
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_sparse_fieldsets_have_their_own_etag(self):
+        url = reverse('api-books')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, {'fields': 'title'}, headers={'if-none-match': etag})
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_last_modified(self):
+        url = reverse('api-book', args=[self.book.pk])
+        last_modified = self.client.get(url)['Last-Modified']
+
+        response = self.client.get(url, headers={'if-modified-since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        Book.objects.filter(pk=self.book.pk).update(updated_at=timezone.now() + datetime.timedelta(seconds=5))
+        response = self.client.get(url, headers={'if-modified-since': last_modified})
+        self.assertEqual(response.status_code, 200)
+
+    def test_copy_changes_touch_the_book(self):
+        before = Book.objects.get(pk=self.book.pk).updated_at
+
+        BookInstance.objects.create(book=self.book, imprint='Garnier', status='a')
+
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertGreater(book.updated_at, before)
+        self.assertEqual(book.total_copies, 1)
+
+    def test_genre_changes_touch_the_book(self):
+        before = Book.objects.get(pk=self.book.pk).updated_at
+        genre = Genre.objects.create(name='Drama')
+
+        genre.book_set.add(self.book)
+        after_add = Book.objects.get(pk=self.book.pk).updated_at
+        self.assertGreater(after_add, before)
+
+        genre.delete()
+        self.assertGreater(Book.objects.get(pk=self.book.pk).updated_at, after_add)
@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+
+from catalog import async_views
+from catalog.models import Author, Book, BookInstance, Genre, User
+
+
+@override_settings(ROOT_URLCONF='bib.urls_async')
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        for number in range(13):
+            book = Book.objects.create(title=f'Livro {number:02d}', author=cls.author, summary='', isbn=f'{number:07d}')
+        book.genre.add(Genre.objects.create(name='Romance'))
+        cls.book = book
+        for _ in range(3):
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_browsing_views_are_async(self):
+        self.assertIs(resolve(reverse('index')).func, async_views.index)
+        self.assertIs(resolve(reverse('books')).func, async_views.book_list)
+
+    async def test_index(self):
+        response = await self.async_client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_books'], 13)
+        self.assertEqual(response.context['num_instances_available'], 3)
+        self.assertEqual(response.context['num_visits'], 0)
+
+    async def test_book_list_is_paginated(self):
+        response = await self.async_client.get(reverse('books'), {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_list.html')
+        self.assertEqual([book.title for book in response.context['book_list']], ['Livro 10', 'Livro 11', 'Livro 12'])
+
+        response = await self.async_client.get(reverse('books'), {'page': 3})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_book_detail(self):
+        response = await self.async_client.get(reverse('book', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Romance')
+        self.assertEqual(len(response.context['copies']), 3)
+        self.assertFalse(response.context['user_can_borrow'])
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('book', args=[self.book.pk]))
+        self.assertTrue(response.context['user_can_borrow'])
+        self.assertContains(response, 'Pegar emprestado', count=3)
+
+    async def test_author_list_requires_login(self):
+        response = await self.async_client.get(reverse('authors'))
+        self.assertRedirects(response, '/accounts/login/?next=/catalog/authors/', fetch_redirect_response=False)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('authors'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['author_list']), 1)
+
+    async def test_author_detail(self):
+        response = await self.async_client.get(reverse('author', args=[self.author.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Livro 12')
+
+        response = await self.async_client.get(reverse('author', args=[self.author.pk + 1]))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,494 @@
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog import circulation
+from catalog.circulation import CirculationConflict
+from catalog.models import Book, BookInstance, Hold, User
+
+
+class CirculationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dom Casmurro', summary='Summary', isbn='0000000')
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.other_user = User.objects.create_user(username='otheruser', password='12345')
+
+    def setUp(self):
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+
+    def test_borrow_updates_only_changed_columns(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            circulation.borrow(copy, self.user, self.due_back)
+
+        update = next(q['sql'] for q in queries if q['sql'].startswith('UPDATE "catalog_bookinstance"'))
+        self.assertNotIn('"imprint"', update.split('WHERE')[0])
+        self.assertNotIn('"book_id"', update.split('WHERE')[0])
+
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('o', self.user, self.due_back))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.active_loans, 1)
+
+    def test_losing_a_race_raises(self):
+        first = BookInstance.objects.get(pk=self.copy.pk)
+        second = BookInstance.objects.get(pk=self.copy.pk)
+
+        circulation.borrow(first, self.user, self.due_back)
+        with self.assertRaises(CirculationConflict):
+            circulation.borrow(second, self.other_user, self.due_back)
+
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.borrower, self.user)
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.other_user.active_loans, 0)
+
+    def test_return_and_renew(self):
+        circulation.borrow(self.copy, self.user, self.due_back)
+
+        new_due_back = self.due_back + datetime.timedelta(days=3)
+        circulation.renew(self.copy, new_due_back)
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.due_back, new_due_back)
+
+        circulation.return_copy(self.copy)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower, self.copy.due_back), ('a', None, None))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.active_loans, 0)
+
+    def test_cannot_return_available_copy(self):
+        with self.assertRaises(CirculationConflict):
+            circulation.return_copy(self.copy)
+
+
+class CirculationViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dom Casmurro', summary='Summary', isbn='0000000')
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.librarian = User.objects.create_user(username='librarian', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+    def setUp(self):
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+
+    def test_borrow_and_return(self):
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('borrow-book', args=[self.copy.pk]), {'due_back': self.due_back})
+        self.assertRedirects(response, reverse('all-borrowed'), fetch_redirect_response=False)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('o', self.user))
+
+        response = self.client.post(reverse('return-book', args=[self.copy.pk]))
+        self.assertRedirects(response, reverse('my-borrowed'))
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'a')
+
+    def test_borrowing_unavailable_copy_is_reported(self):
+        circulation.borrow(self.copy, self.librarian, self.due_back)
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('borrow-book', args=[self.copy.pk]), {'due_back': self.due_back})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Esta cópia está indisponível')
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.borrower, self.librarian)
+
+    def test_renew(self):
+        circulation.borrow(self.copy, self.user, self.due_back)
+        self.client.force_login(self.librarian)
+
+        new_due_back = self.due_back + datetime.timedelta(days=7)
+        response = self.client.post(reverse('renew-book-librarian', args=[self.copy.pk]), {'due_back': new_due_back})
+        self.assertRedirects(response, reverse('all-borrowed'))
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.due_back, new_due_back)
+
+
+class HoldQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dom Casmurro', summary='Summary', isbn='0000000')
+        cls.users = [User.objects.create_user(username=f'leitor{n}', password='12345') for n in range(4)]
+
+    def setUp(self):
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        circulation.borrow(self.copy, self.users[0], self.due_back)
+
+    def test_cannot_hold_available_book(self):
+        circulation.return_copy(self.copy)
+        with self.assertRaises(CirculationConflict):
+            circulation.place_hold(self.book, self.users[1])
+
+    def test_one_hold_per_patron(self):
+        circulation.place_hold(self.book, self.users[1])
+        with self.assertRaises(CirculationConflict):
+            circulation.place_hold(self.book, self.users[1])
+
+    def test_returned_copy_goes_to_the_first_hold(self):
+        first = circulation.place_hold(self.book, self.users[1])
+        second = circulation.place_hold(self.book, self.users[2])
+        self.assertEqual(circulation.queue_position(second), 2)
+
+        circulation.return_copy(self.copy)
+
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('r', None))
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.bookinstance), ('r', self.copy))
+        self.assertEqual(first.pickup_by, circulation.pickup_deadline())
+        self.assertEqual(circulation.queue_position(second), 1)
+
+        # Only the holder can borrow the copy set aside
+        with self.assertRaises(CirculationConflict):
+            circulation.borrow(self.copy, self.users[2], self.due_back)
+        circulation.borrow(self.copy, self.users[1], self.due_back)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('o', self.users[1]))
+        self.assertFalse(Hold.objects.filter(pk=first.pk).exists())
+
+    def test_borrowing_another_copy_passes_the_copy_set_aside_on(self):
+        circulation.place_hold(self.book, self.users[1])
+        second = circulation.place_hold(self.book, self.users[2])
+        circulation.return_copy(self.copy)
+        other = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+
+        circulation.borrow(other, self.users[1], self.due_back)
+
+        self.assertFalse(Hold.objects.filter(patron=self.users[1]).exists())
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.bookinstance), ('r', self.copy))
+
+        circulation.borrow(BookInstance.objects.create(book=self.book, imprint='Imprint', status='a'),
+                           self.users[2], self.due_back)
+        self.assertFalse(Hold.objects.exists())
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'a')
+
+    def test_deleting_the_holder_puts_the_copy_back(self):
+        circulation.place_hold(self.book, self.users[1])
+        circulation.return_copy(self.copy)
+
+        self.users[1].delete()
+
+        self.assertFalse(Hold.objects.exists())
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'a')
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 1)
+
+    def test_return_without_holds(self):
+        circulation.return_copy(self.copy)
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'a')
+
+    def test_release_expired_holds(self):
+        first = circulation.place_hold(self.book, self.users[1])
+        second = circulation.place_hold(self.book, self.users[2])
+        circulation.return_copy(self.copy)
+
+        after_pickup = circulation.pickup_deadline() + datetime.timedelta(days=1)
+        call_command('release_expired_holds', date=after_pickup, batch_size=1, stdout=StringIO())
+
+        # The copy moved on to the next hold, whose deadline has not passed
+        self.assertFalse(Hold.objects.filter(pk=first.pk).exists())
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.bookinstance), ('r', self.copy))
+
+        second.pickup_by = datetime.date.today() - datetime.timedelta(days=1)
+        second.save()
+        call_command('release_expired_holds', stdout=StringIO())
+        self.assertFalse(Hold.objects.exists())
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'a')
+
+    def test_queue_head_uses_the_queue_index(self):
+        for user in self.users[1:]:
+            circulation.place_hold(self.book, user)
+
+        with CaptureQueriesContext(connection) as queries:
+            circulation.return_copy(self.copy)
+
+        head = next(q['sql'] for q in queries if q['sql'].startswith('SELECT') and '"catalog_hold"' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + head)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('hold_queue_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class HoldViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dom Casmurro', summary='Summary', isbn='0000000')
+        cls.reader = User.objects.create_user(username='leitor', password='12345')
+        cls.holder = User.objects.create_user(username='reserva', password='12345')
+
+    def setUp(self):
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        circulation.borrow(self.copy, self.reader, datetime.date.today() + datetime.timedelta(weeks=2))
+
+    def test_place_hold_and_borrow_the_copy_set_aside(self):
+        self.client.force_login(self.holder)
+        book_url = reverse('book', args=[self.book.pk])
+        self.assertContains(self.client.get(book_url), reverse('place-hold', args=[self.book.pk]))
+
+        response = self.client.post(reverse('place-hold', args=[self.book.pk]))
+        self.assertRedirects(response, book_url)
+        self.assertContains(self.client.get(book_url), 'Sua posição na fila: 1')
+
+        circulation.return_copy(self.copy)
+        response = self.client.get(book_url)
+        self.assertContains(response, 'Uma cópia está separada para você')
+        self.assertContains(response, reverse('borrow-book', args=[self.copy.pk]))
+
+        due_back = datetime.date.today() + datetime.timedelta(weeks=1)
+        response = self.client.post(reverse('borrow-book', args=[self.copy.pk]), {'due_back': due_back})
+        self.assertRedirects(response, reverse('all-borrowed'), fetch_redirect_response=False)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('o', self.holder))
+
+    def test_copy_set_aside_cannot_be_borrowed_by_others(self):
+        circulation.place_hold(self.book, self.holder)
+        circulation.return_copy(self.copy)
+
+        self.client.force_login(self.reader)
+        due_back = datetime.date.today() + datetime.timedelta(weeks=1)
+        response = self.client.post(reverse('borrow-book', args=[self.copy.pk]), {'due_back': due_back})
+        self.assertContains(response, 'Esta cópia está reservada para outro usuário')
+
+    def test_cancel_hold(self):
+        hold = circulation.place_hold(self.book, self.holder)
+        self.client.force_login(self.holder)
+        self.assertContains(self.client.get(reverse('my-borrowed')), 'Dom Casmurro')
+
+        response = self.client.post(reverse('cancel-hold', args=[hold.pk]))
+        self.assertRedirects(response, reverse('my-borrowed'))
+        self.assertFalse(Hold.objects.exists())
+
+
+class BatchCirculationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [Book.objects.create(title=f'Livro {n}', summary='', isbn=f'{n:07d}') for n in range(20)]
+        cls.users = [User.objects.create_user(username=f'leitor{n}', password='12345') for n in range(20)]
+
+    def setUp(self):
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+
+    def loaned_copies(self, number):
+        return [
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=user, due_back=self.due_back)
+            for book, user in zip(self.books[:number], self.users[:number])
+        ]
+
+    def test_return_a_cart(self):
+        copies = self.loaned_copies(20)
+        start = timezone.now()
+
+        results = circulation.batch('return', [copy.pk for copy in copies])
+
+        self.assertEqual(results, [circulation.BatchResult(str(copy.pk), 'a', None) for copy in copies])
+        self.assertFalse(BookInstance.objects.exclude(status='a').exists())
+        self.assertFalse(BookInstance.objects.filter(updated_at__lt=start).exists())
+        self.assertEqual(set(Book.objects.values_list('available_copies', flat=True)), {1})
+        self.assertEqual(set(User.objects.values_list('active_loans', flat=True)), {0})
+
+    def test_query_count_does_not_depend_on_the_cart_size(self):
+        def count_queries(copies):
+            with CaptureQueriesContext(connection) as queries:
+                circulation.batch('return', [copy.pk for copy in copies])
+            return len(queries)
+
+        few = count_queries(self.loaned_copies(3))
+        BookInstance.objects.all().delete()
+        self.assertEqual(count_queries(self.loaned_copies(20)), few)
+
+    def test_errors_are_reported_per_copy(self):
+        loaned, available = self.loaned_copies(1)[0], BookInstance.objects.create(book=self.books[1], imprint='Imprint')
+        missing = '00000000-0000-0000-0000-000000000000'
+
+        results = circulation.batch('return', ['xyz', loaned.pk, available.pk, missing, str(loaned.pk)])
+
+        self.assertEqual([result.error for result in results], [
+            'ID de cópia inválido',
+            None,
+            'Esta cópia não pode ser devolvida. Ela não está emprestada.',
+            'Cópia não encontrada',
+            'Cópia repetida',
+        ])
+        loaned.refresh_from_db()
+        self.assertEqual(loaned.status, 'a')
+
+    def test_borrow_respects_the_loan_limit_and_holds(self):
+        borrower, other = self.users[:2]
+        copies = [BookInstance.objects.create(book=book, imprint='Imprint') for book in self.books[:4]]
+        reserved = BookInstance.objects.create(book=self.books[4], imprint='Imprint', status='r')
+        Hold.objects.create(book=self.books[4], patron=other, status='r', bookinstance=reserved,
+                            pickup_by=self.due_back)
+
+        results = circulation.batch('borrow', [reserved.pk] + [copy.pk for copy in copies],
+                                    borrower=borrower, due_back=self.due_back)
+
+        self.assertEqual([result.status for result in results], [None, 'o', 'o', 'o', None])
+        self.assertEqual(results[0].error, 'Esta cópia está reservada para outro usuário')
+        self.assertIn('já tiver pego 3 livros', results[-1].error)
+        borrower.refresh_from_db()
+        self.assertEqual(borrower.active_loans, 3)
+
+        # The copy set aside for the other user is theirs to take
+        results = circulation.batch('borrow', [reserved.pk], borrower=other, due_back=self.due_back)
+        self.assertEqual(results[0].status, 'o')
+        self.assertFalse(Hold.objects.exists())
+
+    def test_borrowing_another_copy_puts_the_copy_set_aside_back(self):
+        book, borrower = self.books[0], self.users[0]
+        reserved = BookInstance.objects.create(book=book, imprint='Imprint', status='r')
+        Hold.objects.create(book=book, patron=borrower, status='r', bookinstance=reserved, pickup_by=self.due_back)
+        other = BookInstance.objects.create(book=book, imprint='Imprint')
+
+        results = circulation.batch('borrow', [other.pk], borrower=borrower, due_back=self.due_back)
+
+        self.assertEqual(results[0].status, 'o')
+        self.assertFalse(Hold.objects.exists())
+        reserved.refresh_from_db()
+        self.assertEqual(reserved.status, 'a')
+
+    def test_returned_copies_go_to_waiting_holds(self):
+        book = self.books[0]
+        copies = [
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=user, due_back=self.due_back)
+            for user in self.users[:2]
+        ]
+        hold = Hold.objects.create(book=book, patron=self.users[2])
+
+        results = circulation.batch('return', [copy.pk for copy in copies])
+
+        self.assertEqual([result.status for result in results], ['r', 'a'])
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.bookinstance_id), ('r', copies[0].pk))
+        self.assertEqual(hold.pickup_by, circulation.pickup_deadline())
+
+    def test_only_the_queue_heads_are_read(self):
+        book = self.books[0]
+        copies = [
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=user, due_back=self.due_back)
+            for user in self.users[:2]
+        ]
+        holds = [Hold.objects.create(book=book, patron=user) for user in self.users[2:]]
+
+        with CaptureQueriesContext(connection) as queries:
+            results = circulation.batch('return', [copy.pk for copy in copies])
+
+        self.assertEqual([result.status for result in results], ['r', 'r'])
+        self.assertEqual(
+            list(Hold.objects.filter(status='r').order_by('created_at', 'id').values_list('pk', flat=True)),
+            [holds[0].pk, holds[1].pk])
+        heads = [q['sql'] for q in queries if q['sql'].startswith('SELECT "catalog_hold"')]
+        self.assertEqual(len(heads), 1)
+        self.assertIn('LIMIT 2', heads[0])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + heads[0])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('hold_queue_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_renew(self):
+        copy = self.loaned_copies(1)[0]
+        new_due_back = self.due_back + datetime.timedelta(days=7)
+
+        results = circulation.batch('renew', [copy.pk], due_back=new_due_back)
+
+        self.assertEqual(results[0].status, 'o')
+        copy.refresh_from_db()
+        self.assertEqual(copy.due_back, new_due_back)
+
+
+class BatchCirculationViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dom Casmurro', summary='Summary', isbn='0000000')
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.librarian = User.objects.create_user(username='librarian', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+    def setUp(self):
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        self.copies = [BookInstance.objects.create(book=self.book, imprint='Imprint') for _ in range(2)]
+        self.client.force_login(self.librarian)
+
+    def test_form(self):
+        response = self.client.post(reverse('batch-circulation'), {
+            'action': 'borrow',
+            'copies': '\n'.join(str(copy.pk) for copy in self.copies) + '\nxyz',
+            'borrower': 'testuser',
+            'due_back': self.due_back,
+        })
+
+        self.assertContains(response, '2 de 3 cópia(s) processada(s).')
+        self.assertContains(response, 'ID de cópia inválido')
+        self.assertEqual(BookInstance.objects.filter(status='o', borrower=self.user).count(), 2)
+
+    def test_borrow_needs_borrower_and_due_date(self):
+        response = self.client.post(reverse('batch-circulation'), {
+            'action': 'borrow', 'copies': str(self.copies[0].pk),
+        })
+
+        self.assertFormError(response.context['form'], 'borrower', 'Informe quem pega as cópias.')
+        self.assertFormError(response.context['form'], 'due_back', 'Informe o prazo.')
+
+    def test_json(self):
+        circulation.borrow(self.copies[0], self.user, self.due_back)
+
+        response = self.client.post(reverse('batch-circulation'), {
+            'action': 'return', 'copies': [str(copy.pk) for copy in self.copies],
+        }, content_type='application/json')
+
+        self.assertEqual(response.json(), {
+            'results': [
+                {'id': str(self.copies[0].pk), 'ok': True, 'status': 'a', 'error': None},
+                {'id': str(self.copies[1].pk), 'ok': False, 'status': None,
+                 'error': 'Esta cópia não pode ser devolvida. Ela não está emprestada.'},
+            ],
+            'succeeded': 1,
+            'failed': 1,
+        })
+
+    def test_json_errors(self):
+        response = self.client.post(reverse('batch-circulation'), {'action': 'lend', 'copies': []},
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'action', 'copies'})
+
+        response = self.client.post(reverse('batch-circulation'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_json_needs_post(self):
+        response = self.client.get(reverse('batch-circulation'), CONTENT_TYPE='application/json')
+
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'POST')
+
+    def test_librarians_only(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('batch-circulation'))
+
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,106 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import circulation
+from catalog.models import Author, Book, BookInstance, Genre, Language, User
+
+
+class DetailFragmentCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.genre = Genre.objects.create(name='Romance')
+        cls.language = Language.objects.create(name='Português')
+        cls.book = Book.objects.create(title='Dom Casmurro', author=cls.author, summary='', isbn='0000001')
+        cls.book.genre.add(cls.genre)
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint='Garnier, 1899', status='a', language=cls.language)
+        cls.reader = User.objects.create_user(username='leitor', password='12345')
+        cls.librarian = User.objects.create_user(username='bibliotecario', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='change_bookinstance'))
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('book', args=[self.book.pk])
+
+    def test_repeated_requests_are_served_from_cache(self):
+        with self.assertNumQueries(6):
+            first = self.client.get(self.url)
+        # The copies, copy groups and genres are not queried again
+        with self.assertNumQueries(3):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertContains(second, 'Garnier, 1899')
+        self.assertContains(second, 'Romance')
+
+    def test_copy_changes_invalidate_the_book_page(self):
+        self.client.get(self.url)
+
+        circulation.borrow(self.copy, self.reader, self.copy.due_back)
+        self.assertContains(self.client.get(self.url), 'Emprestado')
+
+        self.copy.refresh_from_db()
+        self.copy.imprint = 'Garnier, 1900'
+        self.copy.save()
+        self.assertContains(self.client.get(self.url), 'Garnier, 1900')
+
+        BookInstance.objects.create(book=self.book, imprint='Nova edição', status='a')
+        self.assertContains(self.client.get(self.url), 'Nova edição')
+
+    def test_related_changes_invalidate_the_book_page(self):
+        self.client.get(self.url)
+
+        self.author.last_name = 'Assis'
+        self.author.save()
+        self.assertContains(self.client.get(self.url), 'Assis, Machado')
+
+        self.genre.name = 'Romance realista'
+        self.genre.save()
+        self.assertContains(self.client.get(self.url), 'Romance realista')
+
+        self.book.genre.add(Genre.objects.create(name='Clássico'))
+        self.assertContains(self.client.get(self.url), 'Clássico')
+
+        self.language.name = 'Português do Brasil'
+        self.language.save()
+        self.assertContains(self.client.get(self.url), 'Português do Brasil')
+
+    def test_per_user_links_are_not_shared(self):
+        self.client.login(username='leitor', password='12345')
+        self.assertContains(self.client.get(self.url), 'Pegar emprestado')
+        self.assertNotContains(self.client.get(self.url), 'Editar cópia')
+
+        self.client.login(username='bibliotecario', password='12345')
+        self.assertContains(self.client.get(self.url), 'Editar cópia')
+
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Pegar emprestado')
+        self.assertNotContains(response, 'Editar cópia')
+
+    def test_author_page(self):
+        url = reverse('author', args=[self.author.pk])
+        self.assertContains(self.client.get(url), 'Dom Casmurro')
+
+        Book.objects.create(title='Quincas Borba', author=self.author, summary='', isbn='0000002')
+        self.assertContains(self.client.get(url), 'Quincas Borba')
+
+        self.book.title = 'Dom Casmurro (1899)'
+        self.book.save()
+        self.assertContains(self.client.get(url), 'Dom Casmurro (1899)')
+
+        other = Author.objects.create(first_name='José', last_name='de Alencar')
+        self.book.author = other
+        self.book.save()
+        self.assertNotContains(self.client.get(url), 'Dom Casmurro')
+
+    @override_settings(ROOT_URLCONF='bib.urls_async')
+    def test_async_views_use_the_same_fragments(self):
+        get = async_to_sync(self.async_client.get)
+        get(self.url)
+        with self.assertNumQueries(3):
+            response = get(self.url)
+        self.assertContains(response, 'Garnier, 1899')
@@ -0,0 +1,178 @@
+import datetime
+import json
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Language, User
+
+CSV_ROWS = '''isbn,title,summary,author_first_name,author_last_name,genres,language,imprint,copies
+0000001,Dom Casmurro,Capitu,Machado,de Assis,Romance;Realismo,Português,Garnier 1899,2
+0000002,Memórias Póstumas,Brás Cubas,Machado,de Assis,realismo,português,Garnier 1881,1
+0000003,A Hora da Estrela,Macabéa,Clarice,Lispector,Romance,Português,Rocco,0
+'''
+
+
+class ImportCatalogTest(TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding='utf-8')
+        return path
+
+    def test_import_csv(self):
+        Genre.objects.create(name='Romance')
+
+        out = StringIO()
+        call_command('import_catalog', self.write('catalog.csv', CSV_ROWS), batch_size=2, stdout=out)
+
+        self.assertIn('3 livro(s) criado(s), 0 atualizado(s), 3 cópia(s) criada(s)', out.getvalue())
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Language.objects.count(), 1)
+        self.assertEqual(sorted(Genre.objects.values_list('name', flat=True)), ['Realismo', 'Romance'])
+
+        book = Book.objects.get(isbn='0000001')
+        self.assertEqual(str(book.author), 'de Assis, Machado')
+        self.assertEqual(book.display_genre(), 'Romance, Realismo')
+        self.assertEqual(book.bookinstance_set.filter(status='a', language__name='Português').count(), 2)
+
+    def test_reimport_updates_without_duplicating_copies(self):
+        path = self.write('catalog.csv', CSV_ROWS)
+        call_command('import_catalog', path, stdout=StringIO())
+        call_command('import_catalog', self.write('catalog.csv', CSV_ROWS.replace('Capitu', 'Bentinho')),
+                     stdout=StringIO())
+
+        self.assertEqual(Book.objects.count(), 3)
+        self.assertEqual(BookInstance.objects.count(), 3)
+        self.assertEqual(Book.objects.get(isbn='0000001').summary, 'Bentinho')
+
+    def test_reimport_invalidates_cached_fragments(self):
+        cache.clear()
+        call_command('import_catalog', self.write('catalog.csv', CSV_ROWS), stdout=StringIO())
+        book = Book.objects.get(isbn='0000003')
+        clarice = book.author
+        pages = [reverse('book', args=[book.pk]), reverse('author', args=[clarice.pk])]
+        for url in pages:
+            self.assertContains(self.client.get(url), 'A Hora da Estrela')
+
+        call_command('import_catalog', self.write('catalog.csv', CSV_ROWS.replace(
+            'A Hora da Estrela,Macabéa,Clarice,Lispector', 'Quincas Borba,Rubião,Machado,de Assis')),
+            stdout=StringIO())
+
+        self.assertContains(self.client.get(pages[0]), 'Quincas Borba')
+        self.assertNotContains(self.client.get(pages[1]), 'A Hora da Estrela')
+        self.assertContains(self.client.get(reverse('author', args=[Book.objects.get(isbn='0000003').author_id])),
+                            'Quincas Borba')
+
+    def test_import_jsonl(self):
+        rows = [
+            {'isbn': '0000001', 'title': 'Dom Casmurro', 'genres': ['Romance'], 'copies': 1},
+            {'isbn': '0000002', 'title': 'Memórias Póstumas', 'genres': [], 'copies': 0},
+        ]
+        path = self.write('catalog.jsonl', '\n'.join(json.dumps(row) for row in rows))
+
+        call_command('import_catalog', path, stdout=StringIO())
+
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertIsNone(Book.objects.get(isbn='0000002').author)
+        self.assertEqual(BookInstance.objects.count(), 1)
+
+    def test_resume_skips_imported_rows(self):
+        path = self.write('catalog.csv', CSV_ROWS)
+        self.write('catalog.csv.progress', '2')
+
+        out = StringIO()
+        call_command('import_catalog', path, resume=True, stdout=out)
+
+        self.assertEqual(list(Book.objects.values_list('isbn', flat=True)), ['0000003'])
+        self.assertFalse((self.directory / 'catalog.csv.progress').exists())
+
+
+class ExportCatalogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        romance = Genre.objects.create(name='Romance')
+        realismo = Genre.objects.create(name='Realismo')
+        language = Language.objects.create(name='Português')
+
+        cls.book = Book.objects.create(title='Dom Casmurro', author=author, summary='Capitu', isbn='0000001')
+        cls.book.genre.set([romance, realismo])
+        other_book = Book.objects.create(title='Memórias Póstumas', author=author, summary='Brás', isbn='0000002')
+        other_book.genre.set([realismo])
+
+        cls.borrower = User.objects.create_user(username='borrower', password='12345')
+        today = datetime.date.today()
+        BookInstance.objects.create(book=cls.book, imprint='Garnier', language=language, status='a')
+        BookInstance.objects.create(book=cls.book, imprint='Garnier', language=language, status='o',
+                                    borrower=cls.borrower, due_back=today - datetime.timedelta(days=1))
+        BookInstance.objects.create(book=other_book, imprint='Garnier', language=language, status='o',
+                                    borrower=cls.borrower, due_back=today + datetime.timedelta(days=7))
+
+        cls.librarian = User.objects.create_user(username='librarian', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+    def get_lines(self, kind, **params):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('export', args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_loans_csv(self):
+        lines = self.get_lines('loans')
+        self.assertTrue(lines[0].startswith('id,isbn,title'))
+        self.assertEqual(len(lines), 3)
+        self.assertIn('borrower', lines[1])
+
+    def test_export_filters(self):
+        self.assertEqual(len(self.get_lines('loans', overdue=1)), 2)
+        self.assertEqual(len(self.get_lines('copies', status='a')), 2)
+        self.assertEqual(len(self.get_lines('copies', genre='romance')), 3)
+
+    def test_export_books_jsonl_keeps_every_genre(self):
+        lines = self.get_lines('books', format='jsonl', genre='Romance')
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['isbn'], '0000001')
+        self.assertEqual(sorted(row['genres'].split(';')), ['Realismo', 'Romance'])
+
+    def test_export_requires_permission(self):
+        self.client.force_login(self.borrower)
+        response = self.client.get(reverse('export', args=['loans']))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(ROOT_URLCONF='bib.urls_async')
+    async def test_async_export_is_streamed(self):
+        await self.async_client.aforce_login(self.librarian)
+        response = await self.async_client.get(reverse('export', args=['loans']), {'overdue': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        lines = b''.join([line async for line in response.streaming_content]).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+
+        await self.async_client.aforce_login(self.borrower)
+        response = await self.async_client.get(reverse('export', args=['loans']))
+        self.assertEqual(response.status_code, 403)
+
+    def test_exported_books_can_be_imported(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        path = directory / 'books.csv'
+
+        call_command('export_catalog', 'books', output=str(path))
+        Book.objects.filter(isbn='0000001').update(title='Outro título')
+        call_command('import_catalog', path, stdout=StringIO())
+
+        self.assertEqual(Book.objects.get(isbn='0000001').title, 'Dom Casmurro')
+        self.assertEqual(BookInstance.objects.count(), 3)
@@ -0,0 +1,95 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import counters, metrics
+from catalog.models import Author, Book, User
+
+
+class MetricsMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        for number in range(3):
+            Book.objects.create(title=f'Livro {number}', author=author, summary='', isbn=f'{number:07d}')
+        cls.staff = User.objects.create_user(username='staff', password='12345', is_staff=True)
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+
+    def setUp(self):
+        cache.clear()
+        metrics.store.reset()
+
+    def test_records_requests_by_url_name(self):
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+        self.client.get(reverse('book', args=[Book.objects.first().pk]))
+
+        snapshot = metrics.store.snapshot()
+        self.assertEqual(snapshot['books'].latency.count, 2)
+        self.assertEqual(snapshot['book'].latency.count, 1)
+        self.assertGreater(snapshot['books'].queries.sum, 0)
+        self.assertGreater(snapshot['books'].db_time, 0)
+        self.assertGreater(snapshot['books'].template_time, 0)
+
+    def test_query_count_matches_the_view(self):
+        counters.get_counts()
+        with self.assertNumQueries(2):
+            self.client.get(reverse('books'))
+        self.assertEqual(metrics.store.snapshot()['books'].queries.sum, 2)
+
+    def test_snapshot_is_a_copy(self):
+        self.client.get(reverse('books'))
+        snapshot = metrics.store.snapshot()
+        self.client.get(reverse('books'))
+
+        self.assertEqual(snapshot['books'].latency.count, 1)
+        self.assertEqual(snapshot['books'].queries.count, 1)
+        self.assertEqual(metrics.store.snapshot()['books'].latency.count, 2)
+
+    def test_unresolved_requests(self):
+        self.client.get('/catalog/nao-existe/')
+        self.assertEqual(metrics.store.snapshot()['<unresolved>'].latency.count, 1)
+
+    @override_settings(ROOT_URLCONF='bib.urls_async')
+    async def test_async_views(self):
+        await self.async_client.get(reverse('books'))
+        snapshot = metrics.store.snapshot()
+        self.assertEqual(snapshot['books'].latency.count, 1)
+        self.assertGreater(snapshot['books'].queries.sum, 0)
+        self.assertGreater(snapshot['books'].template_time, 0)
+
+    def test_endpoint_is_restricted_to_staff(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_endpoint_renders_prometheus_text(self):
+        self.client.get(reverse('books'))
+        self.client.login(username='staff', password='12345')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        content = response.content.decode()
+        self.assertIn('# TYPE catalog_request_duration_seconds histogram', content)
+        self.assertIn('catalog_request_duration_seconds_count{view="books"} 1', content)
+        self.assertIn('catalog_request_duration_seconds_bucket{view="books",le="+Inf"} 1', content)
+        self.assertIn('catalog_request_queries_sum{view="books"}', content)
+        self.assertIn('catalog_db_duration_seconds_total{view="books"}', content)
+        self.assertIn('catalog_template_render_seconds_total{view="books"}', content)
+
+
+class HistogramTest(TestCase):
+    def test_cumulative_buckets(self):
+        histogram = metrics.Histogram((1, 5))
+        for value in (0, 1, 3, 7):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(1, 2), (5, 3), ('+Inf', 4)])
+        self.assertEqual(histogram.sum, 11)
+        self.assertEqual(histogram.count, 4)
+
+    def test_label_escaping(self):
+        self.assertEqual(metrics._label('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
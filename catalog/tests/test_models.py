@@ -1,3 +1,6 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
 from catalog.models import Author, Genre, Book, BookInstance, User
@@ -293,3 +296,108 @@ class GenreUniqueConstraintTest(TestCase):
 
 
 
+
+class UserLoanCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dom Casmurro', summary='Summary Test', isbn='0000000')
+        cls.user = User.objects.create_user(username='testuser', password='secret123')
+
+    def test_counters_follow_borrow_and_return(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy.borrower = self.user
+        copy.due_back = datetime.date.today() - datetime.timedelta(days=1)
+        copy.status = 'o'
+        copy.save()
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.active_loans, user.overdue_loans), (1, 1))
+
+        copy.borrower = None
+        copy.due_back = None
+        copy.status = 'a'
+        copy.save()
+
+        user.refresh_from_db()
+        self.assertEqual((user.active_loans, user.overdue_loans), (0, 0))
+
+    def test_can_borrow_book_does_not_query(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.can_borrow_book)
+
+    def test_refresh_counts_loans_that_became_overdue(self):
+        due_back = datetime.date.today() + datetime.timedelta(days=1)
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', borrower=self.user, due_back=due_back)
+        # Simulate the due date passing without the copy being saved
+        BookInstance.objects.filter(pk=copy.pk).update(due_back=datetime.date.today() - datetime.timedelta(days=2))
+
+        call_command('refresh_loan_counters', stdout=StringIO())
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.active_loans, user.overdue_loans), (1, 1))
+
+    def test_returning_a_loan_that_went_overdue_after_the_refresh(self):
+        today = datetime.date.today()
+        copies = [
+            BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', borrower=self.user,
+                                        due_back=today + datetime.timedelta(days=1))
+            for _ in range(3)
+        ]
+        BookInstance.objects.filter(pk=copies[0].pk).update(due_back=today - datetime.timedelta(days=5))
+        call_command('refresh_loan_counters', stdout=StringIO())
+        # Two more loans go overdue before the next refresh
+        BookInstance.objects.filter(pk__in=[copies[1].pk, copies[2].pk]).update(
+            due_back=today - datetime.timedelta(days=1))
+
+        copy = BookInstance.objects.get(pk=copies[1].pk)
+        copy.borrower, copy.due_back, copy.status = None, None, 'a'
+        copy.save()
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.active_loans, user.overdue_loans), (2, 2))
+        self.assertFalse(user.can_borrow_book)
+
+
+class BookCopyCountsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dom Casmurro', summary='Summary Test', isbn='0000000')
+        cls.other_book = Book.objects.create(title='Quincas Borba', summary='Summary Test', isbn='0000001')
+        cls.user = User.objects.create_user(username='testuser', password='secret123')
+
+    def assertCounts(self, book, total, available):
+        book = Book.objects.get(pk=book.pk)
+        self.assertEqual((book.total_copies, book.available_copies), (total, available))
+
+    def test_counts_follow_copy_changes(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='m')
+        self.assertCounts(self.book, 2, 1)
+
+        copy.status = 'o'
+        copy.borrower = self.user
+        copy.save()
+        self.assertCounts(self.book, 2, 0)
+
+        copy.status = 'a'
+        copy.borrower = None
+        copy.book = self.other_book
+        copy.save()
+        self.assertCounts(self.book, 1, 0)
+        self.assertCounts(self.other_book, 1, 1)
+
+        copy.delete()
+        self.assertCounts(self.other_book, 0, 0)
+
+    def test_reconcile_fixes_drift(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        Book.objects.filter(pk=self.book.pk).update(total_copies=5, available_copies=0)
+        Book.objects.filter(pk=self.other_book.pk).update(total_copies=1)
+
+        out = StringIO()
+        call_command('reconcile_book_copies', stdout=out)
+
+        self.assertIn('2 livro(s)', out.getvalue())
+        self.assertCounts(self.book, 1, 1)
+        self.assertCounts(self.other_book, 0, 0)
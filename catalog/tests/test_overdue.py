@@ -0,0 +1,76 @@
+import datetime
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+
+from catalog.models import Author, Book, BookInstance, OverdueNotice, User
+
+
+class ProcessOverdueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.book = Book.objects.create(title='Dom Casmurro', author=author, summary='', isbn='0000001')
+        cls.today = datetime.date.today()
+        cls.ana = User.objects.create_user(username='ana', password='12345', email='ana@example.com')
+        cls.bia = User.objects.create_user(username='bia', password='12345', email='bia@example.com')
+        cls.caio = User.objects.create_user(username='caio', password='12345')
+
+        cls.ana_loans = [cls.loan(cls.ana, days) for days in (-10, -3, -1)]
+        cls.bia_loan = cls.loan(cls.bia, -5)
+        cls.loan(cls.bia, 3)
+        cls.loan(cls.caio, -2)
+
+    @classmethod
+    def loan(cls, borrower, days):
+        return BookInstance.objects.create(
+            book=cls.book, imprint='Garnier', status='o', borrower=borrower,
+            due_back=cls.today + datetime.timedelta(days=days),
+        )
+
+    def process(self, **options):
+        out = StringIO()
+        call_command('process_overdue', stdout=out, **options)
+        return out.getvalue()
+
+    def test_one_email_per_borrower(self):
+        output = self.process(chunk_size=2, batch_size=1)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['ana@example.com', 'bia@example.com'])
+        ana_message = next(message for message in mail.outbox if message.to == ['ana@example.com'])
+        self.assertIn('destes 3 livros', ana_message.body)
+        self.assertEqual(ana_message.body.count('Dom Casmurro'), 3)
+        self.assertIn('2 lembrete(s) enviado(s), cobrindo 4 empréstimo(s)', output)
+        self.assertIn('1 usuário(s) sem e-mail', output)
+
+        self.assertEqual(OverdueNotice.objects.count(), 4)
+        self.assertFalse(OverdueNotice.objects.filter(borrower=self.caio).exists())
+
+    def test_reruns_are_idempotent(self):
+        self.process()
+        self.process()
+        self.assertEqual(len(mail.outbox), 2)
+
+        # A renewed loan that is overdue again gets a new notice
+        self.bia_loan.due_back = self.today - datetime.timedelta(days=1)
+        self.bia_loan.save()
+        self.process()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[2].to, ['bia@example.com'])
+        self.assertEqual(OverdueNotice.objects.filter(bookinstance=self.bia_loan).count(), 2)
+
+    def test_dry_run(self):
+        output = self.process(dry_run=True)
+        self.assertIn('2 lembrete(s)', output)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(OverdueNotice.objects.exists())
+
+    def test_date_option(self):
+        self.process(date=self.today - datetime.timedelta(days=4))
+        self.assertEqual(OverdueNotice.objects.count(), 2)
+        self.assertEqual(
+            set(OverdueNotice.objects.values_list('bookinstance', flat=True)),
+            {self.ana_loans[0].pk, self.bia_loan.pk},
+        )
@@ -0,0 +1,143 @@
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import counters
+from catalog.models import Author, Genre, User
+from catalog.pagination import EstimatedCountPaginator, estimated_count
+
+
+def count_queries(queries):
+    return [query['sql'] for query in queries if query['sql'].upper().startswith('SELECT COUNT(')]
+
+
+class SmallLimitPaginator(EstimatedCountPaginator):
+    exact_count_limit = 5
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(30):
+            Author.objects.create(first_name='Nome', last_name=f'Sobrenome {i:02d}')
+            Genre.objects.create(name=f'Gênero {i:02d}')
+
+    def setUp(self):
+        cache.clear()
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_whole_table_total_comes_from_the_counters(self):
+        counters.get_counts()
+        paginator = EstimatedCountPaginator(Author.objects.order_by('last_name'), 10)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.num_pages, 3)
+        self.assertFalse(queries)
+
+    def test_total_from_statistics(self):
+        self.analyze()
+        Genre.objects.create(name='Novo')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(SmallLimitPaginator(Genre.objects.all(), 10).count, 30)
+        self.assertFalse(count_queries(queries))
+
+        # Tables the statistics say are small are counted
+        self.assertEqual(EstimatedCountPaginator(Genre.objects.all(), 10).count, 31)
+
+    def test_no_statistics(self):
+        self.analyze()
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM sqlite_stat1 WHERE tbl = 'catalog_genre'")
+
+        self.assertIsNone(estimated_count(Genre.objects.all()))
+        self.assertEqual(SmallLimitPaginator(Genre.objects.all(), 10).count, 30)
+
+    def test_small_filtered_sets_are_counted_exactly(self):
+        paginator = SmallLimitPaginator(Author.objects.filter(last_name__lt='Sobrenome 03'), 2)
+
+        self.assertEqual(paginator.count, 3)
+        self.assertTrue(paginator.count_is_exact)
+        self.assertIsNone(estimated_count(paginator.object_list))
+
+    @override_settings(CATALOG_COUNT_CACHE_TIMEOUT=60)
+    def test_large_filtered_totals_are_cached(self):
+        queryset = Author.objects.filter(last_name__gte='Sobrenome 10')
+        self.assertEqual(SmallLimitPaginator(queryset, 10).count, 20)
+        Author.objects.create(first_name='Nome', last_name='Sobrenome 99')
+
+        with CaptureQueriesContext(connection) as queries:
+            paginator = SmallLimitPaginator(queryset, 10)
+            self.assertEqual(paginator.count, 20)
+        self.assertEqual(len(queries), 1)  # the bounded count
+        self.assertFalse(paginator.count_is_exact)
+
+        # The last page finds the new author anyway
+        page = paginator.page(2)
+        self.assertTrue(page.has_next())
+        self.assertEqual(paginator.num_pages, 3)
+        self.assertEqual(list(paginator.page(3)), [Author.objects.get(last_name='Sobrenome 99')])
+
+    def test_long_estimate_is_corrected(self):
+        counters.get_counts()
+        cache.set(counters._key('num_authors'), 45, None)
+        paginator = EstimatedCountPaginator(Author.objects.order_by('last_name'), 10)
+        self.assertEqual(paginator.num_pages, 5)
+
+        page = paginator.page(3)
+
+        self.assertEqual(len(page), 10)
+        self.assertFalse(page.has_next())
+        self.assertEqual(paginator.count, 30)
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+    def test_short_estimate_is_corrected(self):
+        counters.get_counts()
+        cache.set(counters._key('num_authors'), 12, None)
+        paginator = EstimatedCountPaginator(Author.objects.order_by('last_name'), 10)
+        self.assertEqual(paginator.num_pages, 2)
+
+        page = paginator.page(2)
+        self.assertTrue(page.has_next())
+        self.assertEqual(len(paginator.page(3)), 10)
+
+    def test_list_view_does_not_count(self):
+        self.client.force_login(User.objects.create_user(username='leitor', password='12345'))
+        counters.get_counts()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('authors'), {'page': 2})
+
+        self.assertContains(response, 'Página 2 de 3.')
+        self.assertFalse(count_queries(queries))
+
+    @override_settings(ROOT_URLCONF='bib.urls_async')
+    def test_async_list_view_does_not_count(self):
+        self.client.force_login(User.objects.create_user(username='leitor', password='12345'))
+        counters.get_counts()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('authors'), {'page': 2})
+
+        self.assertContains(response, 'Página 2 de 3.')
+        self.assertFalse(count_queries(queries))
+
+    async def test_async_estimate_is_corrected(self):
+        await counters.aget_counts()
+        await cache.aset(counters._key('num_authors'), 12, None)
+        paginator = EstimatedCountPaginator(Author.objects.order_by('last_name'), 10)
+
+        page = await paginator.apage(2)
+        self.assertTrue(page.has_next())
+        page = await paginator.apage(3)
+        self.assertFalse(page.has_next())
+        self.assertEqual(paginator.count, 30)
+        with self.assertRaises(EmptyPage):
+            await paginator.apage(4)
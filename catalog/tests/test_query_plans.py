@@ -0,0 +1,114 @@
+import datetime
+import re
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Language, User
+
+# Reading a subquery's (already limited) rows is not a table scan.
+FULL_SCAN = re.compile(r'^SCAN (?!subquery$)\S+$')
+
+# Counting a whole table has to read all of it, with or without an index.
+UNFILTERED_COUNT = re.compile(r'^SELECT COUNT\(\*\) AS "__count" FROM "\w+"$')
+
+
+class QueryPlanTest(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every catalog query issued by the list views
+    and fails if any of them reads a whole table or sorts in a temp B-tree.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        language = Language.objects.create(name='Português')
+        cls.user = User.objects.create_user(username='librarian', password='12345')
+        cls.user.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        today = datetime.date.today()
+
+        for number in range(15):
+            author = Author.objects.create(first_name=f'Nome {number}', last_name=f'Sobrenome {number % 4}')
+            book = Book.objects.create(title=f'Livro {number % 5}', author=author, summary='', isbn=f'{number:07d}')
+            for copy in range(3):
+                BookInstance.objects.create(
+                    book=book, imprint='Imprint', language=language,
+                    status='o' if copy else 'a',
+                    borrower=cls.user if copy else None,
+                    due_back=today + datetime.timedelta(days=number % 7) if copy else None,
+                )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_plans(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in queries:
+                if '"catalog_' not in query['sql'] or not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans[query['sql']] = [row[-1] for row in cursor.fetchall()]
+        return response, plans
+
+    def assertIndexedPlans(self, url, params=None):
+        response, plans = self.get_plans(url, params)
+        self.assertTrue(plans)
+
+        for sql, plan in plans.items():
+            if UNFILTERED_COUNT.match(sql):
+                continue
+            for step in plan:
+                self.assertFalse(FULL_SCAN.match(step), f'Full table scan ({step}) in: {sql}')
+                self.assertNotIn('TEMP B-TREE', step, f'Temporary sort ({step}) in: {sql}')
+
+        return response
+
+    def test_index(self):
+        self.assertIndexedPlans(reverse('index'))
+
+    def test_book_list(self):
+        self.assertIndexedPlans(reverse('books'))
+
+    def test_author_list(self):
+        self.assertIndexedPlans(reverse('authors'))
+
+    def test_loaned_books_by_user(self):
+        self.assertIndexedPlans(reverse('my-borrowed'))
+
+    def test_all_borrowed(self):
+        self.assertIndexedPlans(reverse('all-borrowed'))
+
+    def test_book_list_by_availability(self):
+        self.assertIndexedPlans(reverse('books'), {'sort': 'availability'})
+        self.assertIndexedPlans(reverse('books'), {'available': '1'})
+
+    @override_settings(CATALOG_PAGINATION_MODE='cursor')
+    def test_book_list_by_availability_cursor_pages(self):
+        response = self.assertIndexedPlans(reverse('books'), {'sort': 'availability'})
+        self.assertIndexedPlans(
+            reverse('books'), {'sort': 'availability', 'cursor': response.context['page_obj'].next_cursor})
+
+    def test_admin_changelists(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', password='12345'))
+        for name in ('book', 'bookinstance', 'author'):
+            with self.subTest(name=name):
+                self.assertIndexedPlans(reverse(f'admin:catalog_{name}_changelist'))
+        for params in ({'status__exact': 'o'}, {'due': 'overdue'}, {'due': 'week'}):
+            with self.subTest(params=params):
+                self.assertIndexedPlans(reverse('admin:catalog_bookinstance_changelist'), params)
+
+    @override_settings(CATALOG_PAGINATION_MODE='cursor')
+    def test_cursor_pages(self):
+        for name in ('books', 'authors', 'my-borrowed', 'all-borrowed'):
+            with self.subTest(name=name):
+                response = self.assertIndexedPlans(reverse(name))
+                self.assertIndexedPlans(reverse(name), {'cursor': response.context['page_obj'].next_cursor})
@@ -0,0 +1,128 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from catalog import counters, fragments, replicas, search
+from catalog.models import Author, Book, BookInstance, Hold, User
+
+
+def routed_view(request):
+    return {
+        'book': Book.objects.all().db,
+        'hold': Hold.objects.all().db,
+        'user': User.objects.all().db,
+    }
+
+
+@override_settings(CATALOG_READ_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = replicas.read_from_replica(routed_view)
+
+    def test_catalog_reads_go_to_the_replica(self):
+        dbs = self.view(self.factory.get('/'))
+
+        self.assertEqual(dbs, {'book': 'replica', 'hold': 'replica', 'user': 'default'})
+        # Only inside the decorated view
+        self.assertEqual(Book.objects.all().db, 'default')
+
+    def test_writes_go_to_the_primary(self):
+        self.assertEqual(replicas.ReplicaRouter().db_for_write(Book), 'default')
+
+    def test_unsafe_requests_read_from_the_primary(self):
+        self.assertEqual(self.view(self.factory.post('/'))['book'], 'default')
+
+    def test_sticky_clients_read_from_the_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[replicas.PRIMARY_COOKIE] = '1'
+
+        self.assertEqual(self.view(request)['book'], 'default')
+
+    @override_settings(CATALOG_READ_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.view(self.factory.get('/'))['book'], 'default')
+
+    async def test_async_views(self):
+        async def view(request):
+            return routed_view(request)
+
+        dbs = await replicas.read_from_replica(view)(self.factory.get('/'))
+
+        self.assertEqual(dbs['book'], 'replica')
+
+    def test_search_reads_the_replica(self):
+        view = replicas.read_from_replica(lambda request: search.SearchResults('casmurro').using)
+        self.assertEqual(view(self.factory.get('/')), 'replica')
+
+    def test_pages_read_from_a_replica_do_not_cache_fragments(self):
+        self.addCleanup(cache.clear)
+        template = Template('{% load cache %}{% cache fragment_timeout page fragment_version using=fragment_cache %}'
+                            '{{ title }}{% endcache %}')
+
+        def view(request, title):
+            return template.render(Context({**fragments.fragment_context(('book', 1)), 'title': title}))
+
+        view = replicas.read_from_replica(view)
+        self.assertEqual(view(self.factory.get('/'), 'Antigo'), 'Antigo')
+        # Neither stored by the replica read, nor served to it
+        self.assertEqual(view(self.factory.post('/'), 'Novo'), 'Novo')
+        self.assertEqual(view(self.factory.get('/'), 'Antigo'), 'Antigo')
+
+    def test_counters_are_counted_on_the_primary(self):
+        self.addCleanup(cache.clear)
+        # Counting on the unconfigured replica alias would raise
+        view = replicas.read_from_replica(lambda request: counters.recount())
+        self.assertEqual(view(self.factory.get('/'))['num_books'], 0)
+
+    def test_replicas_are_not_migrated(self):
+        router = replicas.ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'catalog'))
+        self.assertTrue(router.allow_migrate('default', 'catalog'))
+
+
+@override_settings(CATALOG_PRIMARY_STICKY_SECONDS=30)
+class StickinessTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='leitor', password='12345')
+        book = Book.objects.create(title='Dom Casmurro', summary='', isbn='0000000')
+        cls.copy = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_writing_sticks_to_the_primary(self):
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        response = self.client.post(reverse('borrow-book', args=[self.copy.pk]), {'due_back': due_back})
+
+        self.assertRedirects(response, reverse('all-borrowed'), fetch_redirect_response=False)
+        cookie = response.cookies[replicas.PRIMARY_COOKIE]
+        self.assertEqual(cookie['max-age'], 30)
+        self.assertTrue(cookie['httponly'])
+
+    def test_reading_does_not(self):
+        response = self.client.get(reverse('books'))
+
+        self.assertNotIn(replicas.PRIMARY_COOKIE, response.cookies)
+
+
+class CopyDatabaseTest(TransactionTestCase):
+    # The backup waits for the primary's open transactions
+    def test_copies_the_primary(self):
+        Author.objects.create(first_name='Machado', last_name='de Assis')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'replica.sqlite3')
+            replicas.copy_database(path)
+
+            with sqlite3.connect(path) as replica:
+                rows = replica.execute('SELECT last_name FROM catalog_author').fetchall()
+
+        self.assertEqual(rows, [('de Assis',)])
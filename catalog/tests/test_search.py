@@ -0,0 +1,114 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog import search
+from catalog.models import Author, Book, BookInstance, Genre
+
+
+class SearchIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.book = Book.objects.create(
+            title='Dom Casmurro', author=cls.author, summary='Bentinho e Capitu', isbn='0000000')
+        Book.objects.create(
+            title='Memórias Póstumas', author=cls.author, summary='Um defunto autor, como Dom Casmurro', isbn='0000001')
+
+    def search(self, query):
+        return [book.title for book in search.search_books(query)[0:10]]
+
+    def test_index_is_installed(self):
+        self.assertTrue(search.is_available())
+
+    def test_search_by_title_and_summary(self):
+        self.assertEqual(self.search('capitu'), ['Dom Casmurro'])
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('casmurro'), ['Dom Casmurro', 'Memórias Póstumas'])
+
+    def test_search_ignores_diacritics_and_matches_prefixes(self):
+        self.assertEqual(self.search('memor'), ['Memórias Póstumas'])
+
+    def test_search_by_author_follows_renames(self):
+        self.author.last_name = 'Assis Jr.'
+        self.author.save()
+
+        self.assertEqual(len(self.search('assis jr')), 2)
+
+    def test_search_by_genre(self):
+        genre = Genre.objects.create(name='Realismo')
+        self.book.genre.add(genre)
+        self.assertEqual(self.search('realismo'), ['Dom Casmurro'])
+
+        genre.name = 'Romance'
+        genre.save()
+        self.assertEqual(self.search('romance'), ['Dom Casmurro'])
+
+        self.book.genre.remove(genre)
+        self.assertEqual(self.search('romance'), [])
+
+    def test_only_indexed_columns_reindex_a_book(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE} WHERE rowid = %s', [self.book.pk])
+
+        Book.objects.filter(pk=self.book.pk).update(available_copies=F('available_copies') + 1)
+        self.assertEqual(self.search('capitu'), [])
+
+        Book.objects.filter(pk=self.book.pk).update(summary='Capitu e Bentinho')
+        self.assertEqual(self.search('capitu'), ['Dom Casmurro'])
+
+    def test_deleted_books_are_not_found(self):
+        self.book.delete()
+        self.assertEqual(self.search('capitu'), [])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search('"capitu" * ('), ['Dom Casmurro'])
+        self.assertEqual(self.search('   '), [])
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+
+        self.assertIn('2 livro(s) indexado(s)', out.getvalue())
+        self.assertEqual(self.search('capitu'), ['Dom Casmurro'])
+
+
+class BookSearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(12):
+            Book.objects.create(title=f'Crônica {number}', summary='Resumo', isbn=f'{number:07d}')
+
+    def test_results_are_paginated(self):
+        response = self.client.get(reverse('search'), {'q': 'cronica'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_search.html')
+        self.assertEqual(len(response.context['book_list']), 10)
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertContains(response, '?q=cronica&page=2')
+
+        response = self.client.get(reverse('search'), {'q': 'cronica', 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 2)
+
+    def test_available_only(self):
+        for book in Book.objects.filter(title__in=['Crônica 1', 'Crônica 2']):
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=Book.objects.get(title='Crônica 3'), imprint='Imprint', status='m')
+
+        response = self.client.get(reverse('search'), {'q': 'cronica', 'available': '1'})
+        self.assertEqual(response.context['paginator'].count, 2)
+        self.assertEqual(sorted(book.title for book in response.context['book_list']), ['Crônica 1', 'Crônica 2'])
+        self.assertContains(response, '1 de 1 disponível')
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('search'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 0)
@@ -0,0 +1,58 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count, Q
+from django.test import TestCase
+
+from catalog import counters
+from catalog.models import Author, Book, BookInstance, User
+
+
+class SeedCatalogTest(TestCase):
+    def test_seeds_a_consistent_catalog(self):
+        cache.clear()
+        call_command('seed_catalog', authors=20, books=100, copies=3, users=10, batch_size=30, stdout=StringIO())
+
+        self.assertEqual(Author.objects.count(), 20)
+        self.assertEqual(Book.objects.count(), 100)
+        self.assertEqual(User.objects.count(), 10)
+        self.assertFalse(Book.objects.filter(genre=None).exists())
+        self.assertFalse(BookInstance.objects.filter(status='o', borrower=None).exists())
+        self.assertEqual(counters.get_counts()['num_instances'], BookInstance.objects.count())
+
+        for user in User.objects.annotate(loans=Count('bookinstance', filter=Q(bookinstance__status='o'))):
+            self.assertEqual(user.active_loans, user.loans)
+
+    def test_can_run_twice(self):
+        call_command('seed_catalog', authors=5, books=10, users=2, stdout=StringIO())
+        call_command('seed_catalog', authors=5, books=10, users=2, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 20)
+        self.assertEqual(User.objects.count(), 4)
+
+
+class BenchCatalogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_catalog', authors=5, books=10, users=2, stdout=StringIO())
+        User.objects.create_superuser(username='admin', password='12345')
+
+    def test_benchmarks_every_route_and_compares_with_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            call_command('bench_catalog', repeat=2, save=baseline, stdout=StringIO(), stderr=StringIO())
+
+            routes = json.loads(baseline.read_text())['routes']
+            self.assertIn('books', routes)
+            self.assertIn('book-update', routes)
+            self.assertIn('return-book', routes)
+            self.assertEqual(routes['books']['status'], [200])
+            self.assertGreater(routes['books']['queries'], 0)
+
+            out = StringIO()
+            call_command('bench_catalog', repeat=2, compare=baseline, routes=['books'], stdout=out)
+            self.assertIn('p95', out.getvalue())
+            self.assertNotIn('author', out.getvalue())
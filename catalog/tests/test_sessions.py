@@ -0,0 +1,93 @@
+from io import StringIO
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import User
+from catalog.sessions import SessionStore
+
+
+class VisitCounterTest(TestCase):
+    def test_anonymous_visits_write_nothing(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+
+        self.assertEqual(response.context['num_visits'], 1)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_counter_cookie_is_signed(self):
+        self.client.cookies['num_visits'] = '41'
+
+        response = self.client.get(reverse('index'))
+
+        self.assertEqual(response.context['num_visits'], 0)
+
+
+@override_settings(SESSION_ENGINE='catalog.sessions', CATALOG_SESSION_WRITE_INTERVAL=60)
+class CoalescingSessionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_changes_within_the_interval_only_go_to_the_cache(self):
+        session = SessionStore()
+        session['num_visits'] = 1
+        session.save()
+        self.assertEqual(Session.objects.count(), 1)
+
+        for visits in range(2, 5):
+            session = SessionStore(session.session_key)
+            session['num_visits'] = visits
+            with self.assertNumQueries(0):
+                session.save()
+
+        self.assertEqual(SessionStore(session.session_key)['num_visits'], 4)
+        stored = Session.objects.get().get_decoded()
+        self.assertEqual(stored['num_visits'], 1)
+
+    @override_settings(CATALOG_SESSION_WRITE_INTERVAL=0)
+    def test_database_copy_is_refreshed_after_the_interval(self):
+        session = SessionStore()
+        session['num_visits'] = 1
+        session.save()
+        session['num_visits'] = 2
+        session.save()
+
+        self.assertEqual(Session.objects.get().get_decoded()['num_visits'], 2)
+
+    def test_sessions_survive_cache_loss(self):
+        session = SessionStore()
+        session['num_visits'] = 1
+        session.save()
+        cache.clear()
+
+        self.assertEqual(SessionStore(session.session_key)['num_visits'], 1)
+
+    def test_login_and_logout(self):
+        User.objects.create_user(username='leitor', password='12345')
+        self.assertTrue(self.client.login(username='leitor', password='12345'))
+
+        response = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Session.objects.count(), 1)
+
+        self.client.logout()
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(self.client.get(reverse('my-borrowed')).status_code, 302)
+
+
+class BenchSessionsTest(TestCase):
+    def test_reports_writes_per_engine(self):
+        out = StringIO()
+        call_command('bench_sessions', '--visitors', '2', '--requests', '3',
+                     '--engines', 'db', 'coalescing', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('índice: 0.00 escritas/req', lines[0])
+        self.assertIn('sessão alterada: 1.00 escritas/req', lines[0])
+        self.assertIn('sessão alterada: 0.33 escritas/req', lines[1])
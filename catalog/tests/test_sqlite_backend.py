@@ -0,0 +1,82 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+
+from catalog.backends.sqlite3.base import DatabaseWrapper
+from catalog.models import Book, BookInstance
+
+
+class SQLiteProfileTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+
+    def open(self, options):
+        db = DatabaseWrapper({**connection.settings_dict, 'NAME': self.path, 'OPTIONS': options}, alias='profile')
+        self.addCleanup(db.close)
+        return db
+
+    def pragma(self, db, name):
+        with db.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_production_pragmas(self):
+        db = self.open(settings.SQLITE_PROFILES['production']['OPTIONS'])
+
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(db, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(db, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(db, 'cache_size'), -20000)
+        self.assertEqual(self.pragma(db, 'temp_store'), 2)  # MEMORY
+
+    def test_transaction_mode(self):
+        db = self.open({'transaction_mode': 'immediate'})
+        db.force_debug_cursor = True
+
+        db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        db.rollback()
+        db.set_autocommit(True)
+
+        self.assertEqual([q['sql'] for q in db.queries], ['BEGIN IMMEDIATE', 'ROLLBACK'])
+
+    def test_default_transaction_mode(self):
+        db = self.open({})
+        db.force_debug_cursor = True
+
+        db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        db.rollback()
+        db.set_autocommit(True)
+
+        self.assertEqual([q['sql'] for q in db.queries], ['BEGIN', 'ROLLBACK'])
+
+    def test_invalid_transaction_mode(self):
+        db = self.open({'transaction_mode': 'LAZY'})
+
+        with self.assertRaises(ImproperlyConfigured):
+            db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+
+
+class BenchSQLiteTest(TransactionTestCase):
+    # The database is copied with the backup API, which waits for open transactions
+
+    def test_reports_every_profile(self):
+        book = Book.objects.create(title='Dom Casmurro', summary='', isbn='0000000')
+        for _ in range(3):
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        out = StringIO()
+
+        call_command('bench_sqlite', '--seconds', '0.2', '--readers', '1', '--writers', '1', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], sorted(settings.SQLITE_PROFILES))
+        self.assertIn('erros de bloqueio: 0', lines[-1])
+        # Only the copy was written to
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 3)
@@ -1,14 +1,79 @@
-from django.test import TestCase
+import datetime
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 
-from catalog.models import Author
+from catalog import counters
+from catalog.models import Author, Book, BookInstance, Genre, Language
 
 User = get_user_model()
 
 
+class IndexViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        book = Book.objects.create(title='Dom Casmurro', author=author, summary='Summary', isbn='0000000')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='m')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_on_cold_cache(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_books'], 1)
+        self.assertEqual(response.context['num_instances'], 2)
+        self.assertEqual(response.context['num_instances_available'], 1)
+        self.assertEqual(response.context['num_authors'], 1)
+
+    def test_no_aggregate_queries_on_warm_cache(self):
+        self.client.get(reverse('index'))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_counts_follow_changes(self):
+        self.client.get(reverse('index'))
+        book = Book.objects.get(id=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.filter(status='m').get().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.status = 'o'
+            copy.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Author.objects.create(first_name='Clarice', last_name='Lispector')
+
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_instances'], 2)
+        self.assertEqual(response.context['num_instances_available'], 1)
+        self.assertEqual(response.context['num_authors'], 2)
+
+    def test_reconcile_counters_fixes_drift(self):
+        self.client.get(reverse('index'))
+        cache.set('catalog:counters:num_books', 42)
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+
+        self.assertIn('num_books: 42 -> 1', out.getvalue())
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_books'], 1)
+
+
 class AuthorListViewTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -21,6 +86,8 @@ class AuthorListViewTest(TestCase):
             )
 
     def setUp(self):
+        # The list's total comes from the cached counters
+        cache.clear()
         self.test_user = User.objects.create_user(username='testuser', password='12345')
 
     def test_view_url_exists_at_desired_location(self):
@@ -60,4 +127,400 @@ class AuthorListViewTest(TestCase):
 
     def test_view_redirects_unauthenticated(self):
         response = self.client.get(reverse('authors'), follow=True)
-        self.assertRedirects(response, f'/accounts/login/?next=/catalog/authors/')
\ No newline at end of file
+        self.assertRedirects(response, f'/accounts/login/?next=/catalog/authors/')
+
+    @override_settings(CATALOG_PAGINATION_MODE='cursor')
+    def test_cursor_pagination(self):
+        self.client.force_login(self.test_user)
+        response = self.client.get(reverse('authors'))
+        first_page = list(response.context['author_list'])
+        self.assertEqual(len(first_page), 10)
+        self.assertEqual(response.context['paginator'].count, 13)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+        response = self.client.get(reverse('authors'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(response.context['author_list']), 3)
+        self.assertFalse(response.context['page_obj'].has_next())
+
+        response = self.client.get(reverse('authors'), {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(list(response.context['author_list']), first_page)
+
+    @override_settings(CATALOG_PAGINATION_MODE='cursor-nocount')
+    def test_cursor_pagination_without_count(self):
+        self.client.force_login(self.test_user)
+        counters.get_counts()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('authors'))
+
+        self.assertIsNone(response.context['paginator'].count)
+        # Only the per-author book counts, no total count
+        self.assertFalse([q for q in queries if q['sql'].upper().startswith('SELECT COUNT(')])
+        self.assertContains(response, 'próximo')
+
+    def test_invalid_cursor(self):
+        self.client.force_login(self.test_user)
+        response = self.client.get(reverse('authors'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_book_counts(self):
+        author = Author.objects.get(first_name='Dominique 0')
+        for number in range(2):
+            Book.objects.create(title=f'Livro {number}', author=author, summary='', isbn=f'{number:07d}')
+        self.client.force_login(self.test_user)
+
+        response = self.client.get(reverse('authors'))
+
+        counts = {author.first_name: author.num_books for author in response.context['author_list']}
+        self.assertEqual(counts['Dominique 0'], 2)
+        self.assertEqual(counts['Dominique 1'], 0)
+        self.assertContains(response, '(2 livros)')
+
+
+class BookListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Book n has n % 4 available copies and one in maintenance
+        for number in range(13):
+            book = Book.objects.create(title=f'Livro {number:02d}', summary='', isbn=f'{number:07d}')
+            for status in ['a'] * (number % 4) + ['m']:
+                BookInstance.objects.create(book=book, imprint='Imprint', status=status)
+
+    def setUp(self):
+        cache.clear()
+
+    def expected_by_availability(self):
+        books = sorted(Book.objects.all(), key=lambda book: (-(int(book.title[-2:]) % 4), book.title))
+        return [book.title for book in books]
+
+    def test_shows_availability(self):
+        response = self.client.get(reverse('books'))
+        self.assertContains(response, 'Livro 01</a> (None)\n        &mdash; 1 de 2 disponível')
+        self.assertContains(response, 'Livro 03</a> (None)\n        &mdash; 3 de 4 disponíveis')
+
+    def test_available_only(self):
+        response = self.client.get(reverse('books'), {'available': '1', 'page': 1})
+        titles = [book.title for book in response.context['book_list']]
+        self.assertEqual(len(titles), 9)
+        self.assertNotIn('Livro 00', titles)
+        self.assertNotIn('Livro 04', titles)
+        self.assertEqual(response.context['paginator'].count, 9)
+
+    def test_sort_by_availability(self):
+        response = self.client.get(reverse('books'), {'sort': 'availability'})
+        titles = [book.title for book in response.context['book_list']]
+        self.assertEqual(titles, self.expected_by_availability()[:10])
+        self.assertContains(response, '?sort=availability&page=2')
+
+    @override_settings(CATALOG_PAGINATION_MODE='cursor')
+    def test_sort_by_availability_with_cursors(self):
+        params = {'sort': 'availability'}
+        response = self.client.get(reverse('books'), params)
+        first_page = [book.title for book in response.context['book_list']]
+        next_cursor = response.context['page_obj'].next_cursor
+
+        response = self.client.get(reverse('books'), {**params, 'cursor': next_cursor})
+        second_page = [book.title for book in response.context['book_list']]
+        self.assertEqual(first_page + second_page, self.expected_by_availability())
+
+        response = self.client.get(reverse('books'), {**params, 'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual([book.title for book in response.context['book_list']], first_page)
+
+    @override_settings(ROOT_URLCONF='bib.urls_async')
+    def test_async_view(self):
+        response = self.client.get(reverse('books'), {'sort': 'availability', 'available': '1'})
+        titles = [book.title for book in response.context['book_list']]
+        self.assertEqual(titles, [title for title in self.expected_by_availability() if int(title[-2:]) % 4][:10])
+        self.assertTrue(response.context['sort_by_availability'])
+
+
+@override_settings(CATALOG_PAGINATION_MODE='cursor')
+class AllBorrowedBooksViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(title='Dom Casmurro', summary='Summary', isbn='0000000')
+        borrower = User.objects.create_user(username='borrower', password='12345')
+        today = datetime.date.today()
+        for days in range(12):
+            # Two loans per due date, so that the cursor has to break ties on id
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=borrower,
+                due_back=today + datetime.timedelta(days=days // 2))
+
+        cls.librarian = User.objects.create_user(username='librarian', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+    def test_pages_follow_due_back_and_id(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('all-borrowed'))
+        copies = list(response.context['bookinstance_list'])
+
+        response = self.client.get(reverse('all-borrowed'), {'cursor': response.context['page_obj'].next_cursor})
+        copies += list(response.context['bookinstance_list'])
+
+        expected = list(BookInstance.objects.order_by('due_back', 'id'))
+        self.assertEqual(copies, expected)
+
+class BookDetailViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.book = Book.objects.create(title='Dom Casmurro', author=author, summary='Summary', isbn='0000000')
+        cls.language = Language.objects.create(name='Português')
+        cls.book.genre.add(Genre.objects.create(name='Romance'))
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+
+    def create_copies(self, number, **kwargs):
+        for _ in range(number):
+            BookInstance.objects.create(book=self.book, imprint='Imprint', language=self.language, **kwargs)
+
+    def get_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_copies(self):
+        self.client.force_login(self.user)
+        self.create_copies(1)
+        few_copies = self.get_query_count()
+
+        self.create_copies(40)
+        self.assertEqual(self.get_query_count(), few_copies)
+
+    def test_copies_are_paginated(self):
+        self.create_copies(25)
+
+        response = self.client.get(reverse('book', args=[self.book.pk]) + '?page=2')
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['copies']), 5)
+
+    def test_copies_are_grouped(self):
+        self.create_copies(3, status='a')
+        self.create_copies(2, status='m')
+
+        response = self.client.get(reverse('book', args=[self.book.pk]))
+        groups = {group['status']: group['total'] for group in response.context['copy_groups']}
+        self.assertEqual(groups, {'a': 3, 'm': 2})
+        self.assertContains(response, 'Em manutenção')
+
+
+class AuthorDetailViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_books(self, number):
+        start = Book.objects.count()
+        for i in range(start, start + number):
+            Book.objects.create(title=f'Livro {i:03d}', author=self.author, summary='', isbn=f'{i:07d}')
+
+    def get_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('author', args=[self.author.pk]))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_books(self):
+        self.client.force_login(self.user)
+        self.create_books(1)
+        few_books = self.get_query_count()
+
+        self.create_books(40)
+        self.assertEqual(self.get_query_count(), few_books)
+
+    def test_books_are_paginated(self):
+        self.create_books(25)
+
+        response = self.client.get(reverse('author', args=[self.author.pk]), {'page': 2})
+
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(response.context['paginator'].count, 25)
+        self.assertEqual([book.title for book in response.context['books']], [f'Livro {i:03d}' for i in range(20, 25)])
+        self.assertContains(response, 'Livro 024')
+        self.assertNotContains(response, 'Livro 000')
+
+    def test_delete_link_only_without_books(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='delete_author'))
+        self.client.force_login(self.user)
+        url = reverse('author', args=[self.author.pk])
+        self.assertContains(self.client.get(url), 'Deletar autor')
+
+        self.create_books(1)
+        self.assertNotContains(self.client.get(url), 'Deletar autor')
+
+
+class DeleteViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.book = Book.objects.create(title='Dom Casmurro', author=cls.author, summary='', isbn='0000000')
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.user.user_permissions.add(*Permission.objects.filter(codename__in=['delete_author', 'delete_book']))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_author_with_books_is_not_deleted(self):
+        url = reverse('author-delete', args=[self.author.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'Dom Casmurro')
+        self.assertNotContains(response, 'value="Sim"')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertRedirects(response, url)
+        self.assertFalse([q for q in queries if q['sql'].startswith(('DELETE', 'SAVEPOINT', 'BEGIN'))])
+        self.assertTrue(Author.objects.filter(pk=self.author.pk).exists())
+
+    def test_author_without_books_is_deleted(self):
+        author = Author.objects.create(first_name='José', last_name='de Alencar')
+
+        response = self.client.post(reverse('author-delete', args=[author.pk]))
+
+        self.assertRedirects(response, reverse('authors'))
+        self.assertFalse(Author.objects.filter(pk=author.pk).exists())
+
+    def test_book_with_copies_is_not_deleted(self):
+        BookInstance.objects.create(book=self.book, imprint='Garnier', status='a')
+        url = reverse('book-delete', args=[self.book.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'todas as 1 cópias')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertRedirects(response, url)
+        self.assertFalse([q for q in queries if q['sql'].startswith(('DELETE', 'SAVEPOINT', 'BEGIN'))])
+        self.assertTrue(Book.objects.filter(pk=self.book.pk).exists())
+
+    def test_book_without_copies_is_deleted(self):
+        response = self.client.post(reverse('book-delete', args=[self.book.pk]))
+
+        self.assertRedirects(response, reverse('books'))
+        self.assertFalse(Book.objects.filter(pk=self.book.pk).exists())
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Machado', last_name='de Assis')
+        cls.book = Book.objects.create(title='Dom Casmurro', author=cls.author, summary='Summary', isbn='0000000')
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Garnier', status='a')
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.other = User.objects.create_user(username='otheruser', password='12345')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('book', args=[self.book.pk])
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, headers={'if-none-match': etag})
+
+    def test_unchanged_page_is_not_rendered(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.revalidate(self.url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.templates, [])
+
+    def test_changes_are_not_served_stale(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.copy.imprint = 'Garnier, 1899'
+        self.copy.save()
+        response = self.revalidate(self.url, etag)
+        self.assertContains(response, 'Garnier, 1899')
+        etag = response['ETag']
+
+        self.author.last_name = 'Assis'
+        self.author.save()
+        response = self.revalidate(self.url, etag)
+        self.assertContains(response, 'Assis, Machado')
+        etag = response['ETag']
+
+        BookInstance.objects.filter(pk=self.copy.pk).delete()
+        self.assertEqual(self.revalidate(self.url, etag).status_code, 200)
+
+    def test_etag_depends_on_the_user(self):
+        anonymous = self.client.get(self.url)['ETag']
+
+        self.client.force_login(self.user)
+        response = self.revalidate(self.url, anonymous)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.revalidate(self.url, etag).status_code, 304)
+
+        self.user.user_permissions.add(Permission.objects.get(codename='change_bookinstance'))
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+        self.assertEqual(self.revalidate(self.url, etag).status_code, 200)
+
+    def test_hold_queue_changes(self):
+        BookInstance.objects.filter(pk=self.copy.pk).update(status='o')
+        self.client.force_login(self.user)
+        self.client.post(reverse('place-hold', args=[self.book.pk]))
+        etag = self.client.get(self.url)['ETag']
+
+        self.client.force_login(self.other)
+        self.client.post(reverse('place-hold', args=[self.book.pk]))
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.revalidate(self.url, etag).status_code, 200)
+
+    def test_missing_book(self):
+        response = self.client.get(reverse('book', args=[self.book.pk + 100]))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+    def test_book_list(self):
+        url = reverse('books')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        Book.objects.create(title='Quincas Borba', author=self.author, summary='', isbn='0000001')
+        response = self.revalidate(url, etag)
+        self.assertContains(response, 'Quincas Borba')
+
+        Book.objects.get(isbn='0000001').delete()
+        self.assertEqual(self.revalidate(url, response['ETag']).status_code, 200)
+
+    def test_search_follows_genre_renames(self):
+        genre = Genre.objects.create(name='Realismo')
+        self.book.genre.add(genre)
+        url = reverse('search') + '?q=romance'
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Dom Casmurro')
+        self.assertEqual(self.revalidate(url, response['ETag']).status_code, 304)
+
+        genre.name = 'Romance'
+        genre.save()
+        self.assertContains(self.revalidate(url, response['ETag']), 'Dom Casmurro')
+
+    def test_author_pages(self):
+        self.client.force_login(self.user)
+        url = reverse('author', args=[self.author.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        Book.objects.create(title='Quincas Borba', author=self.author, summary='', isbn='0000001')
+        self.assertContains(self.revalidate(url, etag), 'Quincas Borba')
+
+        url = reverse('authors')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        self.client.logout()
+        self.assertEqual(self.revalidate(url, etag).status_code, 302)
+
+    @override_settings(ROOT_URLCONF='bib.urls_async')
+    async def test_async_views(self):
+        response = await self.async_client.get(self.url)
+        response = await self.async_client.get(self.url, headers={'if-none-match': response['ETag']})
+
+        self.assertEqual(response.status_code, 304)
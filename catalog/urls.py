@@ -1,10 +1,11 @@
 from django.urls import path
-from . import views
+from . import api, async_views, views
 from django.contrib.auth.decorators import login_required
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('books/', views.BookListView.as_view(), name='books'),
+    path('search/', views.BookSearchView.as_view(), name='search'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book'),
     path('book/create/', views.BookCreate.as_view(), name='book-create'),
     path('book/<int:pk>/update/', views.BookUpdate.as_view(), name='book-update'),
@@ -18,8 +19,34 @@ urlpatterns = [
     path('author/<int:pk>/delete/', views.AuthorDelete.as_view(), name='author-delete'),
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
     path('allbooks/', views.AllBorrowedBooksView.as_view(), name='all-borrowed'),
+    path('export/<str:kind>/', views.export_catalog, name='export'),
+    path('metrics/', views.metrics, name='metrics'),
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
     path('authors/', login_required(views.AuthorListView.as_view()), name='authors'),
     path('book/<uuid:pk>/borrow/', views.borrow_book, name='borrow-book'),
     path('book/<uuid:pk>/return/', views.return_book, name='return-book'),
+    path('book/<int:pk>/hold/', views.place_hold, name='place-hold'),
+    path('hold/<int:pk>/cancel/', views.cancel_hold, name='cancel-hold'),
+    path('circulation/batch/', views.batch_circulation, name='batch-circulation'),
+    path('api/v1/', api.api_root, name='api-root'),
+    path('api/v1/books/', api.resource_list, {'resource': 'books'}, name='api-books'),
+    path('api/v1/books/<int:pk>/', api.resource_detail, {'resource': 'books'}, name='api-book'),
+    path('api/v1/authors/', api.resource_list, {'resource': 'authors'}, name='api-authors'),
+    path('api/v1/authors/<int:pk>/', api.resource_detail, {'resource': 'authors'}, name='api-author'),
+    path('api/v1/copies/', api.resource_list, {'resource': 'copies'}, name='api-copies'),
+    path('api/v1/copies/<uuid:pk>/', api.resource_detail, {'resource': 'copies'}, name='api-copy'),
+    path('api/v1/genres/', api.resource_list, {'resource': 'genres'}, name='api-genres'),
+    path('api/v1/genres/<int:pk>/', api.resource_detail, {'resource': 'genres'}, name='api-genre'),
+    path('api/v1/languages/', api.resource_list, {'resource': 'languages'}, name='api-languages'),
+    path('api/v1/languages/<int:pk>/', api.resource_detail, {'resource': 'languages'}, name='api-language'),
+]
+
+# Async versions of the browsing views, used by bib.urls_async
+async_urlpatterns = [
+    path('', async_views.index, name='index'),
+    path('books/', async_views.book_list, name='books'),
+    path('book/<int:pk>', async_views.book_detail, name='book'),
+    path('author/<int:pk>', async_views.author_detail, name='author'),
+    path('authors/', async_views.author_list, name='authors'),
+    path('export/<str:kind>/', async_views.export_catalog, name='export'),
 ]
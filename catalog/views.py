@@ -1,38 +1,62 @@
 import datetime
+import json
+from urllib.parse import urlencode
 
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.http import HttpResponseRedirect
+from django.core.paginator import Paginator
+from django.db.models import Count, Exists, F, OuterRef, RestrictedError
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import require_POST
 from django.urls import reverse, reverse_lazy
 from django.views import generic
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
-from .models import Book, Author, BookInstance
+from .models import Book, Author, BookInstance, Hold
 
-from catalog.forms import RenewBookModelForm, BorrowBookModelForm, ReturnBookModelForm
+from catalog import circulation, conditional, counters, export, fragments, metrics as catalog_metrics, replicas
+from catalog.circulation import CirculationConflict
+from catalog.pagination import CursorPaginationMixin, EstimatedCountPaginator
+from catalog.search import search_books
+from catalog.forms import BatchCirculationForm, RenewBookModelForm, BorrowBookModelForm, ReturnBookModelForm
 
+VISITS_COOKIE = 'num_visits'
+
+
+def get_visits(request):
+    # A signed cookie rather than the session, so that anonymous visits do
+    # not create sessions, nor write to the database
+    return int(request.get_signed_cookie(VISITS_COOKIE, default=0, salt=VISITS_COOKIE))
+
+
+def set_visits(response, visits):
+    response.set_signed_cookie(
+        VISITS_COOKIE, str(visits), salt=VISITS_COOKIE,
+        max_age=60 * 60 * 24 * 365, httponly=True, samesite='Lax',
+    )
+
+
+@replicas.read_from_replica
 def index(request):
-    # Generate counts of some of the main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    num_instances_available = BookInstance.objects.filter(
-        status__exact='a').count()
-    num_authors = Author.objects.count()
+    # Counts of the main objects, served from the cache (see catalog.counters)
+    counts = counters.get_counts()
 
-    # Number of visits to this view, as counted in the session variable.
-    num_visits = request.session.get('num_visits', 0)
-    request.session['num_visits'] = num_visits + 1
+    # Number of visits to this view, as counted in a cookie.
+    num_visits = get_visits(request)
 
     context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
+        **counts,
         'num_visits': num_visits,
     }
 
     # Render the HTML template index.html with the data in the context variable
-    return render(request, 'index.html', context=context)
+    response = render(request, 'index.html', context=context)
+    set_visits(response, num_visits + 1)
+    return response
 
 
 @login_required
@@ -44,10 +68,12 @@ def renew_book_librarian(request, pk):
         form = RenewBookModelForm(request.POST)
 
         if form.is_valid():
-            book_instance.due_back = form.cleaned_data['due_back']
-            book_instance.save()
-
-            return HttpResponseRedirect(reverse('all-borrowed'))
+            try:
+                circulation.renew(book_instance, form.cleaned_data['due_back'])
+            except CirculationConflict as e:
+                form.add_error(None, e.message)
+            else:
+                return HttpResponseRedirect(reverse('all-borrowed'))
     else:
         proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
         form = RenewBookModelForm(initial={'due_back': proposed_renewal_date})
@@ -64,15 +90,15 @@ def borrow_book(request, pk):
     book_instance = get_object_or_404(BookInstance, pk=pk)
 
     if request.method == 'POST':
-        form = BorrowBookModelForm(request.user, request.POST)
+        form = BorrowBookModelForm(request.user, request.POST, instance=book_instance)
 
         if form.is_valid():
-            book_instance.borrower = form.user
-            book_instance.due_back = form.cleaned_data['due_back']
-            book_instance.status = 'o'
-            book_instance.save()
-
-            return HttpResponseRedirect(reverse('all-borrowed'))
+            try:
+                circulation.borrow(book_instance, form.user, form.cleaned_data['due_back'])
+            except CirculationConflict as e:
+                form.add_error(None, e.message)
+            else:
+                return HttpResponseRedirect(reverse('all-borrowed'))
     else:
         proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
         form = BorrowBookModelForm(request.user, initial={'due_back': proposed_renewal_date})
@@ -88,17 +114,17 @@ def borrow_book(request, pk):
 def return_book(request, pk):
     book_instance = get_object_or_404(BookInstance, pk=pk)
 
-    form = ReturnBookModelForm(request.user, request.POST)
-
     if request.method == 'POST':
+        form = ReturnBookModelForm(request.user, request.POST, instance=book_instance)
+
         if form.is_valid():
-            book_instance.borrower = None
-            book_instance.due_back = None
-            book_instance.status = 'a'
-            book_instance.save()
+            try:
+                circulation.return_copy(book_instance)
+            except CirculationConflict as e:
+                form.add_error(None, e.message)
+            else:
+                return HttpResponseRedirect(reverse('my-borrowed'))
 
-            return HttpResponseRedirect(reverse('my-borrowed'))
-        
     else:
         form = ReturnBookModelForm(None, initial={'due_back': None})
 
@@ -110,49 +136,425 @@ def return_book(request, pk):
     return render(request, 'catalog/book_return.html', context)
 
 
-class BookListView(generic.ListView):
+@login_required
+def place_hold(request, pk):
+    book = get_object_or_404(Book, pk=pk)
+    error = None
+
+    if request.method == 'POST':
+        try:
+            circulation.place_hold(book, request.user)
+        except CirculationConflict as e:
+            error = e.message
+        else:
+            return HttpResponseRedirect(book.get_absolute_url())
+
+    return render(request, 'catalog/book_hold.html', {'book': book, 'error': error})
+
+
+@login_required
+@require_POST
+def cancel_hold(request, pk):
+    hold = get_object_or_404(Hold, pk=pk, patron=request.user)
+    try:
+        circulation.release_hold(hold)
+    except CirculationConflict:
+        pass  # Already released
+    return HttpResponseRedirect(reverse('my-borrowed'))
+
+
+def batch_form_data(request):
+    """The batch form's data from a JSON body, with the copies as a list."""
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return None
+    copies = data.get('copies')
+    if isinstance(copies, list):
+        data['copies'] = '\n'.join(str(copy_id) for copy_id in copies)
+    return data
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def batch_circulation(request):
+    """
+    Borrows, returns or renews a cart of copies at the desk, from the form
+    or from a JSON body ({"action": ..., "copies": [...], "borrower": ...,
+    "due_back": ...}), which gets a JSON answer.
+    """
+    is_json = request.content_type == 'application/json'
+    results = None
+    if is_json and request.method != 'POST':
+        response = JsonResponse({'detail': 'Método não permitido: use POST.'}, status=405)
+        response['Allow'] = 'POST'
+        return response
+
+    if request.method == 'POST':
+        data = batch_form_data(request) if is_json else request.POST
+        if data is None:
+            return JsonResponse({'detail': 'JSON inválido.'}, status=400)
+
+        form = BatchCirculationForm(data)
+        if form.is_valid():
+            results = circulation.batch(
+                form.cleaned_data['action'], form.cleaned_data['copies'],
+                borrower=form.cleaned_data['borrower'], due_back=form.cleaned_data['due_back'],
+            )
+        elif is_json:
+            errors = form.errors.get_json_data()
+            return JsonResponse({
+                'errors': {field: [error['message'] for error in messages] for field, messages in errors.items()},
+            }, status=400)
+    else:
+        form = BatchCirculationForm(initial={
+            'action': 'return',
+            'due_back': datetime.date.today() + datetime.timedelta(weeks=3),
+        })
+
+    if is_json:
+        return JsonResponse({
+            'results': [
+                {'id': result.id, 'ok': result.error is None, 'status': result.status, 'error': result.error}
+                for result in results
+            ],
+            'succeeded': sum(result.error is None for result in results),
+            'failed': sum(result.error is not None for result in results),
+        })
+
+    status_names = dict(BookInstance.LOAN_STATUS)
+    return render(request, 'catalog/batch_circulation.html', {
+        'form': form,
+        'results': results and [
+            {**result._asdict(), 'status_display': status_names.get(result.status)} for result in results
+        ],
+        'succeeded': results and sum(result.error is None for result in results),
+    })
+
+
+def export_options(request, kind):
+    """The format and filters of an export request."""
+    if kind not in export.EXPORTS:
+        raise Http404
+
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in export.FORMATS:
+        file_format = 'csv'
+
+    filters = {
+        'status': request.GET.get('status'),
+        'overdue': request.GET.get('overdue') in ('1', 'true'),
+        'genre': request.GET.get('genre'),
+    }
+    return file_format, filters
+
+
+def export_response(lines, kind, file_format):
+    response = StreamingHttpResponse(lines, content_type=export.FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{file_format}"'
+    return response
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def export_catalog(request, kind):
+    file_format, filters = export_options(request, kind)
+    return export_response(export.export_lines(kind, file_format, filters), kind, file_format)
+
+
+@staff_member_required
+def metrics(request):
+    return HttpResponse(
+        catalog_metrics.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def available_only(request):
+    return request.GET.get('available') == '1'
+
+
+# Validators of the pages' ETags (see catalog.conditional), one query each.
+
+def book_list_validators(request, *args, **kwargs):
+    # Any change to a book, including its copy counts, moves the newest
+    # updated_at; deleted books change the count.
+    latest = (
+        Book.objects.order_by('-updated_at')
+        .values('updated_at', authors=conditional.latest(Author.objects.all()))
+        .first()
+    )
+    return latest, counters.get_counts()['num_books']
+
+
+def book_search_validators(request, *args, **kwargs):
+    # Search also matches genre names, whose renames leave the books alone
+    return book_list_validators(request), fragments.version(('genres',))
+
+
+def book_detail_validators(request, pk):
+    copies = BookInstance.objects.filter(book=OuterRef('pk'))
+    holds = Hold.objects.filter(book=OuterRef('pk'))
+    validators = Book.objects.filter(pk=pk).values(
+        'updated_at', 'author_id',
+        author_updated_at=F('author__updated_at'),
+        copies_updated_at=conditional.latest(copies),
+        copies=conditional.count(copies, 'book'),
+        # Queue positions change when earlier holds go away
+        holds_created_at=conditional.latest(holds, 'created_at'),
+        holds=conditional.count(holds, 'book'),
+    ).first()
+    if validators is None:
+        return None
+    # The genre and language names
+    version = fragments.version(*book_fragment_objects(Book(pk=pk, author_id=validators['author_id'])))
+    return validators, version
+
+
+def author_list_validators(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    # The book counts change with any book's author
+    latest = (
+        Author.objects.order_by('-updated_at')
+        .values('updated_at', books=conditional.latest(Book.objects.all()))
+        .first()
+    )
+    counts = counters.get_counts()
+    return latest, counts['num_authors'], counts['num_books']
+
+
+def author_detail_validators(request, pk):
+    books = Book.objects.filter(author=OuterRef('pk'))
+    return Author.objects.filter(pk=pk).values(
+        'updated_at',
+        books_updated_at=conditional.latest(books),
+        books=conditional.count(books, 'author'),
+    ).first()
+
+
+@method_decorator(replicas.read_from_replica, name='dispatch')
+@method_decorator(conditional.conditional_page(book_list_validators), name='dispatch')
+class BookListView(CursorPaginationMixin, generic.ListView):
     model = Book
     paginate_by = 10
+    paginator_class = EstimatedCountPaginator
+    ordering = ['title', 'id']
+    # ?sort=availability: most available copies first
+    availability_ordering = ['-available_copies', 'title', 'id']
+
+    def sort_by_availability(self):
+        return self.request.GET.get('sort') == 'availability'
+
+    def get_ordering(self):
+        return self.availability_ordering if self.sort_by_availability() else self.ordering
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('author')
+        if available_only(self.request):
+            queryset = queryset.filter(available_copies__gt=0)
+        return queryset
+
+    def get_options_context(self):
+        params = {}
+        if available_only(self.request):
+            params['available'] = '1'
+        if self.sort_by_availability():
+            params['sort'] = 'availability'
+        return {
+            'available_only': 'available' in params,
+            'sort_by_availability': 'sort' in params,
+            'pagination_query': urlencode(params),
+        }
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_options_context())
+        return context
+
+
+@method_decorator(replicas.read_from_replica, name='dispatch')
+@method_decorator(conditional.conditional_page(book_search_validators), name='dispatch')
+class BookSearchView(generic.ListView):
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+
+    def get_queryset(self):
+        return search_books(self.request.GET.get('q', '').strip(), available_only=available_only(self.request))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        params = {'q': query}
+        if available_only(self.request):
+            params['available'] = '1'
+        context['query'] = query
+        context['available_only'] = 'available' in params
+        context['pagination_query'] = urlencode(params)
+        return context
+
+
+def book_copies(book):
+    return book.bookinstance_set.select_related('language').order_by('due_back', 'id')
+
+
+def copy_groups(copies):
+    """Number of copies per (language, imprint, status)."""
+    return (
+        copies.order_by('language__name', 'imprint', 'status')
+        .values('language__name', 'imprint', 'status')
+        .annotate(total=Count('id'))
+    )
+
+
+def display_copy_group(group):
+    status_names = dict(BookInstance.LOAN_STATUS)
+    return {**group, 'status_display': status_names.get(group['status'], group['status'])}
+
+
+def lazy_copy_groups(copies):
+    # Only evaluated when the cached fragment showing it is rendered
+    return SimpleLazyObject(lambda: [display_copy_group(group) for group in copy_groups(copies)])
+
 
+def hold_context(book, user):
+    """The user's hold on the book, or whether they can place one."""
+    if not user.is_authenticated:
+        return {}
 
+    hold = Hold.objects.filter(book=book, patron=user).first()
+    if hold is None:
+        return {'can_place_hold': not book.bookinstance_set.filter(status='a').exists()}
+    if hold.status == 'w':
+        return {'user_hold': hold, 'hold_position': circulation.queue_position(hold)}
+    return {'user_hold': hold}
+
+
+def book_fragment_objects(book):
+    return ('book', book.pk), ('author', book.author_id), ('genres',), ('languages',)
+
+
+@method_decorator(replicas.read_from_replica, name='dispatch')
+@method_decorator(conditional.conditional_page(book_detail_validators), name='dispatch')
 class BookDetailView(generic.DetailView):
     model = Book
+    copies_paginate_by = 20
+
+    def get_queryset(self):
+        return Book.objects.select_related('author')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        copies = book_copies(self.object)
+
+        paginator = Paginator(copies, self.copies_paginate_by)
+        page = paginator.get_page(self.request.GET.get('page'))
+
+        user = self.request.user
+        context.update({
+            'copies': page.object_list,
+            'copy_groups': lazy_copy_groups(copies),
+            'has_copies': paginator.count > 0,
+            'user_can_borrow': user.is_authenticated and user.can_borrow_book,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            **fragments.fragment_context(*book_fragment_objects(self.object)),
+            **hold_context(self.object, user),
+        })
+        return context
+
 
+def with_book_counts(authors):
+    # A subquery per author on the page, instead of grouping every author
+    books = Book.objects.filter(author=OuterRef('pk'))
+    return authors.annotate(num_books=Coalesce(conditional.count(books, 'author'), 0))
 
-class AuthorListView(generic.ListView):
+
+def author_books(author):
+    return author.book_set.order_by('title', 'id')
+
+
+def author_books_page(author, number):
+    paginator = Paginator(author_books(author), AuthorDetailView.books_paginate_by)
+    paginator.count = author.num_books
+    return paginator.get_page(number)
+
+
+@method_decorator(replicas.read_from_replica, name='dispatch')
+@method_decorator(conditional.conditional_page(author_list_validators), name='dispatch')
+class AuthorListView(CursorPaginationMixin, generic.ListView):
     model = Author
     paginate_by = 10
+    paginator_class = EstimatedCountPaginator
+    ordering = ['last_name', 'first_name', 'id']
 
+    def get_queryset(self):
+        return with_book_counts(super().get_queryset())
 
+
+@method_decorator(replicas.read_from_replica, name='dispatch')
+@method_decorator(conditional.conditional_page(author_detail_validators), name='dispatch')
 class AuthorDetailView(generic.DetailView):
     model = Author
+    books_paginate_by = 20
 
-
-class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
+    def get_queryset(self):
+        return with_book_counts(Author.objects.all())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The books are only queried when the cached fragment showing them is rendered
+        page = author_books_page(self.object, self.request.GET.get('page'))
+        context.update({
+            'books': page.object_list,
+            'page_obj': page,
+            'paginator': page.paginator,
+            'is_paginated': page.has_other_pages(),
+            **fragments.fragment_context(('author', self.object.pk)),
+        })
+        return context
+
+
+class LoanedBooksByUserListView(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     """Generic class-based view listing books on loan to current user."""
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 10
+    paginator_class = EstimatedCountPaginator
+    ordering = ['due_back', 'id']
 
     def get_queryset(self):
         return (
             BookInstance.objects.filter(borrower=self.request.user)
             .filter(status__exact='o')
-            .order_by('due_back')
+            .select_related('book')
+            .order_by(*self.get_ordering())
         )
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['holds'] = Hold.objects.filter(patron=self.request.user).select_related('book')
+        return context
 
-class AllBorrowedBooksView(PermissionRequiredMixin, generic.ListView):
+
+class AllBorrowedBooksView(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
     permission_required = 'catalog.can_mark_returned'
     model = BookInstance
     template_name = 'catalog/bookinstance_all_borrowed_librarian.html'
     paginate_by = 10
+    paginator_class = EstimatedCountPaginator
+    ordering = ['due_back', 'id']
 
     def get_queryset(self):
         return (
             BookInstance.objects.exclude(borrower__isnull=True)
             .filter(status__exact='o')
-            .order_by('due_back')
+            .select_related('book', 'borrower')
+            .order_by(*self.get_ordering())
         )
 
 
@@ -172,15 +574,30 @@ class AuthorDelete(PermissionRequiredMixin, DeleteView):
     model = Author
     success_url = reverse_lazy('authors')
     permission_required = 'catalog.delete_author'
+    # Books listed when the author cannot be deleted
+    books_shown = 20
+
+    def get_queryset(self):
+        return Author.objects.annotate(has_books=Exists(Book.objects.filter(author=OuterRef('pk'))))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.object.has_books:
+            context['books'] = list(author_books(self.object)[:self.books_shown + 1])
+            context['books_shown'] = self.books_shown
+        return context
 
     def form_valid(self, form):
-        try:
-            self.object.delete()
-            return HttpResponseRedirect(self.success_url)
-        except Exception as e:
-            return HttpResponseRedirect(
-                reverse('author-delete', kwargs={'pk': self.object.pk})
-            )
+        # Books are RESTRICTed: only try to delete authors without any
+        if not self.object.has_books:
+            try:
+                self.object.delete()
+                return HttpResponseRedirect(self.success_url)
+            except RestrictedError:
+                pass  # A book was added in the meantime
+        return HttpResponseRedirect(
+            reverse('author-delete', kwargs={'pk': self.object.pk})
+        )
 
 
 class BookCreate(PermissionRequiredMixin, CreateView):
@@ -200,14 +617,20 @@ class BookDelete(PermissionRequiredMixin, DeleteView):
     success_url = reverse_lazy('books')
     permission_required = 'catalog.delete_book'
 
+    def get_queryset(self):
+        return Book.objects.annotate(has_copies=Exists(BookInstance.objects.filter(book=OuterRef('pk'))))
+
     def form_valid(self, form):
-        try:
-            self.object.delete()
-            return HttpResponseRedirect(self.success_url)
-        except Exception as e:
-            return HttpResponseRedirect(
-                reverse('book-delete', kwargs={'pk': self.object.pk})
-            )
+        # Copies are RESTRICTed: only try to delete books without any
+        if not self.object.has_copies:
+            try:
+                self.object.delete()
+                return HttpResponseRedirect(self.success_url)
+            except RestrictedError:
+                pass  # A copy was added in the meantime
+        return HttpResponseRedirect(
+            reverse('book-delete', kwargs={'pk': self.object.pk})
+        )
 
 class BookInstanceCreate(PermissionRequiredMixin, CreateView):
     model = BookInstance